@@ -16,6 +16,7 @@ buildEnv {
     python27Packages.ldap
     python27Packages.recursivePthLoader
     python27Packages.sqlite3
+    python27Packages.trollius
     python27Packages.virtualenv
     python27Packages.zope_interface
   ] ++ lib.attrValues python27.modules;
@@ -27,5 +27,6 @@ setup(name='dicttree.ldap',
       zip_safe=True,
       install_requires=[
         'setuptools',
+        'trollius; python_version < "3.4"',
         ],
       )
@@ -1 +1,12 @@
+from dicttree.ldap._batch import BatchError
 from dicttree.ldap._directory import Directory
+from dicttree.ldap._filter import Filter
+from dicttree.ldap._memory import MemoryConnection
+
+from dicttree.ldap._async import AsyncDirectory
+
+try:
+    from dicttree.ldap._replica import Replica
+except ImportError:
+    # needs ldap.syncrepl (python-ldap 2.4.15+ with pyasn1)
+    pass
@@ -0,0 +1,340 @@
+import ldap
+
+from collections import deque
+from ldap import SCOPE_BASE
+from ldap import SCOPE_SUBTREE
+from ldap.ldapobject import LDAPObject
+
+try:
+    import asyncio
+except ImportError:
+    # python < 3.4, trollius is a dependency there
+    import trollius as asyncio
+
+from dicttree.ldap._dn import DN
+from dicttree.ldap._node import Node
+
+try:
+    StopAsyncIteration = StopAsyncIteration
+except NameError:
+    class StopAsyncIteration(Exception):
+        """End of an asynchronous iteration, python < 3.5
+
+        StopIteration can not be passed through futures.
+        """
+
+
+class AsyncDirectory(object):
+    """asyncio counterpart of Directory
+
+    Operations are sent asynchronously on a single connection and
+    return futures. Results are read without blocking whenever the
+    connection's socket becomes readable and dispatched by msgid, so
+    any number of operations can be in flight at once. keys(), values()
+    and items() return an AsyncSearch, see there for iterating it.
+
+    Only the initial bind blocks.
+    """
+    def __init__(self, uri, base_dn, bind_dn, pw, loop=None):
+        self.base_dn = base_dn
+        self._loop = loop or asyncio.get_event_loop()
+        self._ldap = LDAPObject(uri)
+        self._ldap.bind_s(bind_dn, pw)
+        self._handlers = {}
+        self._fd = self._ldap.fileno()
+        self._loop.add_reader(self._fd, self._dispatch)
+
+    def close(self):
+        self._loop.remove_reader(self._fd)
+        for handler in self._handlers.values():
+            handler(None, None, ldap.SERVER_DOWN({'desc': 'closed'}))
+        self._handlers.clear()
+        self._ldap.unbind_s()
+
+    def _dispatch(self):
+        """read all available results and hand them to their handlers
+
+        Reading the socket for one msgid may queue results of others
+        within libldap, hence the passes until nothing is left.
+        """
+        progress = True
+        while progress:
+            progress = False
+            for msgid in list(self._handlers):
+                while msgid in self._handlers:
+                    try:
+                        (rtype, data) = self._ldap.result(msgid, all=0,
+                                                          timeout=0)
+                        exc = None
+                    except ldap.LDAPError as e:
+                        (rtype, data, exc) = (None, None, e)
+                    else:
+                        if rtype is None:
+                            break
+                    progress = True
+                    if self._handlers[msgid](rtype, data, exc):
+                        del self._handlers[msgid]
+
+    def _future(self):
+        return asyncio.Future(loop=self._loop)
+
+    def _operation(self, msgid, future=None, result=None, error=None):
+        """future for the outcome of an operation
+
+        Entries of searches are collected. ``result`` maps them to the
+        future's result, ``error`` the ldap exception to the one set.
+        """
+        future = future or self._future()
+        entries = []
+        def handle(rtype, data, exc):
+            if future.done():
+                # cancelled
+                return True
+            if exc is not None:
+                future.set_exception(error(exc) if error else exc)
+                return True
+            if rtype == ldap.RES_SEARCH_ENTRY:
+                entries.extend(data)
+                return False
+            future.set_result(result(entries) if result else entries)
+            return True
+        self._handlers[msgid] = handle
+        return future
+
+    def get(self, dn):
+        """future for the node of dn, failing with KeyError
+        """
+        msgid = self._ldap.search(dn, SCOPE_BASE)
+        return self._operation(
+            msgid,
+            result=lambda entries: Node(name=dn, attrs=entries[0][1],
+                                        complete=True),
+            error=_keyerror(dn))
+
+    def contains(self, dn):
+        msgid = self._ldap.search(dn, SCOPE_BASE, attrlist=[''])
+        future = self._future()
+        op = self._operation(msgid)
+        def done(op):
+            if op.cancelled() or future.done():
+                return
+            exc = op.exception()
+            if isinstance(exc, ldap.NO_SUCH_OBJECT):
+                future.set_result(False)
+            elif exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(True)
+        op.add_done_callback(done)
+        return future
+
+    def set(self, dn, node):
+        """future for adding node as dn, replacing an existing entry
+        """
+        addlist = list(node.attrs.iteritems())
+        future = self._future()
+        def added(op):
+            if future.done():
+                return
+            exc = op.exception()
+            if isinstance(exc, ldap.ALREADY_EXISTS):
+                op = self._operation(self._ldap.delete(dn))
+                op.add_done_callback(deleted)
+            elif exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(None)
+        def deleted(op):
+            if future.done():
+                return
+            exc = op.exception()
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                self._operation(self._ldap.add(dn, addlist), future=future,
+                                result=lambda entries: None)
+        self._operation(self._ldap.add(dn, addlist)).add_done_callback(added)
+        return future
+
+    def delete(self, dn):
+        """future for deleting dn, failing with KeyError
+        """
+        return self._operation(self._ldap.delete(dn),
+                               result=lambda entries: None,
+                               error=_keyerror(dn))
+
+    def modify(self, dn, modlist):
+        return self._operation(self._ldap.modify(dn, modlist),
+                               result=lambda entries: None,
+                               error=_keyerror(dn))
+
+    def attrs(self, dn):
+        return AsyncAttributes(self, dn)
+
+    def count(self):
+        """future for the number of entries below base_dn
+        """
+        msgid = self._ldap.search(self.base_dn, SCOPE_SUBTREE,
+                                  attrlist=[''])
+        return self._operation(msgid, result=lambda entries: len(entries) - 1)
+
+    def _iterate(self, attrlist, item):
+        msgid = self._ldap.search(self.base_dn, SCOPE_SUBTREE,
+                                  attrlist=attrlist)
+        search = AsyncSearch(self, msgid, item, skip=DN(self.base_dn))
+        self._handlers[msgid] = search._handle
+        return search
+
+    def keys(self):
+        return self._iterate([''], lambda dn, attrs: dn)
+
+    def values(self):
+        return self._iterate(None, lambda dn, attrs: Node(
+                name=dn, attrs=attrs, complete=True))
+
+    def items(self):
+        return self._iterate(None, lambda dn, attrs: (dn, Node(
+                    name=dn, attrs=attrs, complete=True)))
+
+
+def _keyerror(dn):
+    def error(exc):
+        if isinstance(exc, ldap.NO_SUCH_OBJECT):
+            return KeyError(dn)
+        return exc
+    return error
+
+
+class AsyncSearch(object):
+    """asynchronous iterator on the entries of a running search
+
+    next() returns a future for the next item, failing with
+    StopAsyncIteration at the end, fetch() one for the list of all
+    remaining items. With python 3.5+ it can be used with ``async for``.
+    """
+    def __init__(self, directory, msgid, item, skip=None):
+        self._directory = directory
+        self._msgid = msgid
+        self._item = item
+        self._skip = skip
+        self._buffer = deque()
+        self._done = False
+        self._error = None
+        self._waiter = None
+
+    def _handle(self, rtype, data, exc):
+        if exc is not None:
+            self._error = exc
+            self._done = True
+        elif rtype == ldap.RES_SEARCH_ENTRY:
+            for dn, attrs in data:
+                if self._skip != dn:
+                    self._buffer.append(self._item(dn, attrs))
+        else:
+            self._done = True
+        self._wakeup()
+        return self._done
+
+    def _wakeup(self):
+        if not (self._buffer or self._done):
+            return
+        waiter, self._waiter = self._waiter, None
+        if waiter is None or waiter.done():
+            return
+        if self._buffer:
+            waiter.set_result(self._buffer.popleft())
+        elif self._error is not None:
+            waiter.set_exception(self._error)
+        else:
+            waiter.set_exception(StopAsyncIteration())
+
+    def __aiter__(self):
+        return self
+
+    def next(self):
+        future = self._waiter = self._directory._future()
+        self._wakeup()
+        return future
+
+    __anext__ = next
+
+    def fetch(self):
+        """future for the list of the remaining items
+        """
+        future = self._directory._future()
+        items = []
+        def done(waiter):
+            if future.done():
+                return
+            exc = waiter.exception()
+            if isinstance(exc, StopAsyncIteration):
+                future.set_result(items)
+            elif exc is not None:
+                future.set_exception(exc)
+            else:
+                items.append(waiter.result())
+                self.next().add_done_callback(done)
+        self.next().add_done_callback(done)
+        return future
+
+    def close(self):
+        """stop the search early
+        """
+        if not self._done:
+            self._done = True
+            self._directory._handlers.pop(self._msgid, None)
+            self._directory._ldap.abandon(self._msgid)
+
+
+class AsyncAttributes(object):
+    """awaitable access to the attributes of an entry
+    """
+    def __init__(self, directory, dn):
+        self._directory = directory
+        self.dn = dn
+
+    def _entry(self, attrlist=None):
+        d = self._directory
+        msgid = d._ldap.search(self.dn, SCOPE_BASE, attrlist=attrlist)
+        return d._operation(msgid, result=lambda entries: entries[0][1],
+                            error=_keyerror(self.dn))
+
+    def items(self):
+        """future for the attributes as dict
+        """
+        return self._entry()
+
+    def get(self, name):
+        """future for the values of name, failing with KeyError
+        """
+        future = self._directory._future()
+        def done(op):
+            if future.done():
+                return
+            if op.exception() is not None:
+                future.set_exception(op.exception())
+                return
+            for key, value in op.result().items():
+                if key.lower() == name.lower():
+                    future.set_result(value)
+                    return
+            future.set_exception(KeyError(name))
+        self._entry([name]).add_done_callback(done)
+        return future
+
+    def set(self, name, value):
+        return self._directory.modify(self.dn,
+                                      [(ldap.MOD_REPLACE, name, value)])
+
+    def delete(self, name):
+        return self._directory.modify(self.dn,
+                                      [(ldap.MOD_DELETE, name, None)])
+
+    def update(self, other):
+        try:
+            items = other.items()
+        except AttributeError:
+            items = other
+        return self._directory.modify(
+            self.dn, [(ldap.MOD_REPLACE, name, value)
+                      for name, value in items])
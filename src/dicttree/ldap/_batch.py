@@ -0,0 +1,149 @@
+import ldap
+
+from collections import deque
+from collections import OrderedDict
+from ldap import SCOPE_BASE
+
+from dicttree.ldap._dn import below as _below
+from dicttree.ldap._dn import rdns as _rdns
+from dicttree.ldap._modlist import CLASS_ERRORS
+from dicttree.ldap._modlist import STRUCTURAL
+from dicttree.ldap._modlist import diff
+from dicttree.ldap._modlist import reclassifies
+
+
+class BatchError(Exception):
+    """Operations of a batch failed, errors maps dn to ldap exception
+    """
+    def __init__(self, errors):
+        Exception.__init__(self, '%d operation(s) failed: %s' % (
+                len(errors), ', '.join(sorted(errors))))
+        self.errors = errors
+
+
+class Batch(object):
+    """Pipelined writes on one connection
+
+    Adds, deletes and modifies are sent asynchronously, with at most
+    ``window`` of them in flight. An operation is held back while an
+    operation it depends on is in flight: entries are added after their
+    parent, deleted after their children and operations on the same dn
+    keep their order. Errors are collected per dn in ``errors``, dns of
+    adds skipped as existing are counted in ``skipped``.
+    """
+    def __init__(self, ldap, window=64):
+        self._ldap = ldap
+        self.window = window
+        self.errors = {}
+        self.skipped = 0
+        self._queue = deque()
+        self._inflight = OrderedDict()
+
+    def add(self, dn, addlist, replace=False, exists=None):
+        """add an entry, with replace an existing one is replaced
+
+        ``exists`` is the policy for an existing entry otherwise:
+        'skip' leaves it alone, 'replace' deletes and adds it again,
+        'modify' modifies it to the attributes of addlist - or replaces
+        it, if its structural object class changes.
+        """
+        if replace:
+            exists = 'replace'
+        self._queue.append(('add', dn, _rdns(dn), (addlist,), exists))
+        self._pump()
+
+    def delete(self, dn, serverctrls=None):
+        self._queue.append(('delete', dn, _rdns(dn), (serverctrls,), None))
+        self._pump()
+
+    def modify(self, dn, modlist):
+        self._queue.append(('modify', dn, _rdns(dn), (modlist,), None))
+        self._pump()
+
+    def flush(self):
+        """wait for all operations to finish
+        """
+        while self._queue or self._inflight:
+            self._pump()
+            if self._inflight:
+                self._wait()
+
+    def check(self):
+        if self.errors:
+            raise BatchError(self.errors)
+
+    def _blocked(self, op):
+        kind, dn, rdns = op[:3]
+        for other in self._inflight.itervalues():
+            if other[2] == rdns:
+                return True
+            if kind == 'add' and _below(rdns, other[2]):
+                return True
+            if kind == 'delete' and _below(other[2], rdns):
+                return True
+        return False
+
+    def _pump(self):
+        while self._queue:
+            op = self._queue[0]
+            if len(self._inflight) >= self.window or self._blocked(op):
+                self._wait()
+                continue
+            self._queue.popleft()
+            kind, dn, rdns, args, exists = op
+            if kind == 'delete':
+                msgid = self._ldap.delete_ext(dn, *args)
+            elif kind == 'reclassify':
+                msgid = self._ldap.modify(dn, args[0])
+            else:
+                msgid = getattr(self._ldap, kind)(dn, *args)
+            self._inflight[msgid] = op
+
+    def _wait(self):
+        """collect the result of the oldest operation in flight
+        """
+        msgid, op = self._inflight.popitem(last=False)
+        kind, dn, rdns, args, exists = op
+        try:
+            self._ldap.result(msgid, all=1)
+        except ldap.ALREADY_EXISTS, e:
+            if exists == 'skip':
+                self.skipped += 1
+            elif exists == 'replace':
+                self._replace(dn, rdns, args[0])
+            elif exists == 'modify':
+                self._modify_existing(dn, rdns, args[0])
+            else:
+                self.errors[dn] = e
+        except CLASS_ERRORS, e:
+            if kind != 'reclassify':
+                self.errors[dn] = e
+                return
+            self._replace(dn, rdns, args[1])
+        except ldap.LDAPError, e:
+            self.errors[dn] = e
+
+    def _modify_existing(self, dn, rdns, addlist):
+        """queue a modify of dn to the attributes of addlist
+        """
+        try:
+            old = self._ldap.search_s(dn, SCOPE_BASE,
+                                      attrlist=['*', STRUCTURAL])[0][1]
+        except ldap.LDAPError, e:
+            self.errors[dn] = e
+            return
+        modlist = diff(old, dict(addlist))
+        if modlist is None:
+            self._replace(dn, rdns, addlist)
+        elif reclassifies(modlist):
+            # replaced if the server refuses the modify
+            self._queue.appendleft(('reclassify', dn, rdns,
+                                    (modlist, addlist), None))
+        elif modlist:
+            self._queue.appendleft(('modify', dn, rdns, (modlist,), None))
+
+    def _replace(self, dn, rdns, addlist):
+        """delete and add dn again, in front of everything queued
+        """
+        self._queue.appendleft(('add', dn, rdns, (addlist,), None))
+        self._queue.appendleft(('delete', dn, rdns, (None,), None))
@@ -0,0 +1,193 @@
+import ldap
+import threading
+import time
+
+from collections import OrderedDict
+
+from dicttree.ldap._dn import DN
+from dicttree.ldap._dn import below
+from dicttree.ldap._dn import rdns
+
+
+def _copy(results):
+    """results of a search, with attributes safe to be modified
+    """
+    return [(dn, dict((name, list(values))
+                      for name, values in attrs.iteritems()))
+            for dn, attrs in results]
+
+
+def _size(results):
+    """rough number of bytes held by search results
+    """
+    size = 64
+    for dn, attrs in results:
+        size += 64 + len(dn)
+        for name, values in attrs.iteritems():
+            size += 64 + len(name) + sum(32 + len(x) for x in values)
+    return size
+
+
+class SearchCache(object):
+    """LRU cache of search results, keyed by (base, scope, filter,
+    attrlist, ...)
+
+    At most ``size`` results of together at most ``max_bytes`` (roughly
+    estimated) are kept, each for ``ttl`` seconds (forever for None).
+    Failures, e.g. NO_SUCH_OBJECT, are cached as well. Results are
+    indexed by the rdns of their base for invalidate(dn).
+    """
+    def __init__(self, size=1000, ttl=60, max_bytes=64 * 1024 * 1024):
+        self.size = size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._bases = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions,
+                    invalidations=self.invalidations,
+                    entries=len(self._entries), bytes=self._bytes)
+
+    def get(self, key):
+        """(True, results or exception) for a hit, (False, None) otherwise
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or \
+                    entry[0] is not None and entry[0] < time.time():
+                if entry is not None:
+                    self._forget(key, entry)
+                self.misses += 1
+                return (False, None)
+            self._entries[key] = entry
+            self.hits += 1
+        value = entry[1]
+        if isinstance(value, Exception):
+            return (True, value)
+        return (True, _copy(value))
+
+    def put(self, key, value):
+        if isinstance(value, Exception):
+            size = 64
+        else:
+            value = _copy(value)
+            size = _size(value)
+        if size > self.max_bytes:
+            return
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._forget(key, old)
+            self._entries[key] = (expires, value, size)
+            self._bytes += size
+            self._bases.setdefault(rdns(key[0]), set()).add(key)
+            while len(self._entries) > self.size or \
+                    self._bytes > self.max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self._forget(old_key, old)
+                self.evictions += 1
+
+    def _forget(self, key, entry):
+        """bookkeeping for a removed entry, lock held
+        """
+        self._bytes -= entry[2]
+        base = rdns(key[0])
+        keys = self._bases.get(base)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._bases[base]
+
+    def invalidate(self, dn, subtree=False):
+        """drop results of searches that could see a change of dn
+
+        i.e. those based at dn or an ancestor of it, with subtree also
+        those based below dn.
+        """
+        dn_rdns = rdns(dn)
+        with self._lock:
+            bases = [dn_rdns[i:] for i in range(len(dn_rdns) + 1)]
+            if subtree:
+                bases.extend(base for base in self._bases
+                             if below(base, dn_rdns))
+            for base in bases:
+                for key in list(self._bases.get(base, ())):
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self._forget(key, entry)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bases.clear()
+            self._bytes = 0
+
+
+class CachedConnection(object):
+    """Connection (or pool) searching through a SearchCache
+
+    Synchronous searches are answered from the cache, synchronous
+    writes invalidate the results they could affect. Everything else is
+    passed on.
+    """
+    def __init__(self, ldap, cache):
+        self._ldap = ldap
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._ldap, name)
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        key = (DN(base), scope, filterstr,
+               attrlist and tuple(attrlist), attrsonly, 'search_s')
+        hit, value = self.cache.get(key)
+        if hit:
+            if isinstance(value, Exception):
+                raise value
+            return value
+        try:
+            results = self._ldap.search_s(base, scope, filterstr=filterstr,
+                                          attrlist=attrlist,
+                                          attrsonly=attrsonly)
+        except (ldap.NO_SUCH_OBJECT, ldap.INVALID_DN_SYNTAX), e:
+            self.cache.put(key, e)
+            raise
+        self.cache.put(key, results)
+        return _copy(results)
+
+    def add_s(self, dn, *args, **kw):
+        try:
+            return self._ldap.add_s(dn, *args, **kw)
+        finally:
+            self.cache.invalidate(dn)
+
+    def modify_s(self, dn, *args, **kw):
+        try:
+            return self._ldap.modify_s(dn, *args, **kw)
+        finally:
+            self.cache.invalidate(dn)
+
+    def delete_s(self, dn, *args, **kw):
+        try:
+            return self._ldap.delete_s(dn, *args, **kw)
+        finally:
+            self.cache.invalidate(dn)
+
+    def delete_ext_s(self, dn, *args, **kw):
+        try:
+            return self._ldap.delete_ext_s(dn, *args, **kw)
+        finally:
+            self.cache.invalidate(dn, subtree=True)
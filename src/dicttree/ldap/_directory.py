@@ -3,26 +3,131 @@ import ldap
 from ldap import SCOPE_BASE
 from ldap import SCOPE_ONELEVEL
 from ldap import SCOPE_SUBTREE
+from ldap.controls import LDAPControl
+from ldap.controls import SimplePagedResultsControl
 from ldap.ldapobject import LDAPObject
 
+from dicttree.ldap._batch import Batch
+from dicttree.ldap._cache import CachedConnection
+from dicttree.ldap._cache import SearchCache
+from dicttree.ldap._cache import _copy
+from dicttree.ldap._cache import _size
+from dicttree.ldap._dn import DN
+from dicttree.ldap._dn import key
+from dicttree.ldap._dn import rdns
+from dicttree.ldap._filter import Filter
+from dicttree.ldap._filter import Query
+from dicttree.ldap._ldif import export_ldif
+from dicttree.ldap._ldif import import_ldif
+from dicttree.ldap._modlist import CLASS_ERRORS
+from dicttree.ldap._modlist import STRUCTURAL
+from dicttree.ldap._modlist import diff
+from dicttree.ldap._modlist import reclassifies
 from dicttree.ldap._node import Node
+from dicttree.ldap._parallel import scan
+from dicttree.ldap._pool import ConnectionPool
+from dicttree.ldap._stats import InstrumentedConnection
+from dicttree.ldap._stats import Stats
 from dicttree.ldap._views import KeysView
 from dicttree.ldap._views import ItemsView
 from dicttree.ldap._views import ValuesView
 
+from contextlib import contextmanager
+
 import copy
+import threading
+
+TREE_DELETE_OID = '1.2.840.113556.1.4.805'
+
+# operational attributes hinting at children, asked for by children()
+HINTS = ('hassubordinates', 'numsubordinates')
 
 class Directory(object):
     """XXX: this could be without base_dn, not supporting iteration
+
+    With ``page_size`` set, subtree searches are run with the paged
+    results control (RFC 2696), fetching ``page_size`` entries per page.
+
+    ``count_attr`` names an operational attribute of the base entry
+    that holds the number of entries below it, for servers providing
+    one, e.g. numAllSubordinates; its value is taken as it is, so it
+    should count the whole subtree. Without it, or if the server does
+    not return it, len() runs a search that does not fetch any
+    attributes and counts the results: that is O(n), every dn below
+    base_dn is transferred.
+
+    With ``pool``, a dict of ConnectionPool options (minsize, maxsize,
+    timeout, check_interval), the directory uses a pool of connections
+    instead of a single one and can be shared between threads. Each
+    operation borrows a connection for its duration, iterations keep
+    theirs until they are exhausted or dropped.
+
+    With ``cache``, a dict of SearchCache options (size, ttl,
+    max_bytes), results of searches are cached, failures like
+    NO_SUCH_OBJECT included. Writes via the directory and its nodes
+    drop the results they could affect, invalidate() drops all of
+    them. The SearchCache is available as ``cache``, for its stats().
+
+    ``generation`` counts the writes done via the directory, snapshot
+    views are read again when it changed.
+
+    ``stats`` counts the ldap operations sent by the directory, its
+    nodes and views, see Stats and trace().
+
+    ``backend`` is the class of the connections, called with the uri,
+    by default LDAPObject; MemoryConnection keeps the tree in memory.
     """
-    def __init__(self, uri, base_dn, bind_dn, pw):
+    # keys are compared and hashed as normalized dns
+    _key = staticmethod(key)
+
+    def __init__(self, uri, base_dn, bind_dn, pw, page_size=None,
+                 count_attr=None, pool=None, cache=None, backend=None):
         self.base_dn = base_dn
-        self._ldap = LDAPObject(uri)
-        self._ldap.bind_s(bind_dn, pw)
+        self.page_size = page_size
+        self.count_attr = count_attr
+        self._local = threading.local()
+        self._tree_delete = None
+        self.generation = 0
+        self._credentials = (uri, bind_dn, pw)
+        self._backend = backend or LDAPObject
+        self.stats = Stats()
+        self._pool = None
+        if pool is not None:
+            self._pool = ConnectionPool(uri, bind_dn, pw, stats=self.stats,
+                                        backend=self._backend, **pool)
+            self._ldap = self._pool
+        else:
+            self._ldap = self._backend(uri)
+            self._ldap.bind_s(bind_dn, pw)
+            self._ldap = InstrumentedConnection(self._ldap, self.stats)
+        self.cache = None
+        if cache is not None:
+            self.cache = SearchCache(**cache)
+            self._ldap = CachedConnection(self._ldap, self.cache)
+
+    @property
+    def _batch(self):
+        return getattr(self._local, 'batch', None)
+
+    @contextmanager
+    def _connection(self):
+        """connection for asynchronous operations within the block
+
+        A batch in progress lends its connection, a pool lends one of
+        its connections for the duration of the block, the same one to
+        the operations of the thread within it.
+        """
+        if self._batch is not None:
+            yield self._batch._ldap
+        elif self._pool is not None:
+            with self._pool.connection() as conn:
+                yield conn
+        else:
+            yield self._ldap
 
     def __contains__(self, dn):
         try:
-            return dn == self._ldap.search_s(dn, SCOPE_BASE,
+            return DN(dn) == self._ldap.search_s(dn, SCOPE_BASE,
                                              attrlist=[''])[0][0]
         except ldap.NO_SUCH_OBJECT:
             return False
@@ -32,58 +137,457 @@ class Directory(object):
             entry = self._ldap.search_s(dn, SCOPE_BASE)[0]
         except ldap.NO_SUCH_OBJECT:
             raise KeyError(dn)
-        node = Node(name=dn, attrs=entry[1], ldap=self._ldap)
+        node = Node(name=dn, attrs=entry[1], ldap=self._ldap, complete=True,
+                    directory=self)
         return node
 
+    def _item(self, dn, attrlist=None):
+        """node for dn as handed out by the views
+
+        i.e. without attributes, unless an attrlist is given.
+        """
+        try:
+            entry = self._ldap.search_s(dn, SCOPE_BASE,
+                                        attrlist=attrlist or [''])[0]
+        except ldap.NO_SUCH_OBJECT:
+            raise KeyError(dn)
+        return self._node(entry, attrlist)
+
+    def _node(self, entry, attrlist):
+        """node for an entry returned by a search for attrlist
+
+        Subordinate hints returned without being asked for in attrlist
+        are taken out of the attributes.
+        """
+        dn, attrs = entry
+        requested = set(x.lower() for x in attrlist or ())
+        hints = {}
+        for name in attrs.keys():
+            if name.lower() in HINTS and name.lower() not in requested:
+                hints[name.lower()] = attrs.pop(name)[0]
+        has_children = hints.get('hassubordinates')
+        if has_children is not None:
+            has_children = has_children.upper() == 'TRUE'
+        num_children = hints.get('numsubordinates')
+        if num_children is not None:
+            num_children = int(num_children)
+        return Node(name=DN(dn), attrs=attrs, ldap=self._ldap,
+                    complete=attrlist or False, directory=self,
+                    has_children=has_children, num_children=num_children)
+
+    def close(self):
+        """unbind the connection, or the idle ones of the pool
+        """
+        if self._pool is not None:
+            self._pool.close()
+        else:
+            self._ldap.unbind_s()
+
+    def invalidate(self, dn=None, subtree=False):
+        """outdate snapshot views and cached results, e.g. after writes
+        by others
+
+        With dn only the cached results that could see a change of dn
+        are dropped, with subtree also changes below it.
+        """
+        self.generation += 1
+        if self.cache is None:
+            return
+        if dn is None:
+            self.cache.clear()
+        else:
+            self.cache.invalidate(dn, subtree=subtree)
+
     def __setitem__(self, dn, node):
-        addlist = node.attrs.items()
+        """add node as dn, or modify the existing entry to it
+
+        The entry is added; if it exists, the existing entry is read
+        (from the cache, if any) and only the attributes that differ are
+        modified, nothing is written if none do. An entry whose
+        structural object class changes is deleted and added again,
+        entries with children raise NOT_ALLOWED_ON_NONLEAF instead.
+        """
+        addlist = list(node.attrs.iteritems())
+        if self._batch is not None:
+            self.invalidate(dn)
+            self._batch.add(dn, addlist, exists='modify')
+            return
         try:
             self._ldap.add_s(dn, addlist)
         except ldap.ALREADY_EXISTS:
-            del self[dn]
+            pass
+        else:
+            self.invalidate(dn)
+            return
+        try:
+            old = self._ldap.search_s(dn, SCOPE_BASE,
+                                      attrlist=['*', STRUCTURAL])[0][1]
+        except ldap.NO_SUCH_OBJECT:
+            # deleted meanwhile
+            self.invalidate(dn)
             self._ldap.add_s(dn, addlist)
+            return
+        modlist = diff(old, dict(addlist))
+        if modlist == []:
+            return
+        self.invalidate(dn)
+        if modlist is not None:
+            try:
+                self._ldap.modify_s(dn, modlist)
+                return
+            except CLASS_ERRORS:
+                if not reclassifies(modlist):
+                    raise
+        # not del self[dn], that would delete the entries below as well
+        self._ldap.delete_s(dn)
+        self._ldap.add_s(dn, addlist)
 
     def __delitem__(self, dn):
+        """delete dn and the entries below it
+        """
+        self.invalidate(dn, subtree=True)
+        if self._batch is not None:
+            try:
+                self._delete_tree(dn)
+            except ldap.NO_SUCH_OBJECT, e:
+                # failures of a batch are collected, see Batch
+                self._batch.errors[dn] = e
+            return
         try:
             self._ldap.delete_s(dn)
         except ldap.NO_SUCH_OBJECT:
             raise KeyError(dn)
+        except ldap.NOT_ALLOWED_ON_NONLEAF:
+            self._delete_tree(dn)
+
+    def _supports_tree_delete(self):
+        """whether the server announces the tree delete control
+        """
+        if self._tree_delete is None:
+            try:
+                entries = self._ldap.search_s('', SCOPE_BASE,
+                                              attrlist=['supportedControl'])
+            except ldap.LDAPError:
+                entries = ()
+            controls = ()
+            for entry in entries:
+                controls = entry[1].get('supportedControl', ())
+            self._tree_delete = TREE_DELETE_OID in controls
+        return self._tree_delete
+
+    def _delete_tree(self, dn, keep_base=False, window=64):
+        """delete dn and all entries below it
+
+        With keep_base, only the entries below dn are deleted. The tree
+        delete control is used if the server supports it, otherwise the
+        subtree is deleted leaves first, pipelined: a delete is only
+        held back while deletes below it are in flight. Within a batch
+        the deletes are queued there, otherwise BatchError is raised if
+        any of them fail.
+        """
+        self.invalidate(dn, subtree=True)
+        if self._batch is None:
+            with self._connection() as conn:
+                batch = Batch(conn, window=window)
+                self._queue_tree_delete(batch, dn, keep_base)
+                batch.flush()
+            batch.check()
+        else:
+            self._queue_tree_delete(self._batch, dn, keep_base)
+
+    def _queue_tree_delete(self, batch, dn, keep_base):
+        if not self._supports_tree_delete():
+            # the subtree is searched, entries queued to be added to it
+            # have to exist by then
+            batch.flush()
+        if self._supports_tree_delete():
+            control = LDAPControl(TREE_DELETE_OID, True)
+            if keep_base:
+                dns = [x[0][0] for x in self._search(dn, SCOPE_ONELEVEL,
+                                                     attrlist=[''])]
+            else:
+                dns = [dn]
+            for x in dns:
+                batch.delete(x, serverctrls=[control])
+        else:
+            levels = {}
+            for x in self._search(dn, SCOPE_SUBTREE, attrlist=['']):
+                levels.setdefault(len(rdns(x[0][0])), []).append(x[0][0])
+            base_level = len(rdns(dn))
+            for level in sorted(levels, reverse=True):
+                if keep_base and level == base_level:
+                    continue
+                for x in levels[level]:
+                    batch.delete(x)
 
     def __iter__(self):
-        return (x[0][0] for x in
-                self._search(self.base_dn, SCOPE_SUBTREE)
-                if x[0][0] != self.base_dn)
+        base = DN(self.base_dn)
+        return (dn for dn in (DN(x[0][0]) for x in
+                              self._search(self.base_dn, SCOPE_SUBTREE,
+                                           attrlist=['']))
+                if dn != base)
 
     def _search(self, base, scope, filterstr='(objectClass=*)', attrlist=None,
-                timeout=-1):
+                timeout=-1, sizelimit=0):
         """asynchronous ldap search returning a generator
+
+        With ``sizelimit`` the search ends quietly after that many
+        entries, it is never paged. The connection is kept until the
+        generator is exhausted or closed.
+
+        With a cache, the results of searches read completely are
+        cached, outside of batches, unless they exceed its max_bytes.
         """
-        msgid = self._ldap.search(base, scope,
-                                  filterstr=filterstr, attrlist=attrlist)
-        rtype = ldap.RES_SEARCH_ENTRY
-        while rtype is ldap.RES_SEARCH_ENTRY:
-            # Fetch results single file, the final result (usually)
-            # has an empty field. <sigh>
-            (rtype, data) = self._ldap.result(msgid=msgid, all=0,
-                                              timeout=timeout)
-            if rtype is ldap.RES_SEARCH_ENTRY or data:
+        if self.cache is None or self._batch is not None:
+            return self._search_server(base, scope, filterstr, attrlist,
+                                       timeout=timeout, sizelimit=sizelimit)
+        return self._search_cached(base, scope, filterstr, attrlist,
+                                   timeout=timeout, sizelimit=sizelimit)
+
+    def _search_cached(self, base, scope, filterstr, attrlist, timeout=-1,
+                       sizelimit=0):
+        key = (DN(base), scope, filterstr, attrlist and tuple(attrlist),
+               sizelimit, '_search')
+        hit, value = self.cache.get(key)
+        if hit:
+            if isinstance(value, Exception):
+                raise value
+            for entry in value:
+                yield [entry]
+            return
+        # results larger than the whole cache are not kept
+        entries = []
+        size = 0
+        try:
+            for data in self._search_server(base, scope, filterstr,
+                                            attrlist, timeout=timeout,
+                                            sizelimit=sizelimit):
+                if entries is not None:
+                    size += _size(data)
+                    if size > self.cache.max_bytes:
+                        entries = None
+                    else:
+                        # copied before consumers modify them
+                        entries.extend(_copy(data))
                 yield data
+        except ldap.NO_SUCH_OBJECT, e:
+            self.cache.put(key, e)
+            raise
+        if entries is not None:
+            self.cache.put(key, entries)
 
-    def items(self):
-        return ItemsView(dictionary=self)
+    def _search_server(self, base, scope, filterstr='(objectClass=*)',
+                       attrlist=None, timeout=-1, sizelimit=0):
+        with self._connection() as conn:
+            if self.page_size and not sizelimit:
+                results = self._paged_search(conn, base, scope,
+                                             filterstr=filterstr,
+                                             attrlist=attrlist,
+                                             timeout=timeout)
+            else:
+                msgid = conn.search_ext(base, scope, filterstr=filterstr,
+                                        attrlist=attrlist,
+                                        sizelimit=sizelimit)
+                results = self._results(conn, msgid, timeout=timeout)
+            try:
+                for data in results:
+                    yield data
+            finally:
+                results.close()
 
-    def keys(self):
-        return KeysView(dictionary=self)
+    def _results(self, conn, msgid, timeout=-1):
+        """generator on the results of a running search
+        """
+        rtype = ldap.RES_SEARCH_ENTRY
+        try:
+            while rtype is ldap.RES_SEARCH_ENTRY:
+                # Fetch results single file, the final result (usually)
+                # has an empty field. <sigh>
+                try:
+                    (rtype, data) = conn.result(msgid=msgid, all=0,
+                                                timeout=timeout)
+                except ldap.SIZELIMIT_EXCEEDED:
+                    rtype = ldap.RES_SEARCH_RESULT
+                    break
+                if rtype is ldap.RES_SEARCH_ENTRY or data:
+                    yield data
+        finally:
+            if rtype is ldap.RES_SEARCH_ENTRY:
+                # iteration stopped early, free the server side
+                conn.abandon(msgid)
 
-    def values(self):
-        return ValuesView(dictionary=self)
+    def _paged_search(self, conn, base, scope, filterstr='(objectClass=*)',
+                      attrlist=None, timeout=-1):
+        """paged asynchronous ldap search returning a generator
+
+        A page is read completely and the next one requested before
+        the entries of the current page are handed out, i.e. the
+        server works on the next page while the current one is
+        consumed. Memory is bounded by the page size: should the
+        server ignore the (non-critical) control, the entries are
+        streamed as they arrive.
+        """
+        control = SimplePagedResultsControl(False, size=self.page_size,
+                                            cookie='')
+        msgid = conn.search_ext(base, scope, filterstr=filterstr,
+                                attrlist=attrlist, serverctrls=[control])
+        try:
+            while msgid is not None:
+                page = []
+                rtype = ldap.RES_SEARCH_ENTRY
+                while rtype is ldap.RES_SEARCH_ENTRY:
+                    (rtype, data, _, ctrls) = conn.result3(
+                        msgid=msgid, all=0, timeout=timeout)
+                    if rtype is ldap.RES_SEARCH_ENTRY or data:
+                        page.append(data)
+                    if len(page) > self.page_size:
+                        # server is not paging, stream instead
+                        for data in page:
+                            yield data
+                        page = []
+                msgid = None
+                cookie = self._cookie(ctrls)
+                if cookie:
+                    control.cookie = cookie
+                    msgid = conn.search_ext(base, scope,
+                                            filterstr=filterstr,
+                                            attrlist=attrlist,
+                                            serverctrls=[control])
+                for data in page:
+                    yield data
+        finally:
+            if msgid is not None:
+                conn.abandon(msgid)
+
+    def _first(self, base=None):
+        """dn of one entry below base (base_dn) or None, if it has none
+
+        Any child will do, so a one-level search limited to a single
+        entry suffices.
+        """
+        for data in self._search(base or self.base_dn, SCOPE_ONELEVEL,
+                                 attrlist=[''], sizelimit=1):
+            return data[0][0]
+        return None
+
+    def _leaf(self):
+        """dn of one entry below base_dn without children, or None
+        """
+        dn = None
+        child = self._first()
+        while child is not None:
+            dn, child = child, self._first(child)
+        return dn
+
+    def _count(self, base, scope):
+        """number of entries found by a search not returning attributes
+        """
+        return sum(len(data) for data in
+                   self._search(base, scope, attrlist=['']))
+
+    def _count_attr(self, dn):
+        try:
+            attrs = self._ldap.search_s(dn, SCOPE_BASE,
+                                        attrlist=[self.count_attr])[0][1]
+        except ldap.NO_SUCH_OBJECT:
+            return None
+        for name, value in attrs.items():
+            if name.lower() == self.count_attr.lower():
+                return int(value[0])
+        return None
+
+    def _cookie(self, ctrls):
+        for ctrl in ctrls or ():
+            if ctrl.controlType == SimplePagedResultsControl.controlType:
+                return ctrl.cookie
+        return None
+
+    def trace(self):
+        """list the ldap operations done within the block
+
+        ``with directory.trace() as trace:`` - trace is a list of
+        Operation, operations of other threads are not included.
+        """
+        return self.stats.trace()
+
+    @contextmanager
+    def batch(self, window=64):
+        """pipeline the writes of the block
+
+        Within the block, setting and deleting items (also via update
+        and clear) does not wait for the server, up to ``window``
+        operations are in flight. Further modifications can be sent via
+        the yielded batch's modify(dn, modlist). Errors do not surface
+        per operation: leaving the block waits for all results and
+        raises BatchError, which maps each failed dn to its error.
+        Reads within the block may not see the pending writes yet.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        with self._connection() as conn:
+            batch = self._local.batch = Batch(conn, window=window)
+            try:
+                yield batch
+            finally:
+                self._local.batch = None
+                batch.flush()
+                self.invalidate()
+        batch.check()
+
+    def filter(self, *filters, **lookups):
+        """the entries matching a filter, as read-only dictionary
+
+        Arguments are those of Filter, the search filter is evaluated
+        by the server.
+        """
+        return Query(self, Filter(*filters, **lookups))
+
+    def children(self, dn=None):
+        """the entries directly below dn (default: base_dn), as
+        read-only dictionary
+
+        Searches are one-level, the nodes carry has_children and
+        num_children hints read along with them.
+        """
+        return Query(self, Filter(), base=dn or self.base_dn,
+                     scope=SCOPE_ONELEVEL, hints=True)
+
+    def items(self, attrlist=None, snapshot=False):
+        """items view, see values() for attrlist and snapshot
+        """
+        return ItemsView(dictionary=self, snapshot=snapshot,
+                         attrlist=attrlist)
+
+    def keys(self, snapshot=False):
+        return KeysView(dictionary=self, snapshot=snapshot)
+
+    def values(self, attrlist=None, snapshot=False):
+        """values view
+
+        By default nodes fetch their attributes on first access. The
+        attributes in attrlist, all user attributes for ['*'], are read
+        by the search that iterates the view instead.
+
+        A snapshot view is read once and reused until the directory is
+        written to or invalidated, or the view refreshed.
+        """
+        return ValuesView(dictionary=self, snapshot=snapshot,
+                          attrlist=attrlist)
 
     def __len__(self):
-        return sum(1 for node in iter(self))
+        if self.count_attr:
+            count = self._count_attr(self.base_dn)
+            if count is not None:
+                return count
+        # the base entry is part of the subtree, but not of the directory
+        return self._count(self.base_dn, SCOPE_SUBTREE) - 1
+
+    def __nonzero__(self):
+        return self._first() is not None
 
     def clear(self):
-        for dn in self.keys():
-            del self[dn]
+        self._delete_tree(self.base_dn, keep_base=True)
 
     def copy(self):
         return copy.copy(self)
@@ -105,9 +609,11 @@ class Directory(object):
         return node
 
     def popitem(self):
-        if not self:
-          raise KeyError
-        dn = next(iter(self))
+        """remove and return an entry without children, as (dn, node)
+        """
+        dn = self._leaf()
+        if dn is None:
+            raise KeyError('popitem(): directory is empty')
         node = self[dn]
         del self[dn]
         return (dn, node)
@@ -130,11 +636,50 @@ class Directory(object):
 
     iterkeys = __iter__
 
-    def itervalues(self):
-        return (Node(name=x[0][0], attrs=x[0][1], ldap=self._ldap) for x in
-                self._search(self.base_dn,
-                                  ldap.SCOPE_SUBTREE, attrlist=[''])
-                if x[0][0] != self.base_dn)
+    def itervalues(self, attrlist=None):
+        return (node for node in (self._node(x[0], attrlist) for x in
+                                  self._search(self.base_dn,
+                                               ldap.SCOPE_SUBTREE,
+                                               attrlist=attrlist or ['']))
+                if node.name != self.base_dn)
+
+    def iteritems(self, attrlist=None):
+        return ((node.name, node) for node in self.itervalues(attrlist))
+
+    def export_ldif(self, stream, base=None, attrlist=None, progress=None,
+                    every=1000):
+        """write base (default: base_dn) and its subtree as LDIF
+
+        See dicttree.ldap._ldif.export_ldif.
+        """
+        return export_ldif(self, stream, base=base, attrlist=attrlist,
+                           progress=progress, every=every)
+
+    def import_ldif(self, stream, exists=None, window=64, buffer=10000,
+                    progress=None, every=1000):
+        """add the entries of an LDIF, pipelined
+
+        ``exists`` is None, 'skip', 'replace' or 'modify'. See
+        dicttree.ldap._ldif.import_ldif.
+        """
+        return import_ldif(self, stream, exists=exists, window=window,
+                           buffer=buffer, progress=progress, every=every)
+
+    def scan(self, filterstr='(objectClass=*)', attrlist=None, processes=None,
+             ordered=False, chunksize=1000):
+        """nodes below base_dn, read in parallel by a process pool
 
-    def iteritems(self):
-        return ((node.name, node) for node in ValuesView(self))
+        The tree is split into partitions, each searched on a connection
+        of its own in a worker process and sent back in chunks of
+        ``chunksize`` entries. With ``ordered`` the nodes are yielded in
+        tree order, otherwise as they arrive. See
+        dicttree.ldap._parallel.scan for running a function on the
+        entries within the workers.
+        """
+        return (Node(name=DN(dn), attrs=attrs, ldap=self._ldap,
+                     complete=attrlist or True, directory=self)
+                for dn, attrs in scan(self, filterstr=filterstr,
+                                      attrlist=attrlist,
+                                      processes=processes,
+                                      ordered=ordered,
+                                      chunksize=chunksize))
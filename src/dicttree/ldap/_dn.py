@@ -0,0 +1,118 @@
+import ldap
+import threading
+
+from collections import OrderedDict
+from ldap.dn import escape_dn_chars
+from ldap.dn import str2dn
+
+
+class LRU(object):
+    """Memoize a function of one argument, keeping the ``size`` most
+    recently used results
+    """
+    def __init__(self, func, size=10000):
+        self.func = func
+        self.size = size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, arg):
+        with self._lock:
+            try:
+                result = self._cache.pop(arg)
+            except KeyError:
+                pass
+            else:
+                self._cache[arg] = result
+                return result
+        result = self.func(arg)
+        with self._lock:
+            self._cache[arg] = result
+            if len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def _parse(dn):
+    """normalized dn and its rdns, leaf first
+
+    Attribute types and values are lowercased, whitespace around them
+    is dropped and multi-valued rdns are sorted. Not parseable dns are
+    only lowercased.
+    """
+    try:
+        parsed = str2dn(dn)
+    except ldap.LDAPError:
+        rdns = (dn.strip().lower(),)
+    else:
+        rdns = tuple('+'.join(sorted('%s=%s' % (type_.lower(),
+                                                escape_dn_chars(value.lower()))
+                                     for type_, value, flags in rdn))
+                     for rdn in parsed)
+    return (','.join(rdns), rdns)
+
+_parse = LRU(_parse)
+
+
+def normalize(dn):
+    if type(dn) is DN:
+        return dn.normalized
+    return _parse(dn)[0]
+
+
+def rdns(dn):
+    """normalized rdns of a dn, leaf first, for ancestor checks
+    """
+    if type(dn) is DN:
+        # cache keys are plain strings, the normalized dn parses the same
+        dn = dn.normalized
+    return _parse(dn)[1]
+
+
+def below(rdns, other):
+    """whether other is an ancestor of rdns
+    """
+    return len(rdns) > len(other) and rdns[len(rdns) - len(other):] == other
+
+
+class DN(str):
+    """A distinguished name, equal to and hashed as its normalized form
+
+    ``DN('CN=a, o=o') == 'cn=a,o=o'``. It is the dn as given otherwise.
+    """
+    def __new__(cls, dn):
+        if type(dn) is DN:
+            return dn
+        if isinstance(dn, unicode):
+            dn = dn.encode('utf-8')
+        self = str.__new__(cls, dn)
+        self.normalized = _parse(dn)[0]
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, basestring):
+            return NotImplemented
+        return self.normalized == DN(other).normalized
+
+    def __ne__(self, other):
+        if not isinstance(other, basestring):
+            return NotImplemented
+        return self.normalized != DN(other).normalized
+
+    def __hash__(self):
+        return hash(self.normalized)
+
+    def __repr__(self):
+        return 'DN(%s)' % (str.__repr__(self),)
+
+
+def key(value):
+    """dns as DN, for dictionaries keyed by dn
+    """
+    if isinstance(value, basestring):
+        return DN(value)
+    return value
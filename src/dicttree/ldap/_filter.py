@@ -0,0 +1,227 @@
+from ldap import SCOPE_BASE
+from ldap import SCOPE_ONELEVEL
+from ldap import SCOPE_SUBTREE
+from ldap import NO_SUCH_OBJECT
+from ldap.filter import escape_filter_chars
+
+from dicttree.ldap._dn import DN
+from dicttree.ldap._dn import below as _below
+from dicttree.ldap._dn import key
+from dicttree.ldap._dn import rdns as _rdns
+from dicttree.ldap._views import KeysView
+from dicttree.ldap._views import ItemsView
+from dicttree.ldap._views import ValuesView
+
+
+LOOKUPS = {
+    'exact': '(%s=%s)',
+    'startswith': '(%s=%s*)',
+    'endswith': '(%s=*%s)',
+    'contains': '(%s=*%s*)',
+    'gte': '(%s>=%s)',
+    'lte': '(%s<=%s)',
+    'approx': '(%s~=%s)',
+    }
+
+
+def _escape(value):
+    """escaped value, ints and the like as their string
+    """
+    if not isinstance(value, basestring):
+        value = str(value)
+    return escape_filter_chars(value)
+
+
+def _wrap(filterstr):
+    """filter string in parentheses, e.g. uid=a -> (uid=a)
+    """
+    filterstr = str(filterstr).strip()
+    if filterstr.startswith('('):
+        return filterstr
+    return '(%s)' % (filterstr,)
+
+
+def _lookup(key, value):
+    """filter for a keyword lookup, e.g. mail__endswith='@x.org'
+    """
+    name, _, lookup = key.partition('__')
+    lookup = lookup or 'exact'
+    if lookup == 'present':
+        present = '(%s=*)' % (name,)
+        return present if value else '(!%s)' % (present,)
+    if lookup == 'in':
+        if isinstance(value, basestring):
+            # a single value, not its characters
+            value = [value]
+        return '(|%s)' % ''.join('(%s=%s)' % (name, _escape(x))
+                                 for x in value)
+    if lookup == 'ne':
+        return '(!(%s=%s))' % (name, _escape(value))
+    try:
+        template = LOOKUPS[lookup]
+    except KeyError:
+        raise ValueError('unknown lookup: %s' % (key,))
+    return template % (name, _escape(value))
+
+
+class Filter(object):
+    """An ldap search filter (RFC 4515)
+
+    Built from filter strings, other filters and keyword lookups, all
+    of them and-ed::
+
+        Filter(objectClass='person', mail__endswith='@x.org')
+        Filter('(uid=a*)') | ~Filter(cn__in=['a', 'b'])
+
+    A lookup is an attribute name, optionally followed by '__' and one
+    of exact, startswith, endswith, contains, gte, lte, approx, ne, in
+    (any of a list of values, a string is one value) or present (True
+    or False). Values are
+    escaped, others than strings converted by str(). Filter strings are
+    taken as they are, put in parentheses if they lack them.
+    """
+    def __init__(self, *filters, **lookups):
+        parts = [_wrap(x) for x in filters]
+        parts.extend(_lookup(key, lookups[key]) for key in sorted(lookups))
+        if not parts:
+            self.filterstr = '(objectClass=*)'
+        elif len(parts) == 1:
+            self.filterstr = parts[0]
+        else:
+            self.filterstr = '(&%s)' % ''.join(parts)
+
+    def __str__(self):
+        return self.filterstr
+
+    def __repr__(self):
+        return '<ldap filter %s>' % (self.filterstr,)
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.filterstr)
+
+    def __and__(self, other):
+        return Filter(self, other)
+
+    def __or__(self, other):
+        return Filter('(|%s%s)' % (self, _wrap(other)))
+
+    def __invert__(self):
+        return Filter('(!%s)' % (self,))
+
+
+class Query(object):
+    """The entries below base matching a filter, as a read-only
+    dictionary
+
+    Nothing is searched until the query is used, the filter is
+    evaluated by the server. ``scope`` is SCOPE_SUBTREE or
+    SCOPE_ONELEVEL, base itself is never part of the query. With
+    ``hints`` the nodes are read along with their subordinate hints.
+    """
+    def __init__(self, directory, filter, base=None, scope=SCOPE_SUBTREE,
+                 hints=False):
+        self.directory = directory
+        self.base = DN(base or directory.base_dn)
+        self.scope = scope
+        self._filter = filter
+        self._hints = hints
+
+    _key = staticmethod(key)
+
+    def __repr__(self):
+        return '<ldap query %s below %s>' % (self._filter, self.base)
+
+    def filter(self, *filters, **lookups):
+        """query narrowed down by another filter
+        """
+        return Query(self.directory,
+                     self._filter & Filter(*filters, **lookups),
+                     base=self.base, scope=self.scope, hints=self._hints)
+
+    def _within(self, dn):
+        rdns = _rdns(dn)
+        if self.scope == SCOPE_ONELEVEL:
+            return rdns[1:] == _rdns(self.base)
+        return _below(rdns, _rdns(self.base))
+
+    def _attrlist(self, attrlist):
+        """attrlist to search for, including the hints if wanted
+        """
+        if not self._hints:
+            return attrlist or ['']
+        return [x for x in attrlist or () if x] + \
+            ['hasSubordinates', 'numSubordinates']
+
+    def _base(self, dn, attrlist):
+        if not self._within(dn):
+            return []
+        try:
+            return self.directory._ldap.search_s(
+                dn, SCOPE_BASE, filterstr=str(self._filter),
+                attrlist=attrlist)
+        except NO_SUCH_OBJECT:
+            return []
+
+    def __contains__(self, dn):
+        return bool(self._base(dn, ['']))
+
+    def __getitem__(self, dn):
+        return self._item(dn, attrlist=['*'])
+
+    def _item(self, dn, attrlist=None):
+        entries = self._base(dn, self._attrlist(attrlist))
+        if not entries:
+            raise KeyError(dn)
+        return self.directory._node(entries[0], attrlist)
+
+    def get(self, dn, default=None):
+        try:
+            return self[dn]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        return (DN(x[0][0]) for x in self._search(['']))
+
+    iterkeys = __iter__
+
+    def _search(self, attrlist, sizelimit=0):
+        return (x for x in self.directory._search(
+                self.base, self.scope, filterstr=str(self._filter),
+                attrlist=attrlist, sizelimit=sizelimit)
+                if DN(x[0][0]) != self.base)
+
+    def itervalues(self, attrlist=None):
+        return (self.directory._node(x[0], attrlist)
+                for x in self._search(self._attrlist(attrlist)))
+
+    def iteritems(self, attrlist=None):
+        return ((node.name, node) for node in self.itervalues(attrlist))
+
+    def __len__(self):
+        return sum(1 for dn in self)
+
+    def __nonzero__(self):
+        # the base entry may match as well
+        return any(True for x in self._search([''], sizelimit=2))
+
+    @property
+    def generation(self):
+        return self.directory.generation
+
+    def keys(self, snapshot=False):
+        return KeysView(dictionary=self, snapshot=snapshot)
+
+    def values(self, attrlist=None, snapshot=False):
+        return ValuesView(dictionary=self, snapshot=snapshot,
+                          attrlist=attrlist)
+
+    def items(self, attrlist=None, snapshot=False):
+        return ItemsView(dictionary=self, snapshot=snapshot,
+                         attrlist=attrlist)
@@ -0,0 +1,186 @@
+import time
+
+from collections import OrderedDict
+from ldap import SCOPE_SUBTREE
+from ldif import LDIFParser
+from ldif import LDIFWriter
+
+from dicttree.ldap._batch import Batch
+from dicttree.ldap._dn import below
+from dicttree.ldap._dn import rdns as _rdns
+
+# attributes maintained by the server, as written by slapcat
+OPERATIONAL = ('createTimestamp', 'creatorsName', 'entryCSN', 'entryDN',
+               'entryUUID', 'hasSubordinates', 'modifiersName',
+               'modifyTimestamp', 'numSubordinates', 'structuralObjectClass',
+               'subschemaSubentry')
+
+EXISTS = (None, 'skip', 'replace', 'modify')
+
+
+class _Counting(object):
+    """file-like object counting the bytes written to a stream
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.bytes += len(data)
+
+
+class Progress(object):
+    """Counts of an export or import, passed to progress callbacks
+
+    Of an import, ``errors`` maps failed dns to their ldap exception and
+    ``skipped`` counts the entries skipped as existing.
+    """
+    def __init__(self):
+        self.entries = 0
+        self.bytes = 0
+        self.start = time.time()
+        self.errors = {}
+        self.skipped = 0
+
+    @property
+    def seconds(self):
+        return time.time() - self.start
+
+    @property
+    def rate(self):
+        """entries per second
+        """
+        return self.entries / max(self.seconds, 1e-6)
+
+    def __repr__(self):
+        return '<%d entries, %d bytes in %.1fs, %.0f entries/s>' % (
+            self.entries, self.bytes, self.seconds, self.rate)
+
+
+def export_ldif(directory, stream, base=None, attrlist=None, progress=None,
+                every=1000):
+    """write the subtree of base as LDIF to stream, returns Progress
+
+    One streaming search, paged with the directory's page_size, not
+    cached: entries are written as they arrive, memory does not grow
+    with the subtree. ``progress`` is called with the Progress about
+    every ``every`` entries and once at the end.
+    """
+    counting = _Counting(stream)
+    writer = LDIFWriter(counting)
+    state = Progress()
+    reported = 0
+    for data in directory._search_server(base or directory.base_dn,
+                                         SCOPE_SUBTREE, attrlist=attrlist):
+        for dn, attrs in data:
+            writer.unparse(dn, attrs)
+            state.entries += 1
+        state.bytes = counting.bytes
+        if progress is not None and state.entries - reported >= every:
+            reported = state.entries
+            progress(state)
+    if progress is not None and state.entries != reported:
+        progress(state)
+    return state
+
+
+class _Importer(LDIFParser):
+    """sends the parsed entries to a batch, parents first
+
+    Entries whose parent was not sent recently are held back until it
+    is, at most ``buffer`` of them. Parents at or above base, or not
+    seen within the buffer, are assumed to exist: the entries held then
+    are sent shallowest first.
+    """
+    def __init__(self, stream, batch, base, exists, state, progress, every,
+                 buffer):
+        LDIFParser.__init__(self, stream, ignored_attr_types=OPERATIONAL)
+        self.batch = batch
+        self.base = _rdns(base)
+        self.exists = exists
+        self.state = state
+        self.progress = progress
+        self.every = every
+        self.buffer = buffer
+        self._reported = 0
+        self._seen = OrderedDict()
+        self._waiting = {}
+        self._held = 0
+
+    def handle(self, dn, entry):
+        rdns = _rdns(dn)
+        parent = rdns[1:]
+        if parent in self._seen or not below(parent, self.base):
+            self._send(dn, rdns, entry)
+            return
+        self._waiting.setdefault(parent, []).append((dn, rdns, entry))
+        self._held += 1
+        if self._held > self.buffer:
+            self.release()
+
+    def release(self):
+        """send all entries held back
+        """
+        for parent in sorted(self._waiting, key=len):
+            for item in self._waiting.pop(parent, ()):
+                self._held -= 1
+                self._send(*item)
+
+    def _send(self, dn, rdns, entry):
+        stack = [(dn, rdns, entry)]
+        while stack:
+            dn, rdns, entry = stack.pop()
+            self.batch.add(dn, entry.items(), exists=self.exists)
+            self._seen[rdns] = None
+            if len(self._seen) > self.buffer:
+                self._seen.popitem(last=False)
+            waiting = self._waiting.pop(rdns, ())
+            self._held -= len(waiting)
+            stack.extend(reversed(waiting))
+            self.state.entries += 1
+            self.report()
+
+    def report(self, final=False):
+        state = self.state
+        state.bytes = getattr(self, 'byte_counter', 0)
+        if self.progress is None:
+            return
+        if state.entries - self._reported >= self.every or \
+                final and state.entries != self._reported:
+            self._reported = state.entries
+            self.progress(state)
+
+
+def import_ldif(directory, stream, exists=None, window=64, buffer=10000,
+                progress=None, every=1000):
+    """add the entries of the LDIF read from stream, returns Progress
+
+    The LDIF is parsed as it is read and the adds are pipelined with
+    up to ``window`` in flight, parents are added before their
+    children, see _Importer. ``exists`` is the policy for entries that
+    exist already, see Batch.add, without one they are reported as
+    errors. Attributes maintained by the server are ignored.
+    Failures do not stop the import, they end up in the ``errors`` of
+    the Progress returned. It uses a batch of its own, also within
+    Directory.batch().
+    """
+    if exists not in EXISTS:
+        raise ValueError('exists must be one of %r' % (EXISTS,))
+    state = Progress()
+    try:
+        with directory._connection() as conn:
+            batch = Batch(conn, window=window)
+            importer = _Importer(stream, batch, directory.base_dn, exists,
+                                 state, progress, every, buffer)
+            try:
+                importer.parse()
+                importer.release()
+            finally:
+                batch.flush()
+    finally:
+        directory.invalidate()
+    state.errors = batch.errors
+    state.skipped = batch.skipped
+    importer.report(final=True)
+    return state
@@ -0,0 +1,586 @@
+import itertools
+import ldap
+import re
+import threading
+
+from collections import OrderedDict
+from ldap import SCOPE_BASE
+from ldap import SCOPE_ONELEVEL
+
+from dicttree.ldap._directory import TREE_DELETE_OID
+from dicttree.ldap._dn import LRU
+from dicttree.ldap._dn import normalize
+from dicttree.ldap._dn import below
+from dicttree.ldap._dn import rdns as _rdns
+from dicttree.ldap._node import _compact
+from dicttree.ldap._node import _name
+from dicttree.ldap._node import _values
+
+# operational attributes provided, returned if asked for by name or '+'
+OPERATIONAL = ('entryDN', 'hasSubordinates', 'numSubordinates',
+               'numAllSubordinates')
+
+
+def _filter_error(filterstr):
+    return ldap.FILTER_ERROR({'desc': 'Bad search filter',
+                              'info': filterstr})
+
+def _unescape(value):
+    return re.sub(r'\\([0-9a-fA-F]{2})',
+                  lambda m: chr(int(m.group(1), 16)), value)
+
+def parse_filter(filterstr):
+    """search filter (RFC 4515) as tree of tuples, see _match
+
+    Attribute names and values are lowercased, matching ignores case.
+    Extensible matches are not supported.
+    """
+    s = filterstr.strip()
+    if not s.startswith('('):
+        s = '(' + s + ')'
+    try:
+        node, pos = _parse(s, 0)
+    except (IndexError, ValueError):
+        raise _filter_error(filterstr)
+    if node is None or pos != len(s):
+        raise _filter_error(filterstr)
+    return node
+
+parse_filter = LRU(parse_filter, size=1000)
+
+def _parse(s, pos):
+    if s[pos] != '(':
+        return None, pos
+    pos += 1
+    op = s[pos]
+    if op in '&|':
+        pos += 1
+        subs = []
+        while s[pos] == '(':
+            sub, pos = _parse(s, pos)
+            if sub is None:
+                return None, pos
+            subs.append(sub)
+        node = (op, subs)
+    elif op == '!':
+        node, pos = _parse(s, pos + 1)
+        if node is None:
+            return None, pos
+        node = ('!', node)
+    else:
+        # values have parentheses escaped
+        end = s.index(')', pos)
+        node = _item(s[pos:end])
+        pos = end
+    if node is None or s[pos] != ')':
+        return None, pos
+    return node, pos + 1
+
+def _item(text):
+    i = text.find('=')
+    if i < 1:
+        return None
+    op = text[i - 1] in '<>~' and text[i - 1] + '=' or '='
+    attr = text[:i - len(op) + 1].strip().lower()
+    value = text[i + 1:]
+    if not attr or ':' in attr:
+        return None
+    if op != '=':
+        return (op, attr, _unescape(value).lower())
+    if value == '*':
+        return ('=*', attr)
+    if '*' in value:
+        return ('*', attr, [_unescape(x).lower() for x in value.split('*')])
+    return ('=', attr, _unescape(value).lower())
+
+
+def _get(attrs, name):
+    """values of the attribute with lowercased name
+    """
+    for key, values in attrs.iteritems():
+        if key.lower() == name:
+            return values
+    return ()
+
+def _compare(value, other):
+    try:
+        return cmp(int(value), int(other))
+    except ValueError:
+        return cmp(value.lower(), other)
+
+def _substring(value, parts):
+    value = value.lower()
+    initial, final = parts[0], parts[-1]
+    if not value.startswith(initial):
+        return False
+    pos = len(initial)
+    for part in parts[1:-1]:
+        pos = value.find(part, pos)
+        if pos < 0:
+            return False
+        pos += len(part)
+    return value.endswith(final) and len(value) - len(final) >= pos
+
+def _match(node, attrs):
+    """whether the attributes of an entry match a parsed filter
+    """
+    op = node[0]
+    if op == '&':
+        return all(_match(x, attrs) for x in node[1])
+    if op == '|':
+        return any(_match(x, attrs) for x in node[1])
+    if op == '!':
+        return not _match(node[1], attrs)
+    values = _get(attrs, node[1])
+    if op == '=*':
+        return bool(values) or node[1] == 'objectclass'
+    if op in ('=', '~='):
+        return any(x.lower() == node[2] for x in values)
+    if op == '>=':
+        return any(_compare(x, node[2]) >= 0 for x in values)
+    if op == '<=':
+        return any(_compare(x, node[2]) <= 0 for x in values)
+    return any(_substring(x, node[2]) for x in values)
+
+
+class Store(object):
+    """An ldap tree in memory
+
+    Entries are kept by normalized dn, the children of an entry by its
+    normalized dn, and for the attributes named in ``index`` the
+    entries by lowercased value (equality index), searches for those
+    do not scan. There is no schema.
+
+    An entry can be added if its parent exists or it is one of
+    ``suffixes``. Without suffixes, any entry without an ancestor in
+    the store starts a tree of its own.
+    """
+    def __init__(self, index=('objectClass',), suffixes=()):
+        self.index = dict((name.lower(), {}) for name in index)
+        self.suffixes = frozenset(normalize(x) for x in suffixes)
+        self.lock = threading.RLock()
+        self._entries = {}
+        self._children = {}
+        # normalized dn -> sort key of its position in the tree
+        self._order = {}
+        self._added = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, ndn):
+        """(dn, attrs) of the entry with normalized dn, or None
+        """
+        return self._entries.get(ndn)
+
+    def _missing(self, dn):
+        return ldap.NO_SUCH_OBJECT({'desc': 'No such object', 'info': dn})
+
+    def _parent(self, ndn):
+        return ','.join(_rdns(ndn)[1:])
+
+    def _may_add(self, ndn, parent):
+        if parent in self._entries or ndn in self.suffixes:
+            return True
+        if self.suffixes:
+            return False
+        rdns = _rdns(ndn)
+        return not any(','.join(rdns[i:]) in self._entries
+                       for i in range(1, len(rdns)))
+
+    def _index(self, ndn, attrs, add=True):
+        for name, values in attrs.iteritems():
+            index = self.index.get(name.lower())
+            if index is None:
+                continue
+            for value in values:
+                value = value.lower()
+                if add:
+                    index.setdefault(value, set()).add(ndn)
+                    continue
+                ndns = index.get(value)
+                if ndns is not None:
+                    ndns.discard(ndn)
+                    if not ndns:
+                        del index[value]
+
+    def add(self, dn, addlist):
+        attrs = _compact(addlist)
+        ndn = normalize(dn)
+        parent = self._parent(ndn)
+        with self.lock:
+            if ndn in self._entries:
+                raise ldap.ALREADY_EXISTS({'desc': 'Already exists',
+                                           'info': dn})
+            if not self._may_add(ndn, parent):
+                raise self._missing(dn)
+            self._entries[ndn] = (dn, attrs)
+            self._children.setdefault(parent, OrderedDict())[ndn] = None
+            self._index(ndn, attrs)
+            self._order[ndn] = self._order.get(parent, ()) + \
+                (next(self._added),)
+            if ndn in self._children:
+                # entries added before their parent move below it
+                for x in self._subtree(ndn)[1:]:
+                    self._order[x] = self._order[self._parent(x)] + \
+                        self._order[x][-1:]
+
+    def modify(self, dn, modlist):
+        ndn = normalize(dn)
+        with self.lock:
+            entry = self._entries.get(ndn)
+            if entry is None:
+                raise self._missing(dn)
+            attrs = dict(entry[1])
+            for op, name, value in modlist:
+                key = _name(name)
+                for x in attrs:
+                    if x.lower() == name.lower():
+                        key = x
+                current = list(attrs.get(key, ()))
+                values = [] if value is None else _values(value)
+                if op == ldap.MOD_ADD:
+                    if not values or any(x in current for x in values):
+                        raise ldap.TYPE_OR_VALUE_EXISTS({'info': name})
+                    current.extend(values)
+                elif op == ldap.MOD_DELETE:
+                    if not current or any(x not in current for x in values):
+                        raise ldap.NO_SUCH_ATTRIBUTE({'info': name})
+                    current = [x for x in current
+                               if values and x not in values]
+                else:
+                    current = values
+                if current:
+                    attrs[key] = tuple(current)
+                else:
+                    attrs.pop(key, None)
+            self._index(ndn, entry[1], add=False)
+            self._entries[ndn] = (entry[0], attrs)
+            self._index(ndn, attrs)
+
+    def delete(self, dn, tree=False):
+        """delete an entry, with tree also the entries below it
+        """
+        ndn = normalize(dn)
+        with self.lock:
+            if ndn not in self._entries:
+                raise self._missing(dn)
+            if self._children.get(ndn) and not tree:
+                raise ldap.NOT_ALLOWED_ON_NONLEAF({'info': dn})
+            for x in reversed(self._subtree(ndn)):
+                self._remove(x)
+
+    def _remove(self, ndn):
+        dn, attrs = self._entries.pop(ndn)
+        self._index(ndn, attrs, add=False)
+        del self._order[ndn]
+        self._children.pop(ndn, None)
+        parent = self._parent(ndn)
+        siblings = self._children[parent]
+        del siblings[ndn]
+        if not siblings:
+            del self._children[parent]
+
+    def _subtree(self, ndn):
+        """normalized dns of ndn and the entries below it, parents first
+        """
+        ndns = []
+        stack = [ndn]
+        while stack:
+            ndn = stack.pop()
+            ndns.append(ndn)
+            stack.extend(reversed(self._children.get(ndn, ())))
+        return ndns
+
+    def children(self, ndn):
+        return len(self._children.get(ndn, ()))
+
+    def below(self, ndn):
+        """number of entries below ndn
+        """
+        with self.lock:
+            return len(self._subtree(ndn)) - 1
+
+    def _indexed(self, node):
+        """normalized dns possibly matching a parsed filter, according
+        to the indexes, or None if they do not tell
+        """
+        op = node[0]
+        if op == '=':
+            index = self.index.get(node[1])
+            if index is None:
+                return None
+            return index.get(node[2], frozenset())
+        if op == '&':
+            sets = [x for x in (self._indexed(sub) for sub in node[1])
+                    if x is not None]
+            if not sets:
+                return None
+            sets.sort(key=len)
+            return frozenset(x for x in sets[0]
+                             if all(x in other for other in sets[1:]))
+        if op == '|':
+            sets = [self._indexed(sub) for sub in node[1]]
+            if None in sets:
+                return None
+            return frozenset(itertools.chain(*sets))
+        return None
+
+    def candidates(self, base, scope, node):
+        """normalized dns within scope that may match a parsed filter,
+        parents first
+
+        Entries found by the indexes are returned in the order of an
+        unindexed search, without walking the scope.
+        """
+        nbase = normalize(base)
+        with self.lock:
+            if nbase not in self._entries:
+                raise self._missing(base)
+            if scope == SCOPE_BASE:
+                return [nbase]
+            indexed = self._indexed(node)
+            if scope == SCOPE_ONELEVEL:
+                if indexed is None:
+                    return list(self._children.get(nbase, ()))
+                ndns = [x for x in indexed if self._parent(x) == nbase]
+            else:
+                if indexed is None:
+                    return self._subtree(nbase)
+                rdns = _rdns(nbase)
+                ndns = [x for x in indexed
+                        if x == nbase or below(_rdns(x), rdns)]
+            return sorted(ndns, key=self._order.__getitem__)
+
+
+STORES = {}
+_stores_lock = threading.Lock()
+
+def drop(uri):
+    """forget the store of uri
+    """
+    with _stores_lock:
+        STORES.pop(uri, None)
+
+
+class MemoryConnection(object):
+    """In-process backend, a Store behind the part of LDAPObject used
+    by Directory, Node, Attributes, Batch and ConnectionPool
+
+    Pass it as ``backend`` to Directory. Connections to the same uri,
+    e.g. 'memory://name', share a Store, created on first connect.
+    Binds always succeed. Asynchronous operations are carried out when
+    sent, result() hands out their outcome; search results are read
+    from the store as they are fetched. The paged results control is
+    ignored, like a server may. The root DSE announces the tree
+    delete control.
+    """
+    def __init__(self, uri, store=None):
+        if store is None:
+            with _stores_lock:
+                store = STORES.get(uri)
+                if store is None:
+                    store = STORES[uri] = Store()
+        self.uri = uri
+        self.store = store
+        self.who = ''
+        self._pending = OrderedDict()
+        self._msgids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def bind_s(self, who='', cred='', method=None):
+        self.who = who or ''
+
+    simple_bind_s = bind_s
+
+    def unbind_s(self):
+        with self._lock:
+            self._pending.clear()
+
+    unbind = unbind_s
+
+    def whoami_s(self):
+        return self.who and 'dn:' + self.who
+
+    def _project(self, ndn, dn, attrs, wanted, attrsonly):
+        """attributes returned for a search's attrlist
+        """
+        user = wanted is None or '*' in wanted
+        result = {}
+        for name, values in attrs.iteritems():
+            if user or name.lower() in wanted:
+                result[name] = [] if attrsonly else list(values)
+        if wanted is None:
+            return result
+        for name in OPERATIONAL:
+            if '+' not in wanted and name.lower() not in wanted:
+                continue
+            if name == 'entryDN':
+                value = dn
+            elif name == 'hasSubordinates':
+                value = self.store.children(ndn) and 'TRUE' or 'FALSE'
+            elif name == 'numSubordinates':
+                value = str(self.store.children(ndn))
+            else:
+                value = str(self.store.below(ndn))
+            result[name] = [] if attrsonly else [value]
+        return result
+
+    def _search(self, base, scope, filterstr, attrlist, attrsonly):
+        """iterator on the entries found, failures are raised upfront
+        """
+        node = parse_filter(filterstr or '(objectClass=*)')
+        wanted = None
+        if attrlist is not None:
+            wanted = frozenset(x.lower() for x in attrlist)
+        if scope == SCOPE_BASE and not normalize(base):
+            attrs = {'supportedControl': (TREE_DELETE_OID,),
+                     'namingContexts': tuple(
+                    dn for dn, attrs in (self.store.get(x) for x in
+                                         self.store._children.get('', ()))
+                    )}
+            return iter([('', self._project('', '', attrs, wanted,
+                                            attrsonly))])
+        ndns = self.store.candidates(base, scope, node)
+        return self._entries(ndns, node, wanted, attrsonly)
+
+    def _entries(self, ndns, node, wanted, attrsonly):
+        for ndn in ndns:
+            entry = self.store.get(ndn)
+            if entry is None:
+                # deleted meanwhile
+                continue
+            dn, attrs = entry
+            if _match(node, attrs):
+                yield (dn, self._project(ndn, dn, attrs, wanted, attrsonly))
+
+    def search_ext_s(self, base, scope, filterstr='(objectClass=*)',
+                     attrlist=None, attrsonly=0, serverctrls=None,
+                     clientctrls=None, timeout=-1, sizelimit=0):
+        entries = self._search(base, scope, filterstr, attrlist, attrsonly)
+        if not sizelimit:
+            return list(entries)
+        results = list(itertools.islice(entries, sizelimit + 1))
+        if len(results) > sizelimit:
+            raise ldap.SIZELIMIT_EXCEEDED({'desc': 'Size limit exceeded'})
+        return results
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        return self.search_ext_s(base, scope, filterstr, attrlist, attrsonly)
+
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+                   attrlist=None, attrsonly=0, serverctrls=None,
+                   clientctrls=None, timeout=-1, sizelimit=0):
+        try:
+            entries = self._search(base, scope, filterstr, attrlist,
+                                   attrsonly)
+        except ldap.LDAPError, e:
+            return self._queue([ldap.RES_SEARCH_RESULT, e])
+        return self._queue([ldap.RES_SEARCH_ENTRY, entries, sizelimit, 0])
+
+    def search(self, base, scope, filterstr='(objectClass=*)',
+               attrlist=None, attrsonly=0):
+        return self.search_ext(base, scope, filterstr, attrlist, attrsonly)
+
+    def _queue(self, operation):
+        with self._lock:
+            msgid = next(self._msgids)
+            self._pending[msgid] = operation
+        return msgid
+
+    def _send(self, rtype, func, *args):
+        try:
+            func(*args)
+        except ldap.LDAPError, e:
+            return self._queue([rtype, e])
+        return self._queue([rtype, None])
+
+    def add_s(self, dn, modlist):
+        self.store.add(dn, modlist)
+
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._send(ldap.RES_ADD, self.store.add, dn, modlist)
+
+    add = add_ext
+
+    def add_ext_s(self, dn, modlist, serverctrls=None, clientctrls=None):
+        self.store.add(dn, modlist)
+
+    def modify_s(self, dn, modlist):
+        self.store.modify(dn, modlist)
+
+    def modify_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        return self._send(ldap.RES_MODIFY, self.store.modify, dn, modlist)
+
+    modify = modify_ext
+
+    def modify_ext_s(self, dn, modlist, serverctrls=None, clientctrls=None):
+        self.store.modify(dn, modlist)
+
+    def _tree(self, serverctrls):
+        return any(x.controlType == TREE_DELETE_OID
+                   for x in serverctrls or ())
+
+    def delete_s(self, dn):
+        self.store.delete(dn)
+
+    def delete_ext(self, dn, serverctrls=None, clientctrls=None):
+        return self._send(ldap.RES_DELETE, self.store.delete, dn,
+                          self._tree(serverctrls))
+
+    delete = delete_ext
+
+    def delete_ext_s(self, dn, serverctrls=None, clientctrls=None):
+        self.store.delete(dn, self._tree(serverctrls))
+
+    def abandon(self, msgid):
+        with self._lock:
+            self._pending.pop(msgid, None)
+
+    abandon_ext = abandon
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        with self._lock:
+            if msgid == ldap.RES_ANY and self._pending:
+                msgid = next(iter(self._pending))
+            operation = self._pending.get(msgid)
+            if operation is None:
+                if timeout == 0:
+                    return (None, None, None, None)
+                raise ldap.PROTOCOL_ERROR({'desc': 'unknown message id',
+                                           'info': str(msgid)})
+            if operation[0] != ldap.RES_SEARCH_ENTRY:
+                del self._pending[msgid]
+                rtype, error = operation
+                if error is not None:
+                    raise error
+                return (rtype, [], msgid, [])
+        if all:
+            data = [x for x in self._fetch(msgid, operation, None)]
+            return (ldap.RES_SEARCH_RESULT, data, msgid, [])
+        for entry in self._fetch(msgid, operation, 1):
+            return (ldap.RES_SEARCH_ENTRY, [entry], msgid, [])
+        return (ldap.RES_SEARCH_RESULT, [], msgid, [])
+
+    def _fetch(self, msgid, operation, count):
+        """up to count (all for None) entries of a pending search,
+        it is done once they are exhausted
+        """
+        rtype, entries, sizelimit, sent = operation
+        taken = 0
+        while count is None or taken < count:
+            try:
+                entry = next(entries)
+            except StopIteration:
+                self.abandon(msgid)
+                return
+            if sizelimit and sent + taken >= sizelimit:
+                self.abandon(msgid)
+                raise ldap.SIZELIMIT_EXCEEDED({'desc': 'Size limit exceeded'})
+            taken += 1
+            operation[3] = sent + taken
+            yield entry
+
+    def result(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        return self.result3(msgid, all, timeout)[:2]
@@ -0,0 +1,51 @@
+import ldap
+
+from dicttree.ldap._node import _values
+
+STRUCTURAL = 'structuralObjectClass'
+
+# servers refuse to change the structural object class, not all of
+# them name it, openldap answers with a violation
+CLASS_ERRORS = (ldap.OBJECT_CLASS_MODS_PROHIBITED, ldap.OBJECT_CLASS_VIOLATION)
+
+
+def diff(old, new):
+    """minimal modlist modifying the attributes old to new
+
+    Changed attributes are replaced, unchanged ones left alone and
+    those missing in new deleted. Values are compared as sets. None if
+    the entry needs to be replaced instead: its structural object
+    class, if old names it as structuralObjectClass, is missing in new.
+    """
+    old = dict((name.lower(), (name, values))
+               for name, values in old.iteritems())
+    structural = old.pop(STRUCTURAL.lower(), (None, ()))[1]
+    if structural:
+        classes = set(x.lower() for name, values in new.iteritems()
+                      if name.lower() == 'objectclass'
+                      for x in _values(values))
+        if structural[0].lower() not in classes:
+            return None
+    modlist = []
+    for name, values in new.iteritems():
+        values = _values(values)
+        current = old.pop(name.lower(), (name, ()))[1]
+        if not values:
+            if current:
+                modlist.append((ldap.MOD_DELETE, name, None))
+        elif not current:
+            modlist.append((ldap.MOD_ADD, name, values))
+        elif set(current) != set(values):
+            modlist.append((ldap.MOD_REPLACE, name, values))
+    for name, values in old.itervalues():
+        modlist.append((ldap.MOD_DELETE, name, None))
+    return modlist
+
+
+def reclassifies(modlist):
+    """whether modlist modifies the object classes
+
+    If it fails with one of CLASS_ERRORS, the entry needs to be
+    replaced instead.
+    """
+    return any(name.lower() == 'objectclass' for op, name, value in modlist)
@@ -3,55 +3,190 @@ import ldap
 from ldap import SCOPE_BASE
 from ldap import NO_SUCH_OBJECT
 
-import copy
+from dicttree.ldap._views import KeysView
+from dicttree.ldap._views import ItemsView
+from dicttree.ldap._views import ValuesView
 
+from contextlib import contextmanager
 
+def _values(value):
+    """attribute values as list, a single value may be passed as string
+    """
+    if isinstance(value, basestring):
+        return [value]
+    return list(value)
 
-import ipdb
+def _name(name):
+    """attribute names are interned, entries share them
+    """
+    if type(name) is str:
+        return intern(name)
+    return name
+
+def _compact(attrs):
+    """attributes as dict of interned names to tuples of values
+    """
+    return dict((_name(name), tuple(_values(value)))
+                for name, value in dict(attrs).iteritems())
 
 class Attributes(object):
-    def __init__(self, dn=None, attrs=(), ldap=None):
+    """Attributes of an ldap entry
+
+    The entry is fetched once, on first access, and read from the
+    local copy afterwards - unless it was passed in complete already.
+    Without a connection the passed attributes are all there is.
+    Writes go to the server and are applied to the local copy, without
+    fetching the entry first; refresh() drops it.
+
+    Within edit() modifications are collected and sent as a single
+    modify when the block is left.
+
+    Values are stored as tuples, under interned names, and handed out
+    as lists.
+
+    ``complete`` may name the attributes passed in, as the attrlist of
+    the search that returned them: these are read locally, accessing
+    others fetches the whole entry. '*' stands for all of them.
+
+    Writes invalidate dn in ``directory``, if given.
+    """
+    __slots__ = ('dn', 'attrs', '_ldap', '_complete', '_pending',
+                 '_directory')
+
+    def __init__(self, dn=None, attrs=(), ldap=None, complete=None,
+                 directory=None):
         self.dn = dn
-        self.attrs = attrs
+        self.attrs = _compact(attrs)
         self._ldap = ldap
+        self._directory = directory
+        if complete is None:
+            complete = ldap is None
+        elif complete not in (True, False):
+            complete = frozenset(name.lower() for name in complete)
+            if '*' in complete:
+                complete = True
+        self._complete = complete
+        self._pending = None
+
+    def _entry(self, name=None):
+        """the local copy of the entry, fetched if needed
+
+        With name, a partial copy holding that attribute suffices.
+        """
+        complete = self._complete
+        if complete is not True and (name is None or not complete or
+                                     name.lower() not in complete):
+            self.attrs = _compact(
+                self._ldap.search_s(self.dn, SCOPE_BASE)[0][1])
+            self._complete = True
+        return self.attrs
+
+    def _written(self, name, values):
+        """apply a write of all values of name to the local copy
+
+        The entry is not fetched for it: the attribute is added to the
+        ones held by a partial copy.
+        """
+        complete = self._complete
+        if complete is not True:
+            if not complete:
+                self.attrs = {}
+                complete = frozenset()
+            self._complete = complete | frozenset([name.lower()])
+        values = tuple(values)
+        if values:
+            self.attrs[_name(name)] = values
+        else:
+            self.attrs.pop(name, None)
+
+    def refresh(self):
+        """drop the local copy, the next access fetches the entry again
+        """
+        if self._ldap is not None:
+            self._complete = False
+
+    def _modify(self, modlist):
+        if self._pending is not None:
+            for mod in modlist:
+                self._queue(mod)
+        elif self._ldap is not None and modlist:
+            if self._directory is not None:
+                self._directory.invalidate(self.dn)
+            self._ldap.modify_s(self.dn, modlist)
+
+    def _queue(self, mod):
+        """add a modification to the pending ones
+
+        Replacing or deleting all values of an attribute supersedes
+        earlier modifications of that attribute. Deleting all values is
+        queued as replace without values: it does not fail, if the
+        attribute was only added within the same edit.
+        """
+        action, name, value = mod
+        if action == ldap.MOD_DELETE and value is None:
+            action = ldap.MOD_REPLACE
+        if action == ldap.MOD_REPLACE:
+            self._pending = [x for x in self._pending
+                             if x[1].lower() != name.lower()]
+        self._pending.append((action, name, value))
+
+    @contextmanager
+    def edit(self):
+        """collect modifications and send them as one modify on exit
+
+        If the block raises, nothing is sent and the local copy is
+        dropped. Nested edits join the outermost one.
+        """
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = []
+        try:
+            yield self
+            modlist = self._pending
+            self._pending = None
+            self._modify(modlist)
+        except:
+            self._pending = None
+            self.refresh()
+            raise
 
     def __contains__(self, name):
-        entry = self._ldap.search_s(self.dn, SCOPE_BASE,
-                                    attrlist=[name], attrsonly=True)[0]
-        return len(entry[1]) > 0
+        return name in self._entry(name)
 
     def __getitem__(self, name):
-        entry = self._ldap.search_s(self.dn, SCOPE_BASE,
-                                    attrlist=[name])[0]
-        return entry[1][name]
+        return list(self._entry(name)[name])
 
     def __setitem__(self, name, value):
-        action = ldap.MOD_ADD
-        if name in self:
-            action = ldap.MOD_REPLACE
-        self._ldap.modify_s(self.dn, [(action, name, value)])
+        # replace adds the attribute if it does not exist yet
+        self._modify([(ldap.MOD_REPLACE, name, value)])
+        self._written(name, _values(value))
 
     def __delitem__(self, name, value=None):
         """ delete attibutes value, if value is None
         deletes all values for given attribute name """
-        self._ldap.modify_s(self.dn, [(ldap.MOD_DELETE, name, value)])
+        self._modify([(ldap.MOD_DELETE, name, value)])
+        if value is None:
+            self._written(name, ())
+            return
+        entry = self._entry(name)
+        value = _values(value)
+        entry[name] = tuple(x for x in entry[name] if x not in value)
+        if not entry[name]:
+            del entry[name]
 
     def __iter__(self):
-        return (item[0] for item in self._search())
-
-    def _search(self, attrlist=['*']):
-        """ldap search returning a generator on attributes
-        """
-        entry = self._ldap.search_s(self.dn, SCOPE_BASE, attrlist=attrlist)[0]
-        for name in entry[1]:
-            yield (name, entry[1][name])
+        return iter(self._entry())
 
     def __len__(self):
-        return sum(1 for x in iter(self))
+        return len(self._entry())
 
     def __eq__(self, other):
-        # XXX quick fix, for old test cases
-        return dict(self.attrs).items() == dict(other.attrs).items()
+        # the entries, not what was fetched of them so far
+        return self._entry() == other._entry()
+
+    def __ne__(self, other):
+        return not self == other
 
     def keys(self):
         return KeysView(dictionary=self)
@@ -66,18 +201,14 @@ class Attributes(object):
         return iter(self)
 
     def itervalues(self):
-        return (item[1] for item in self._search())
+        return (list(value) for value in self._entry().itervalues())
 
     def iteritems(self):
-        res = dict(self.attrs).items()
-        res2 = [(item[0], item[1]) for item in
-                self._search()]
-        #res = [('objectClass', ['organizationalRole']), ('cn', ['cn0'])]
-        #ipdb.set_trace()
-        return res
+        return ((name, list(value))
+                for name, value in self._entry().iteritems())
 
     def copy(self):
-        return copy.copy(self.attrs)
+        return dict(self.iteritems())
 
     def get(self, name, default=None):
         try:
@@ -99,7 +230,8 @@ class Attributes(object):
         try:
             return self[name]
         except KeyError:
-            self[name] = default
+            self._modify([(ldap.MOD_ADD, name, default)])
+            self._written(name, _values(default))
             return default
 
     def update(self, other):
@@ -107,12 +239,25 @@ class Attributes(object):
             items = other.items()
         except AttributeError:
             items = other
+        items = list(items)
+        self._modify([(ldap.MOD_REPLACE, name, value)
+                      for name, value in items])
         for name, value in items:
-            self[name] = value
+            self._written(name, _values(value))
         return None
 
 class Node(object):
-    def __init__(self, name=None, attrs=(), ldap=None):
+    """An ldap entry
+
+    Nodes handed out by children() know whether they have children
+    themselves, has_children and num_children are None if unknown -
+    not all servers provide numSubordinates.
+    """
+    __slots__ = ('name', 'attrs', '_ldap', '_directory', 'has_children',
+                 'num_children')
+
+    def __init__(self, name=None, attrs=(), ldap=None, complete=None,
+                 directory=None, has_children=None, num_children=None):
         self.name = name
         # python-ldap uses (unordered) dicts to return attributes. I
         # am under the impression that openldap preserves attribute
@@ -120,8 +265,21 @@ class Node(object):
         # python-ldap would give us order. Needs to be investigated.
         #self.attrs = OrderedDict(attrs)
         #self.attrs = dict(attrs)
-        self.attrs = Attributes(dn=name, attrs=attrs, ldap=ldap)
+        self.attrs = Attributes(dn=name, attrs=attrs, ldap=ldap,
+                                complete=complete, directory=directory)
         self._ldap = ldap
+        self._directory = directory
+        self.has_children = has_children
+        self.num_children = num_children
+
+    def children(self):
+        """the entries one level below, see Directory.children
+
+        A node not read from a directory has none.
+        """
+        if self._directory is None:
+            return {}
+        return self._directory.children(self.name)
 
     def __eq__(self, other):
         return self is other or \
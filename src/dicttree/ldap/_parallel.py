@@ -0,0 +1,195 @@
+import cPickle
+import ldap
+import multiprocessing
+import Queue
+
+from ldap import SCOPE_BASE
+from ldap import SCOPE_ONELEVEL
+from ldap import SCOPE_SUBTREE
+
+# levels below base_dn that subtrees are split into, at most
+DEPTH = 3
+
+# queues of the workers' results, set by _init
+_queues = None
+
+
+def _init(queues):
+    global _queues
+    _queues = queues
+
+
+def _picklable(exc):
+    try:
+        cPickle.dumps(exc)
+    except Exception:
+        return RuntimeError(repr(exc))
+    return exc
+
+
+def _scan_partition(args):
+    """entries of one partition, run in a worker process
+
+    The worker binds a connection of its own, to a plain Directory: a
+    Replica would start a syncrepl session. Entries are decoded, and
+    passed through func, in the worker; they are put on the queue of
+    ``slot`` in chunks of chunksize as (index, chunk), followed by
+    (index, None) or (index, exception). Parts deleted meanwhile are
+    skipped.
+    """
+    from dicttree.ldap._directory import Directory
+    (index, slot, uri, bind_dn, pw, backend, page_size, parts, filterstr,
+     attrlist, func, chunksize) = args
+    queue = _queues[slot]
+    try:
+        directory = Directory(uri, parts[0][0], bind_dn, pw,
+                              page_size=page_size, backend=backend)
+        chunk = []
+        for base, scope in parts:
+            try:
+                for data in directory._search(base, scope,
+                                              filterstr=filterstr,
+                                              attrlist=attrlist):
+                    for dn, attrs in data:
+                        chunk.append((dn, attrs) if func is None
+                                     else func(dn, attrs))
+                    if len(chunk) >= chunksize:
+                        queue.put((index, chunk))
+                        chunk = []
+            except ldap.NO_SUCH_OBJECT:
+                pass
+        if chunk:
+            queue.put((index, chunk))
+    except Exception, e:
+        queue.put((index, _picklable(e)))
+    else:
+        queue.put((index, None))
+
+
+def _children(directory, dn):
+    return [data[0][0] for data in
+            directory._search(dn, SCOPE_ONELEVEL, attrlist=[''])]
+
+
+def _partitions(directory, count):
+    """(base, scope) of the parts of the tree below base_dn, in order,
+    grouped into at most count partitions
+
+    The parts are the subtrees of the children of base_dn. While there
+    are fewer than count, up to DEPTH levels, subtrees are split into
+    their base entry and the subtrees of its children, so one large
+    branch is read in parallel as well.
+    """
+    parts = [(dn, SCOPE_SUBTREE) for dn in _children(directory,
+                                                     directory.base_dn)]
+    for level in range(DEPTH):
+        if len(parts) >= count:
+            break
+        split = []
+        for base, scope in parts:
+            children = scope == SCOPE_SUBTREE and _children(directory, base)
+            if children:
+                split.append((base, SCOPE_BASE))
+                split.extend((dn, SCOPE_SUBTREE) for dn in children)
+            else:
+                split.append((base, scope))
+        if len(split) == len(parts):
+            break
+        parts = split
+    size, rest = divmod(len(parts), count)
+    partitions = []
+    start = 0
+    for i in range(min(count, len(parts))):
+        end = start + size + (i < rest)
+        partitions.append(parts[start:end])
+        start = end
+    return partitions
+
+
+def _received(queue, result):
+    """(index, chunk) sent by the workers of result, see _scan_partition
+
+    Exceptions sent are raised.
+    """
+    stalled = False
+    while True:
+        try:
+            index, chunk = queue.get(timeout=1)
+        except Queue.Empty:
+            if not result.ready():
+                continue
+            # workers are done, whatever they sent arrives by now
+            if stalled:
+                result.get()
+                raise RuntimeError('scan workers ended without result')
+            stalled = True
+            continue
+        stalled = False
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield index, chunk
+
+
+def scan(directory, filterstr='(objectClass=*)', attrlist=None, func=None,
+         processes=None, ordered=False, chunksize=1000):
+    """generator on the entries below base_dn, scanned in parallel
+
+    The tree is split into partitions, about four per process of a pool
+    of ``processes`` (default: one per cpu), see _partitions. Entries
+    are yielded as (dn, attrs), or as returned by ``func(dn, attrs)``,
+    which has to be picklable, i.e. a module level function.
+
+    Workers send their entries in chunks of ``chunksize`` through
+    bounded queues, so neither they nor the parent hold more than a
+    few chunks. Without ``ordered`` chunks are yielded as they arrive.
+    With ``ordered`` partitions are yielded in tree order: each process
+    works on one of the partitions due next and sends through a queue
+    of its own, the parent reads the queue of the partition due, a
+    worker ahead waits for its queue to be read.
+    """
+    uri, bind_dn, pw = directory._credentials
+    processes = processes or multiprocessing.cpu_count()
+    partitions = _partitions(directory, 4 * processes)
+    if not partitions:
+        return
+    processes = min(processes, len(partitions))
+    if ordered:
+        queues = [multiprocessing.Queue(maxsize=2) for i in range(processes)]
+    else:
+        queues = [multiprocessing.Queue(maxsize=2 * processes)]
+    tasks = [(index, index % len(queues), uri, bind_dn, pw,
+              directory._backend, directory.page_size, parts, filterstr,
+              attrlist, func, chunksize)
+             for index, parts in enumerate(partitions)]
+    pool = multiprocessing.Pool(processes, initializer=_init,
+                                initargs=(queues,))
+    try:
+        if ordered:
+            results = [pool.apply_async(_scan_partition, (task,))
+                       for task in tasks[:processes]]
+            for due, task in enumerate(tasks):
+                for index, chunk in _received(queues[task[1]],
+                                              results[due]):
+                    if chunk is None:
+                        break
+                    for entry in chunk:
+                        yield entry
+                if due + processes < len(tasks):
+                    # the slot of the partition done is free
+                    results.append(pool.apply_async(
+                            _scan_partition, (tasks[due + processes],)))
+        else:
+            result = pool.map_async(_scan_partition, tasks)
+            finished = 0
+            for index, chunk in _received(queues[0], result):
+                if chunk is None:
+                    finished += 1
+                    if finished == len(tasks):
+                        break
+                    continue
+                for entry in chunk:
+                    yield entry
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
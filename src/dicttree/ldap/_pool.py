@@ -0,0 +1,190 @@
+import ldap
+import threading
+import time
+
+from contextlib import contextmanager
+from ldap.ldapobject import LDAPObject
+
+from dicttree.ldap._stats import InstrumentedConnection
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout
+    """
+
+
+class ConnectionPool(object):
+    """Thread-safe pool of bound connections
+
+    Between ``minsize`` and ``maxsize`` connections are kept, a checkout
+    waits up to ``timeout`` seconds (forever for None) for one to become
+    available. Connections idle for more than ``check_interval`` seconds
+    are checked before being handed out, connections found dead or
+    failing with SERVER_DOWN are replaced.
+
+    The synchronous operations of LDAPObject used by Directory, Node and
+    Attributes are provided and borrow a connection for their duration;
+    an operation failing with SERVER_DOWN is retried once on a fresh
+    connection. Asynchronous operations need a connection for their
+    whole duration, see connection().
+
+    A thread holds at most one connection: operations within a block of
+    connection(), e.g. reading nodes while iterating a search, use the
+    connection of that block. Otherwise maxsize threads each holding one
+    would wait for each other forever.
+
+    With ``stats``, the operations of the connections are recorded
+    there. ``backend`` is the class of the connections, see Directory.
+    """
+    def __init__(self, uri, bind_dn, pw, minsize=1, maxsize=10, timeout=None,
+                 check_interval=60, stats=None, backend=LDAPObject):
+        self.uri = uri
+        self.bind_dn = bind_dn
+        self.pw = pw
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.stats = stats
+        self.backend = backend
+        self._idle = []
+        self._size = 0
+        # thread -> [connection, blocks using it, failed with SERVER_DOWN]
+        self._held = {}
+        self._cond = threading.Condition()
+        for i in range(minsize):
+            self._idle.append((self._connect(), time.time()))
+            self._size += 1
+
+    def _connect(self):
+        conn = self.backend(self.uri)
+        conn.bind_s(self.bind_dn, self.pw)
+        if self.stats is not None:
+            conn = InstrumentedConnection(conn, self.stats)
+        return conn
+
+    def _alive(self, conn):
+        try:
+            conn.whoami_s()
+        except ldap.LDAPError:
+            return False
+        return True
+
+    def acquire(self):
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.time() + self.timeout
+        with self._cond:
+            while not self._idle and self._size >= self.maxsize:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout('no connection available after %ss'
+                                      % (self.timeout,))
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, since = self._idle.pop()
+            else:
+                conn, since = None, None
+                self._size += 1
+        try:
+            if conn is not None and \
+                    time.time() - since > self.check_interval and \
+                    not self._alive(conn):
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except:
+            self._discard()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if discard:
+            self._discard()
+            return
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def _discard(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """borrow a connection for the duration of the block
+
+        Nested blocks of a thread share the connection borrowed by the
+        outermost one, it is returned once all of them are left.
+        """
+        thread = threading.current_thread()
+        with self._cond:
+            held = self._held.get(thread)
+            if held is not None:
+                held[1] += 1
+        if held is None:
+            held = [self.acquire(), 1, False]
+            with self._cond:
+                self._held[thread] = held
+        try:
+            yield held[0]
+        except ldap.SERVER_DOWN:
+            held[2] = True
+            raise
+        finally:
+            with self._cond:
+                held[1] -= 1
+                done = not held[1]
+                if done:
+                    # generators may be finished by another thread
+                    del self._held[thread]
+            if done:
+                self.release(held[0], discard=held[2])
+
+    def close(self):
+        """unbind all idle connections
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, since in idle:
+            try:
+                conn.unbind_s()
+            except ldap.LDAPError:
+                pass
+
+    def _call(self, name, *args, **kw):
+        try:
+            with self.connection() as conn:
+                return getattr(conn, name)(*args, **kw)
+        except ldap.SERVER_DOWN:
+            if threading.current_thread() in self._held:
+                # within a block, its connection is the one failing
+                raise
+            with self.connection() as conn:
+                return getattr(conn, name)(*args, **kw)
+
+    def search_s(self, *args, **kw):
+        return self._call('search_s', *args, **kw)
+
+    def search_ext_s(self, *args, **kw):
+        return self._call('search_ext_s', *args, **kw)
+
+    def add_s(self, *args, **kw):
+        return self._call('add_s', *args, **kw)
+
+    def modify_s(self, *args, **kw):
+        return self._call('modify_s', *args, **kw)
+
+    def delete_s(self, *args, **kw):
+        return self._call('delete_s', *args, **kw)
+
+    def delete_ext_s(self, *args, **kw):
+        return self._call('delete_ext_s', *args, **kw)
+
+    def whoami_s(self):
+        return self._call('whoami_s')
@@ -0,0 +1,274 @@
+import ldap
+import logging
+import sys
+import threading
+import time
+
+from ldap import SCOPE_BASE
+from ldap import SCOPE_SUBTREE
+from ldap.ldapobject import LDAPObject
+from ldap.syncrepl import SyncreplConsumer
+
+from dicttree.ldap._directory import Directory
+from dicttree.ldap._dn import DN
+from dicttree.ldap._dn import below
+from dicttree.ldap._dn import rdns
+from dicttree.ldap._node import Node
+
+log = logging.getLogger(__name__)
+
+
+class _Consumer(LDAPObject, SyncreplConsumer):
+    """syncrepl session feeding a Replica
+    """
+    def __init__(self, uri, replica):
+        LDAPObject.__init__(self, uri)
+        self.replica = replica
+        self.present = set()
+
+    def syncrepl_get_cookie(self):
+        return self.replica.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self.replica.cookie = cookie
+
+    def syncrepl_entry(self, dn, attributes, uuid):
+        self.present.add(uuid)
+        self.replica._store(uuid, dn, attributes)
+
+    def syncrepl_delete(self, uuids):
+        self.replica._remove(uuids)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        if uuids is not None:
+            self.present.update(uuids)
+            return
+        if not refreshDeletes:
+            # everything not reported present is gone
+            self.replica._remove(
+                [x for x in self.replica._uuids() if x not in self.present])
+        self.present = set()
+
+    def syncrepl_refreshdone(self):
+        self.replica._ready.set()
+
+
+class Replica(Directory):
+    """Directory read from a local mirror of base_dn
+
+    The mirror is filled and kept current by a syncrepl (RFC 4533)
+    session in a background thread: with ``mode`` refreshAndPersist the
+    server pushes changes as they happen, with refreshOnly the mirror is
+    refreshed every ``interval`` seconds. The server needs the syncprov
+    overlay. The constructor waits up to ``timeout`` seconds (forever
+    for None) for the initial refresh and raises ldap.TIMEOUT if it is
+    not done by then.
+
+    The session is resumed after SERVER_DOWN, any other failure ends it:
+    it is raised by the constructor if the initial refresh was not
+    done, otherwise logged and kept as ``error``, the mirror is no
+    longer kept current then.
+
+    Lookups, membership, iteration and the views are answered from the
+    mirror, filter() and children() still search the server. Writes go
+    to the server and are applied to the mirror once done, i.e. the
+    replica reads its own writes. ``generation`` also counts changes
+    received from the server, outdating snapshot views.
+    """
+    def __init__(self, uri, base_dn, bind_dn, pw, mode='refreshAndPersist',
+                 interval=60, timeout=None, **kw):
+        Directory.__init__(self, uri, base_dn, bind_dn, pw, **kw)
+        self.mode = mode
+        self.interval = interval
+        self.cookie = None
+        self._base = DN(base_dn)
+        self._entries = {}
+        self._by_dn = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self._consumer = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        ready = self._ready.wait(timeout)
+        if self.error is not None:
+            self._thread.join()
+            raise self.error[0], self.error[1], self.error[2]
+        if not ready:
+            self.close()
+            raise ldap.TIMEOUT({'desc': 'initial refresh not done within '
+                                '%s seconds' % (timeout,)})
+
+    def close(self):
+        """end the syncrepl session and unbind
+        """
+        self._stopped.set()
+        self._thread.join()
+        Directory.close(self)
+
+    def _run(self):
+        try:
+            self._sessions()
+        except Exception:
+            self.error = sys.exc_info()
+            if self._ready.is_set():
+                log.exception('syncrepl session of %s ended', self.base_dn)
+            # wakes up the constructor
+            self._ready.set()
+
+    def _sessions(self):
+        uri, bind_dn, pw = self._credentials
+        while not self._stopped.is_set():
+            try:
+                self._consumer = _Consumer(uri, self)
+                self._consumer.bind_s(bind_dn, pw)
+                self._session()
+            except ldap.SERVER_DOWN:
+                # resume with the cookie once the server is back
+                self._stopped.wait(1)
+                continue
+            finally:
+                if self._consumer is not None:
+                    try:
+                        self._consumer.unbind_s()
+                    except ldap.LDAPError:
+                        pass
+                    self._consumer = None
+            if self.mode == 'refreshOnly':
+                self._stopped.wait(self.interval)
+
+    def _session(self):
+        msgid = self._consumer.syncrepl_search(self.base_dn, SCOPE_SUBTREE,
+                                               mode=self.mode,
+                                               attrlist=['*'])
+        while not self._stopped.is_set():
+            try:
+                if not self._consumer.syncrepl_poll(msgid=msgid, timeout=1,
+                                                    all=1):
+                    # refreshOnly is done
+                    self._ready.set()
+                    return
+            except ldap.TIMEOUT:
+                continue
+        self._consumer.abandon(msgid)
+
+    def _uuids(self):
+        with self._lock:
+            return list(self._entries)
+
+    def _store(self, uuid, dn, attrs):
+        dn = DN(dn)
+        with self._lock:
+            old = self._entries.get(uuid)
+            if old is not None and old[0] != dn:
+                # renamed
+                self._by_dn.pop(old[0], None)
+            self._entries[uuid] = (dn, attrs)
+            self._by_dn[dn] = uuid
+            self.generation += 1
+
+    def _remove(self, uuids):
+        with self._lock:
+            for uuid in uuids:
+                entry = self._entries.pop(uuid, None)
+                if entry is not None:
+                    self._by_dn.pop(entry[0], None)
+            self.generation += 1
+
+    def _mirrored(self, dn):
+        with self._lock:
+            uuid = self._by_dn.get(DN(dn))
+            return uuid is not None and self._entries[uuid] or None
+
+    def _fetch(self, dn):
+        """apply the server's state of dn to the mirror
+        """
+        try:
+            entry = self._ldap.search_s(dn, SCOPE_BASE,
+                                        attrlist=['*', 'entryUUID'])[0]
+        except ldap.NO_SUCH_OBJECT:
+            with self._lock:
+                uuid = self._by_dn.get(DN(dn))
+            if uuid is not None:
+                self._remove([uuid])
+            return
+        attrs = entry[1]
+        uuid = None
+        for name in attrs.keys():
+            if name.lower() == 'entryuuid':
+                uuid = attrs.pop(name)[0]
+        if uuid is not None:
+            self._store(uuid, entry[0], attrs)
+
+    def _drop_below(self, dn):
+        base = rdns(dn)
+        with self._lock:
+            uuids = [uuid for uuid, entry in self._entries.items()
+                     if below(rdns(entry[0]), base)]
+        self._remove(uuids)
+
+    def _node(self, entry, attrlist=None):
+        dn, attrs = entry
+        return Node(name=dn, attrs=attrs, ldap=self._ldap, complete=True,
+                    directory=self)
+
+    def __contains__(self, dn):
+        return self._mirrored(dn) is not None
+
+    def __getitem__(self, dn):
+        entry = self._mirrored(dn)
+        if entry is None:
+            raise KeyError(dn)
+        return self._node(entry)
+
+    def _item(self, dn, attrlist=None):
+        return self[dn]
+
+    def _items(self):
+        with self._lock:
+            entries = self._entries.values()
+        return [entry for entry in entries if entry[0] != self._base]
+
+    def __iter__(self):
+        return (entry[0] for entry in self._items())
+
+    iterkeys = __iter__
+
+    def itervalues(self, attrlist=None):
+        return (self._node(entry) for entry in self._items())
+
+    def iteritems(self, attrlist=None):
+        return ((entry[0], self._node(entry)) for entry in self._items())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries) - (self._base in self._by_dn)
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def _first(self, base=None):
+        base = rdns(base or self.base_dn)
+        for dn in self:
+            parts = rdns(dn)
+            if len(parts) == len(base) + 1 and below(parts, base):
+                return dn
+        return None
+
+    def __setitem__(self, dn, node):
+        Directory.__setitem__(self, dn, node)
+        if self._batch is None:
+            self._fetch(dn)
+
+    def __delitem__(self, dn):
+        Directory.__delitem__(self, dn)
+        if self._batch is None:
+            self._fetch(dn)
+            self._drop_below(dn)
+
+    def clear(self):
+        Directory.clear(self)
+        if self._batch is None:
+            self._drop_below(self.base_dn)
@@ -0,0 +1,204 @@
+import ldap
+import logging
+import threading
+import time
+
+from collections import namedtuple
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# method of LDAPObject -> kind of operation counted
+OPERATIONS = {
+    'search': 'search', 'search_s': 'search', 'search_ext': 'search',
+    'search_ext_s': 'search',
+    'add': 'add', 'add_s': 'add', 'add_ext': 'add', 'add_ext_s': 'add',
+    'modify': 'modify', 'modify_s': 'modify', 'modify_ext': 'modify',
+    'modify_ext_s': 'modify',
+    'delete': 'delete', 'delete_s': 'delete', 'delete_ext': 'delete',
+    'delete_ext_s': 'delete',
+    'result': 'result', 'result3': 'result',
+    'abandon': 'abandon', 'whoami_s': 'whoami',
+    }
+
+# kinds whose first argument is not a dn
+UNTARGETED = ('result', 'abandon', 'whoami')
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5,
+           float('inf'))
+
+
+Operation = namedtuple('Operation',
+                       'kind method dn seconds entries bytes error')
+
+
+def _entries(value):
+    """the entries among the results of an operation
+    """
+    if isinstance(value, tuple):
+        # result() and result3(), (rtype, data, ...)
+        value = value[1]
+    if not isinstance(value, list):
+        return ()
+    return [x for x in value
+            if isinstance(x, tuple) and len(x) == 2 and
+            isinstance(x[1], dict)]
+
+
+def _bytes(entries):
+    """bytes of dns, attribute names and values of entries
+    """
+    return sum(len(dn) + sum(len(name) + sum(len(x) for x in values)
+                             for name, values in attrs.iteritems())
+               for dn, attrs in entries)
+
+
+class Histogram(object):
+    """Counts of latencies per bucket, see BUCKETS
+    """
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.
+
+    def add(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, q):
+        """upper bound of the bucket holding the q-th percentile
+        """
+        rank = self.count * q / 100.
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def summary(self):
+        return dict(count=self.count, total=self.total,
+                    buckets=zip(BUCKETS, self.counts),
+                    p50=self.percentile(50), p99=self.percentile(99))
+
+
+class Trace(list):
+    """Operations done within Stats.trace()
+    """
+    def count_kind(self, kind=None):
+        """number of operations of kind, of all for None
+        """
+        return sum(1 for x in self if kind is None or x.kind == kind)
+
+
+class Stats(object):
+    """Counters of the ldap operations of a directory
+
+    ``operations`` counts them by kind, ``entries`` and ``bytes`` the
+    search results returned, ``errors`` the ones failing, ``latency``
+    has a Histogram per kind. Each Operation is passed to the callables
+    in ``hooks``, e.g. to forward them to a metrics system; hooks
+    failing are logged, they do not fail the operation.
+
+    Synchronous operations are counted with the results they wait for,
+    asynchronous ones as sending the request and ``result`` calls
+    receiving something.
+    """
+    def __init__(self):
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}
+            self.entries = 0
+            self.bytes = 0
+            self.errors = 0
+            self.latency = {}
+
+    def record(self, op):
+        with self._lock:
+            self.operations[op.kind] = self.operations.get(op.kind, 0) + 1
+            self.entries += op.entries
+            self.bytes += op.bytes
+            if op.error is not None:
+                self.errors += 1
+            histogram = self.latency.get(op.kind)
+            if histogram is None:
+                histogram = self.latency[op.kind] = Histogram()
+            histogram.add(op.seconds)
+        for trace in getattr(self._local, 'traces', ()):
+            trace.append(op)
+        for hook in self.hooks:
+            try:
+                hook(op)
+            except Exception:
+                log.exception('stats hook %r failed', hook)
+
+    @contextmanager
+    def trace(self):
+        """list the operations done by this thread within the block
+        """
+        trace = Trace()
+        traces = self._local.__dict__.setdefault('traces', [])
+        traces.append(trace)
+        try:
+            yield trace
+        finally:
+            # traces are lists, compared by their operations
+            del traces[[x is trace for x in traces].index(True)]
+
+    def summary(self):
+        with self._lock:
+            return dict(operations=dict(self.operations),
+                        entries=self.entries, bytes=self.bytes,
+                        errors=self.errors,
+                        latency=dict((kind, histogram.summary())
+                                     for kind, histogram
+                                     in self.latency.iteritems()))
+
+
+class InstrumentedConnection(object):
+    """Connection recording its operations in Stats
+
+    Everything else is passed on.
+    """
+    def __init__(self, ldap, stats):
+        self._ldap = ldap
+        self.stats = stats
+
+    def __getattr__(self, name):
+        method = getattr(self._ldap, name)
+        kind = OPERATIONS.get(name)
+        if kind is None:
+            return method
+        def call(*args, **kw):
+            return self._call(kind, name, method, args, kw)
+        return call
+
+    def _call(self, kind, name, method, args, kw):
+        start = time.time()
+        try:
+            value = method(*args, **kw)
+        except ldap.LDAPError, e:
+            self._record(kind, name, args, kw, start, (), e)
+            raise
+        if kind == 'result' and value[0] is None:
+            # nothing there (yet), not worth counting
+            return value
+        self._record(kind, name, args, kw, start, _entries(value), None)
+        return value
+
+    def _record(self, kind, name, args, kw, start, entries, error):
+        dn = None
+        if kind not in UNTARGETED:
+            dn = args[0] if args else kw.get('base', kw.get('dn'))
+        self.stats.record(Operation(kind, name, dn, time.time() - start,
+                                    len(entries), _bytes(entries), error))
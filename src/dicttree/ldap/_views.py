@@ -2,8 +2,41 @@ import itertools
 import collections
 
 class DictView(object):
-    def __init__(self, dictionary):
+    """options are passed on to the dictionary's iterators
+
+    Subclasses provide _iter(), iterating the dictionary.
+
+    With ``snapshot`` the view is read once and all further operations
+    work on the local copy, until the dictionary's generation changes
+    (a Directory counts its writes) or refresh() is called.
+    ``generation`` is the one the copy was read at.
+    """
+    def __init__(self, dictionary, snapshot=False, **options):
         self.dictionary = dictionary
+        self.snapshot = snapshot
+        self.options = options
+        self.generation = None
+        self._data = None
+        self._members = None
+
+    def __iter__(self):
+        if self.snapshot:
+            return iter(self._materialize())
+        return self._iter()
+
+    def _materialize(self):
+        generation = getattr(self.dictionary, 'generation', None)
+        if self._data is None or generation != self.generation:
+            self.generation = generation
+            self._data = tuple(self._iter())
+            self._members = None
+        return self._data
+
+    def refresh(self):
+        """drop the local copy of a snapshot view
+        """
+        self._data = None
+        self._members = None
 
     def __contains__(self, other):
         for x in self:
@@ -12,15 +45,17 @@ class DictView(object):
         return False
 
     def __len__(self):
-        return sum(1 for x in iter(self))
+        if self.snapshot:
+            return len(self._materialize())
+        return len(self.dictionary)
 
     def __eq__(self, other):
+        # a single pass over both sides, no len() upfront
         if self is other:
             return True
-        if len(self) != len(other):
-            return False
-        for x, x2 in itertools.izip(self, other):
-            if x != x2:
+        missing = object()
+        for x, x2 in itertools.izip_longest(self, other, fillvalue=missing):
+            if x is missing or x2 is missing or x != x2:
                 return False
         return True
 
@@ -28,17 +63,156 @@ class DictView(object):
         return not self == other
 
 class DictViewSet(DictView, collections.Set):
+    """Membership is answered by the dictionary, comparisons and set
+    operations read the view once into a local snapshot.
+
+    Keys are compared as the dictionary's _key(key), if it has one,
+    e.g. dns in normalized form.
+    """
+    def _key(self, x):
+        key = getattr(self.dictionary, '_key', None)
+        if key is None:
+            return x
+        return key(x)
+
     def _from_iterable(self, iterable):
         return set(iterable)
 
-class ItemsView(DictViewSet):
+    def _snapshot(self, iterable):
+        if iterable is self and self.snapshot:
+            # read once per generation of a snapshot view
+            data = self._materialize()
+            if self._members is None:
+                self._members = self._read(data)
+            return self._members
+        return self._read(iterable)
+
+    def _read(self, iterable):
+        return frozenset(self._key(x) for x in iterable)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, collections.Iterable):
+            return False
+        try:
+            return self._snapshot(self) == self._snapshot(other)
+        except (TypeError, ValueError):
+            return False
+
+    def __and__(self, other):
+        if not isinstance(other, collections.Iterable):
+            return NotImplemented
+        snapshot = self._snapshot(self)
+        return self._from_iterable(x for x in (self._key(y) for y in other)
+                                   if x in snapshot)
+
+    __rand__ = __and__
+
+    def __or__(self, other):
+        if not isinstance(other, collections.Iterable):
+            return NotImplemented
+        return self._from_iterable(
+            self._key(x) for x in itertools.chain(self, other))
+
+    __ror__ = __or__
+
+    def __sub__(self, other):
+        if not isinstance(other, collections.Iterable):
+            return NotImplemented
+        snapshot = self._snapshot(other)
+        return self._from_iterable(x for x in self
+                                   if self._key(x) not in snapshot)
+
+    def __rsub__(self, other):
+        if not isinstance(other, collections.Iterable):
+            return NotImplemented
+        snapshot = self._snapshot(self)
+        return self._from_iterable(x for x in (self._key(y) for y in other)
+                                   if x not in snapshot)
+
+    def __xor__(self, other):
+        if not isinstance(other, collections.Iterable):
+            return NotImplemented
+        mine = self._snapshot(self)
+        theirs = self._snapshot(other)
+        return self._from_iterable(itertools.chain(
+                (x for x in mine if x not in theirs),
+                (x for x in theirs if x not in mine)))
+
+    __rxor__ = __xor__
+
+    def isdisjoint(self, other):
+        snapshot = self._snapshot(self)
+        return not any(self._key(x) in snapshot for x in other)
+
+class ItemsSnapshot(object):
+    """Items read into a dict, values need not be hashable
+    """
+    def __init__(self, items, key=None):
+        self.key = key or (lambda x: x)
+        self.items = dict((self.key(k), v) for k, v in items)
+
+    def __contains__(self, item):
+        try:
+            key, value = item
+        except (TypeError, ValueError):
+            return False
+        try:
+            return self.items[self.key(key)] == value
+        except (KeyError, TypeError):
+            return False
+
     def __iter__(self):
-        return self.dictionary.iteritems()
+        return self.items.iteritems()
+
+    def __eq__(self, other):
+        return self.items == other.items
+
+class ItemsView(DictViewSet):
+    def _iter(self):
+        return self.dictionary.iteritems(**self.options)
+
+    def __contains__(self, item):
+        if self.snapshot:
+            return item in self._snapshot(self)
+        try:
+            key, value = item
+        except (TypeError, ValueError):
+            return False
+        try:
+            return self._item(key) == value
+        except (KeyError, TypeError):
+            return False
+
+    def _item(self, key):
+        # the dictionary may hand out values for views differently
+        # than via __getitem__, e.g. a Directory without attributes
+        item = getattr(self.dictionary, '_item', None)
+        if item is None:
+            return self.dictionary[key]
+        return item(key, **self.options)
+
+    def _key(self, x):
+        # items are not keys
+        return x
+
+    def _read(self, iterable):
+        return ItemsSnapshot(iterable,
+                             key=getattr(self.dictionary, '_key', None))
 
 class KeysView(DictViewSet):
-    def __iter__(self):
+    def _iter(self):
         return iter(self.dictionary)
 
+    def __contains__(self, key):
+        if self.snapshot:
+            try:
+                return self._key(key) in self._snapshot(self)
+            except TypeError:
+                return False
+        return key in self.dictionary
+
 class ValuesView(DictView):
-    def __iter__(self):
-        return self.dictionary.itervalues()
+    def _iter(self):
+        return self.dictionary.itervalues(**self.options)
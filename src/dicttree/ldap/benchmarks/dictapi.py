@@ -0,0 +1,259 @@
+"""Timings of the dict API against a local slapd
+
+Usage: python -m dicttree.ldap.benchmarks.dictapi [SIZE...]
+       [--repeat=N] [--page-size=N] [--output=FILE]
+       [--baseline=FILE] [--tolerance=FRACTION] [--memory]
+
+Run from the checkout, like the tests: slapd is started via
+dicttree.ldap.testing.Server. For each size (default 1000 10000
+100000) a tree of that many entries below o=o is generated and loaded
+offline with slapadd, then each benchmark runs ``repeat`` (default 3)
+times and the fastest run counts.
+
+Results are printed as table and written as JSON to --output. With
+--baseline, a JSON written before, each result is compared to it and
+the exit status is 1 if any is slower by more than --tolerance
+(default 0.2, i.e. 20%).
+
+With --memory, there is no slapd: the tree is added to a
+MemoryConnection's store, timing the python layer alone.
+"""
+import json
+import os
+import random
+import sys
+import time
+
+from dicttree.ldap import Directory
+from dicttree.ldap import MemoryConnection
+from dicttree.ldap._memory import drop
+from dicttree.ldap._node import Node
+from dicttree.ldap.testing import Server
+
+SIZES = (1000, 10000, 100000)
+
+# entries touched by the per-entry benchmarks
+SAMPLE = 1000
+
+
+def dn(i):
+    return 'cn=e%d,o=o' % (i,)
+
+
+def attrs(i):
+    return (('cn', ['e%d' % i]),
+            ('description', ['entry %d' % i]),
+            ('objectClass', ['organizationalRole']))
+
+
+def write_ldif(path, size):
+    with open(path, 'w') as f:
+        f.write('dn: o=o\no: o\nobjectClass: organization\n\n')
+        for i in xrange(size):
+            f.write('dn: %s\n' % (dn(i),))
+            for name, values in attrs(i):
+                for value in values:
+                    f.write('%s: %s\n' % (name, value))
+            f.write('\n')
+
+
+# benchmarks are called with a fresh directory, the size of the tree
+# and a sample of its dns, and return the number of operations timed
+
+def getitem(directory, size, sample):
+    for x in sample:
+        directory[x]
+    return len(sample)
+
+def contains(directory, size, sample):
+    for x in sample:
+        x in directory
+        'cn=missing,o=o' in directory
+    return 2 * len(sample)
+
+def length(directory, size, sample):
+    len(directory)
+    return 1
+
+def keys(directory, size, sample):
+    for x in directory.keys():
+        pass
+    return size
+
+def values(directory, size, sample):
+    for x in directory.values():
+        pass
+    return size
+
+def items(directory, size, sample):
+    for x in directory.items():
+        pass
+    return size
+
+def items_attrlist(directory, size, sample):
+    for dn, node in directory.items(attrlist=['cn']):
+        node.attrs['cn']
+    return size
+
+def view_sets(directory, size, sample):
+    keys = directory.keys(snapshot=True)
+    keys & sample
+    keys - set(sample)
+    keys == directory.keys()
+    return 3
+
+def attrs_get(directory, size, sample):
+    for x in sample:
+        directory[x].attrs['cn']
+    return len(sample)
+
+def attrs_set(directory, size, sample):
+    for x in sample:
+        directory[x].attrs['description'] = 'changed'
+    return len(sample)
+
+def update(directory, size, sample):
+    directory.update((dn(i), Node(name=dn(i), attrs=attrs(i)))
+                     for i in xrange(size, size + len(sample)))
+    return len(sample)
+
+def update_batch(directory, size, sample):
+    with directory.batch():
+        update(directory, size + len(sample), sample)
+    return len(sample)
+
+def clear(directory, size, sample):
+    directory.clear()
+    return size
+
+# in order, clear runs last
+BENCHMARKS = (getitem, contains, length, keys, values, items,
+              items_attrlist, view_sets, attrs_get, attrs_set, update,
+              update_batch, clear)
+
+# benchmarks whose changes need to be undone between runs
+def _undo_update(directory, size, sample):
+    for i in xrange(size, size + 2 * len(sample)):
+        try:
+            del directory[dn(i)]
+        except KeyError:
+            pass
+
+UNDO = {update: _undo_update, update_batch: _undo_update}
+
+
+def run(size, repeat=3, page_size=None, tmpdir='var', memory=False):
+    """results of the benchmarks for a tree of size entries
+    """
+    if memory:
+        slapd = None
+        uri = 'memory://benchmark-%d' % (size,)
+        conn = MemoryConnection(uri)
+        conn.add_s('o=o', (('o', 'o'), ('objectClass', 'organization')))
+        for i in xrange(size):
+            conn.add_s(dn(i), attrs(i))
+        backend = MemoryConnection
+    else:
+        ldif = os.path.join(tmpdir, 'benchmark-%d.ldif' % (size,))
+        write_ldif(ldif, size)
+        slapd = Server(os.path.join(tmpdir, 'benchmark-%d-%d' % (
+                    size, os.getpid())), ldif=ldif)
+        slapd.start()
+        uri = slapd.uri
+        backend = None
+    results = {}
+    try:
+        rng = random.Random(size)
+        sample = [dn(i) for i in rng.sample(xrange(size), min(size, SAMPLE))]
+        for bench in BENCHMARKS:
+            best = None
+            for n in range(1 if bench is clear else repeat):
+                directory = Directory(uri=uri, base_dn='o=o',
+                                      bind_dn='cn=root,o=o', pw='secret',
+                                      page_size=page_size, backend=backend)
+                start = time.time()
+                count = bench(directory, size, sample)
+                seconds = time.time() - start
+                if best is None or seconds < best['seconds']:
+                    best = dict(seconds=seconds, count=count,
+                                per_op=seconds / max(count, 1),
+                                ldap=directory.stats.summary()['operations'])
+                undo = UNDO.get(bench)
+                if undo is not None:
+                    undo(directory, size, sample)
+            results[bench.__name__] = best
+    finally:
+        if slapd is None:
+            drop(uri)
+        else:
+            slapd.stop()
+            slapd.remove()
+            os.remove(ldif)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """(size, name, ratio) of the results slower than the baseline
+    """
+    slower = []
+    for size, benches in sorted(results.iteritems()):
+        for name, result in sorted(benches.iteritems()):
+            base = baseline.get(size, {}).get(name)
+            if not base or not base['seconds']:
+                continue
+            ratio = result['seconds'] / base['seconds']
+            if ratio > 1 + tolerance:
+                slower.append((size, name, ratio))
+    return slower
+
+
+def main(argv=sys.argv[1:]):
+    options = dict(repeat='3', tolerance='0.2')
+    sizes = []
+    for arg in argv:
+        if arg == '--memory':
+            options['memory'] = True
+        elif arg.startswith('--'):
+            try:
+                name, value = arg[2:].split('=', 1)
+            except ValueError:
+                sys.stderr.write(__doc__)
+                return 2
+            options[name.replace('-', '_')] = value
+        else:
+            sizes.append(int(arg))
+    if not os.path.isdir('var'):
+        os.mkdir('var')
+    page_size = options.get('page_size')
+    results = {}
+    print('%-8s %-16s %10s %8s %12s  %s' % (
+            'size', 'benchmark', 'seconds', 'count', 'us/op', 'ldap'))
+    for size in sizes or SIZES:
+        benches = results[str(size)] = run(
+            size, repeat=int(options['repeat']),
+            page_size=page_size and int(page_size),
+            memory=options.get('memory', False))
+        for bench in BENCHMARKS:
+            result = benches[bench.__name__]
+            print('%-8d %-16s %10.4f %8d %12.1f  %s' % (
+                    size, bench.__name__, result['seconds'],
+                    result['count'], result['per_op'] * 1e6,
+                    ' '.join('%s=%d' % x
+                             for x in sorted(result['ldap'].items()))))
+    if 'output' in options:
+        with open(options['output'], 'w') as f:
+            json.dump(dict(python=sys.version.split()[0], page_size=page_size,
+                           memory=options.get('memory', False),
+                           results=results), f, indent=2, sort_keys=True)
+    if 'baseline' in options:
+        with open(options['baseline']) as f:
+            baseline = json.load(f)['results']
+        slower = compare(results, baseline, float(options['tolerance']))
+        for size, name, ratio in slower:
+            print('slower than baseline: %s %s %.2fx' % (size, name, ratio))
+        return int(bool(slower))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Memory held by the nodes of a directory, with their attributes
+
+Usage: python -m dicttree.ldap.benchmarks.memory URI BIND_DN PW BASE_DN
+       [SIZE...] [--max-bytes-per-entry=N]
+
+For each size (default 10000 100000 1000000) a container below BASE_DN
+is filled with that many entries, unless it exists already, and the
+memory allocated by reading all its nodes, with all attributes, is
+reported. Containers filled by the benchmark are deleted afterwards,
+existing ones are kept. With --max-bytes-per-entry the exit status is
+1 if any size exceeds it.
+
+Memory is traced with tracemalloc where available (python 3). Python 2
+has no per-allocation tracing: only the growth of the maximum resident
+set size is reported, which is coarse, includes everything else the
+process allocates and is only meaningful for growing sizes within one
+run.
+"""
+import gc
+import resource
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from dicttree.ldap import Directory
+from dicttree.ldap._node import Node
+
+SIZES = (10000, 100000, 1000000)
+
+
+def populate(directory, size):
+    """dn of a container below base_dn holding size entries, and
+    whether it was created
+    """
+    dn = 'ou=memory%d,%s' % (size, directory.base_dn)
+    if dn in directory:
+        return dn, False
+    try:
+        with directory.batch(window=256):
+            directory[dn] = Node(name=dn, attrs=(
+                    ('ou', ['memory%d' % size]),
+                    ('objectClass', ['organizationalUnit'])))
+            for i in xrange(size):
+                entry = 'cn=e%d,%s' % (i, dn)
+                directory[entry] = Node(name=entry, attrs=(
+                        ('cn', ['e%d' % i]),
+                        ('objectClass', ['organizationalRole'])))
+    except:
+        # do not leave a partly filled container behind
+        if dn in directory:
+            del directory[dn]
+        raise
+    return dn, True
+
+
+def measure(directory):
+    """bytes allocated by the nodes with all attributes, seconds, entries
+    """
+    gc.collect()
+    start = time.time()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        values = list(directory.itervalues(attrlist=['*']))
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    else:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        values = list(directory.itervalues(attrlist=['*']))
+        allocated = 1024 * (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+    return allocated, time.time() - start, len(values)
+
+
+def main(argv=sys.argv[1:]):
+    limit = None
+    args = []
+    for arg in argv:
+        if arg.startswith('--max-bytes-per-entry='):
+            limit = int(arg.split('=', 1)[1])
+        else:
+            args.append(arg)
+    if len(args) < 4:
+        sys.stderr.write(__doc__)
+        return 2
+    uri, bind_dn, pw, base_dn = args[:4]
+    sizes = [int(x) for x in args[4:]] or SIZES
+    failed = False
+    if tracemalloc is None:
+        print('(no tracemalloc on python %d: bytes are the growth of the '
+              'maximum resident set size, not traced allocations)'
+              % sys.version_info[0])
+    print('%-10s %14s %10s %8s' % ('entries', 'bytes', 'per entry', 'seconds'))
+    directory = Directory(uri, base_dn, bind_dn, pw)
+    for size in sizes:
+        dn, created = populate(directory, size)
+        try:
+            allocated, seconds, count = measure(
+                Directory(uri, dn, bind_dn, pw))
+        finally:
+            if created:
+                del directory[dn]
+        per_entry = allocated // max(count, 1)
+        print('%-10d %14d %10d %8.2f' % (count, allocated, per_entry,
+                                         seconds))
+        if limit is not None and per_entry > limit:
+            failed = True
+    return int(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
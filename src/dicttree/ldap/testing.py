@@ -0,0 +1,275 @@
+"""slapd for tests
+
+Server runs a slapd whose data directory can be saved as named
+snapshot and restored without restarting it. Slapd is a unittest mixin
+on top of it, sharing one slapd between the tests of a process.
+
+Paths default to the ones of the dicttree.ldap checkout, relative to
+the current directory: nixenv/libexec/slapd, etc/openldap/slapd.conf
+with the ldif backend and the schemas in etc/openldap/schema.
+"""
+import itertools
+import ldap
+import os
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+import urllib
+
+from ldap.ldapobject import LDAPObject
+from multiprocessing.util import Finalize
+
+from dicttree.ldap import Directory
+from dicttree.ldap._memory import MemoryConnection
+from dicttree.ldap._memory import drop
+
+BASE_DN = 'o=o'
+BASE = (('o', 'o'), ('objectClass', 'organization'))
+BIND_DN = 'cn=root,o=o'
+PW = 'secret'
+
+
+class Server(object):
+    """A slapd process in basedir
+
+    With ``ldif``, that file is loaded offline (slapadd) before slapd
+    starts. The config's paths are relative to basedir.
+    """
+    def __init__(self, basedir, slapd='nixenv/libexec/slapd',
+                 conf='etc/openldap/slapd.conf', schema='etc/openldap/schema',
+                 ldif=None, bind_dn=BIND_DN, pw=PW):
+        self.basedir = basedir
+        self.datadir = os.path.join(basedir, 'data')
+        self.slapdbin = os.path.abspath(slapd)
+        self.slapdconf = os.path.abspath(conf)
+        self.schema = schema
+        self.ldif = ldif
+        self.bind_dn = bind_dn
+        self.pw = pw
+        self.uri = 'ldapi://' + \
+            urllib.quote(os.path.join(basedir, 'ldapi'), safe='')
+        self.loglevel = os.environ.get('SLAPD_LOGLEVEL', '0')
+        self.debug = bool(os.environ.get('DEBUG'))
+        self.process = None
+
+    def start(self):
+        os.mkdir(self.basedir)
+        os.mkdir(self.datadir)
+        shutil.copytree(self.schema, os.path.join(self.basedir, 'schema'))
+        if self.ldif is not None:
+            subprocess.check_call(
+                (self.slapdbin, "-T", "add", "-q",
+                 "-f", self.slapdconf,
+                 "-l", os.path.abspath(self.ldif)),
+                cwd=self.basedir)
+        debugflags = tuple(itertools.chain.from_iterable(
+                iter(('-d', x)) for x in self.loglevel.split(',')))
+        self.process = subprocess.Popen(
+            (self.slapdbin,
+             "-f", self.slapdconf,
+             "-s", "0",
+             "-h", "ldapi://ldapi") + debugflags,
+            cwd=self.basedir,
+            stdout=subprocess.PIPE if not self.debug else None,
+            stderr=subprocess.PIPE if not self.debug else None)
+        try:
+            self.connect().unbind_s()
+        except:
+            self.stop()
+            raise
+
+    def connect(self, timeout=10):
+        """a bound connection, waiting up to timeout seconds for slapd
+        """
+        deadline = time.time() + timeout
+        delay = 0.01
+        while True:
+            try:
+                conn = LDAPObject(self.uri)
+                conn.bind_s(self.bind_dn, self.pw)
+                return conn
+            except ldap.SERVER_DOWN:
+                if time.time() > deadline or self.process.poll() is not None:
+                    raise
+                time.sleep(delay)
+                delay = min(2 * delay, 0.2)
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+
+    def remove(self):
+        shutil.rmtree(self.basedir)
+
+    def _snapshot(self, name):
+        return os.path.join(self.basedir, 'snapshots', name)
+
+    def has_snapshot(self, name):
+        return os.path.isdir(self._snapshot(name))
+
+    def snapshot(self, name):
+        """save the data directory as name, while no writes are sent
+        """
+        path = self._snapshot(name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        shutil.copytree(self.datadir, path)
+
+    def restore(self, name):
+        """reset the data directory to snapshot name
+
+        slapd keeps running: the ldif backend reads the data directory
+        for each operation, it caches nothing.
+        """
+        path = self._snapshot(name)
+        for x in os.listdir(self.datadir):
+            x = os.path.join(self.datadir, x)
+            if os.path.isdir(x):
+                shutil.rmtree(x)
+            else:
+                os.remove(x)
+        for x in os.listdir(path):
+            if os.path.isdir(os.path.join(path, x)):
+                shutil.copytree(os.path.join(path, x),
+                                os.path.join(self.datadir, x))
+            else:
+                shutil.copy2(os.path.join(path, x), self.datadir)
+
+
+_shared = {}
+
+def shared():
+    """the Server shared by the tests of this process
+
+    It is started on first use, with the base dn saved as snapshot
+    'base', and stopped and removed at exit.
+    """
+    pid = os.getpid()
+    server = _shared.get(pid)
+    if server is None:
+        server = Server(os.path.join('var', 'slapd-%d' % (pid,)))
+        if os.path.isdir(server.basedir):
+            server.remove()
+        server.start()
+        conn = server.connect()
+        conn.add_s(BASE_DN, BASE)
+        conn.unbind_s()
+        server.snapshot('base')
+        _shared[pid] = server
+        # run at exit, unlike atexit also by multiprocessing workers
+        # (nose --processes), which leave via os._exit
+        Finalize(None, _shutdown, args=(server,), exitpriority=0)
+    return server
+
+def _shutdown(server):
+    server.stop()
+    if os.path.isdir(server.basedir):
+        server.remove()
+
+
+class Slapd(object):
+    """unittest mixin, a slapd holding the base dn and ENTRIES
+
+    Provides ``uri``, a bound connection ``ldap`` and ``dir``, the
+    Directory of the base dn.
+
+    By default (SHARED) the tests of a process share one slapd, before
+    each test its data is reset to a snapshot: the base dn and the
+    testcase's ENTRIES, added and saved for the first test of the
+    testcase and restored for the others. Testcases with SHARED off
+    or an ``LDIF`` file to load offline (including the base dn) get a
+    slapd of their own, per test. With MEMORY, there is no slapd: each
+    test gets a tree of its own in memory, see MemoryConnection.
+    """
+    SHARED = True
+    MEMORY = False
+
+    def setUp(self):
+        try:
+            self._setUp()
+        except Exception, e:
+            # XXX: working around nose to get immediate exception
+            # output, not collected after all tests are run
+            sys.stderr.write("""
+======================================================================
+Error setting up testcase: %s
+----------------------------------------------------------------------
+%s
+""" % (str(e), traceback.format_exc()))
+            self.tearDown()
+            raise e
+
+    def _setUp(self):
+        ldif = getattr(self, 'LDIF', None)
+        if self.MEMORY:
+            self.server = None
+            self.uri = 'memory://' + self.id()
+            self.ldap = MemoryConnection(self.uri)
+            self.ldap.bind_s(BIND_DN, PW)
+            self.ldap.add_s(BASE_DN, BASE)
+            self._add_entries()
+            self.dir = Directory(uri=self.uri, base_dn=BASE_DN,
+                                 bind_dn=BIND_DN, pw=PW,
+                                 backend=MemoryConnection)
+            return
+        if self.SHARED and ldif is None:
+            self.server = shared()
+            self.snapshot = '%s.%s' % (type(self).__module__,
+                                       type(self).__name__)
+            if self.server.has_snapshot(self.snapshot):
+                self.server.restore(self.snapshot)
+                self.ldap = self.server.connect()
+            else:
+                self.server.restore('base')
+                self.ldap = self.server.connect()
+                self._add_entries()
+                self.server.snapshot(self.snapshot)
+        else:
+            self.server = Server(os.path.join('var', self.id()), ldif=ldif)
+            self.server.start()
+            self.ldap = self.server.connect()
+            if ldif is None:
+                self.ldap.add_s(BASE_DN, BASE)
+            self._add_entries()
+        self.uri = self.server.uri
+        self.dir = Directory(uri=self.uri,
+                             base_dn=BASE_DN,
+                             bind_dn=BIND_DN,
+                             pw=PW)
+
+    def _add_entries(self):
+        msgids = [self.ldap.add(dn, self.ENTRIES[dn])
+                  for dn in getattr(self, 'ENTRIES', ())]
+        for id in msgids:
+            self.ldap.result(id)
+
+    def _disconnect(self):
+        """unbind the connections of the test, the server may live on
+        """
+        closing = []
+        if getattr(self, 'dir', None) is not None:
+            closing.append(self.dir.close)
+        if getattr(self, 'ldap', None) is not None:
+            closing.append(self.ldap.unbind_s)
+        for close in closing:
+            try:
+                close()
+            except ldap.LDAPError:
+                pass
+
+    def tearDown(self):
+        self._disconnect()
+        if self.MEMORY:
+            drop(getattr(self, 'uri', None))
+            return
+        server = getattr(self, 'server', None)
+        if server is None or server is _shared.get(os.getpid()):
+            return
+        server.stop()
+        successful = sys.exc_info() == (None, None, None)
+        if successful or not os.environ.get('KEEP_FAILED'):
+            server.remove()
@@ -0,0 +1,89 @@
+import unittest
+
+from dicttree.ldap._node import Node
+from dicttree.ldap.tests import mixins
+
+from dicttree.ldap._async import AsyncDirectory
+from dicttree.ldap._async import StopAsyncIteration
+from dicttree.ldap._async import asyncio
+
+
+class TestAsyncDirectory(mixins.Slapd, unittest.TestCase):
+    ENTRIES = dict(
+        ('cn=cn%d,o=o' % i, (('cn', ['cn%d' % i]),
+                             ('objectClass', ['organizationalRole'])))
+        for i in range(5))
+
+    def _setUp(self):
+        super(TestAsyncDirectory, self)._setUp()
+        self.loop = asyncio.new_event_loop()
+        self.adir = AsyncDirectory(uri=self.uri,
+                                   base_dn='o=o',
+                                   bind_dn='cn=root,o=o',
+                                   pw='secret',
+                                   loop=self.loop)
+
+    def tearDown(self):
+        if getattr(self, 'adir', None) is not None:
+            self.adir.close()
+            self.loop.close()
+        super(TestAsyncDirectory, self).tearDown()
+
+    def run_(self, future):
+        return self.loop.run_until_complete(future)
+
+    def collect(self, aiter):
+        result = []
+        while True:
+            try:
+                result.append(self.run_(aiter.next()))
+            except StopAsyncIteration:
+                return result
+
+    def test_many_in_flight(self):
+        futures = [self.adir.get(dn) for dn in sorted(self.ENTRIES)] * 20
+        nodes = self.run_(asyncio.gather(*futures))
+        self.assertEqual(100, len(nodes))
+        self.assertEqual(['cn4'], nodes[-1].attrs['cn'])
+
+    def test_get_contains_delete(self):
+        self.assertTrue(self.run_(self.adir.contains('cn=cn0,o=o')))
+        self.assertFalse(self.run_(self.adir.contains('cn=foo,o=o')))
+        self.assertRaises(KeyError, self.run_, self.adir.get('cn=foo,o=o'))
+        self.run_(self.adir.delete('cn=cn0,o=o'))
+        self.assertFalse(self.run_(self.adir.contains('cn=cn0,o=o')))
+        self.assertRaises(KeyError, self.run_,
+                          self.adir.delete('cn=cn0,o=o'))
+
+    def test_set(self):
+        node = Node(name='cn=cn1,o=o',
+                    attrs=(('cn', ['cn1']), ('description', ['new']),
+                           ('objectClass', ['organizationalRole'])))
+        self.run_(self.adir.set('cn=cn1,o=o', node))
+        new = self.run_(self.adir.get('cn=cn1,o=o'))
+        self.assertEqual(['new'], new.attrs['description'])
+
+    def test_iteration(self):
+        self.assertEqual(sorted(self.ENTRIES),
+                         sorted(self.collect(self.adir.keys())))
+        nodes = self.collect(self.adir.values())
+        self.assertEqual(sorted(self.ENTRIES),
+                         sorted(node.name for node in nodes))
+        items = dict(self.collect(self.adir.items()))
+        self.assertEqual(['cn2'], items['cn=cn2,o=o'].attrs['cn'])
+        self.assertEqual(5, self.run_(self.adir.count()))
+
+    def test_fetch(self):
+        keys = self.adir.keys()
+        first = self.run_(keys.next())
+        rest = self.run_(keys.fetch())
+        self.assertEqual(sorted(self.ENTRIES), sorted([first] + rest))
+        self.assertEqual([], self.run_(keys.fetch()))
+
+    def test_attrs(self):
+        attrs = self.adir.attrs('cn=cn3,o=o')
+        self.assertEqual(['cn3'], self.run_(attrs.get('cn')))
+        self.run_(attrs.set('description', 'abc'))
+        self.assertEqual(['abc'], self.run_(attrs.get('description')))
+        self.run_(attrs.delete('description'))
+        self.assertRaises(KeyError, self.run_, attrs.get('description'))
@@ -0,0 +1,121 @@
+import time
+import unittest
+
+from ldap import SCOPE_BASE
+from ldap import SCOPE_ONELEVEL
+from ldap import SCOPE_SUBTREE
+
+from dicttree.ldap import Directory
+from dicttree.ldap._cache import SearchCache
+from dicttree.ldap._node import Node
+from dicttree.ldap.tests import mixins
+
+
+def result(dn):
+    return [(dn, {'cn': ['x']})]
+
+
+class TestSearchCache(unittest.TestCase):
+    def test_lru(self):
+        cache = SearchCache(size=2)
+        cache.put(('cn=a,o=o', SCOPE_BASE), result('cn=a,o=o'))
+        cache.put(('cn=b,o=o', SCOPE_BASE), result('cn=b,o=o'))
+        self.assertEqual((True, result('cn=a,o=o')),
+                         cache.get(('cn=a,o=o', SCOPE_BASE)))
+        cache.put(('cn=c,o=o', SCOPE_BASE), result('cn=c,o=o'))
+        self.assertEqual((False, None), cache.get(('cn=b,o=o', SCOPE_BASE)))
+        self.assertEqual(dict(hits=1, misses=1, evictions=1,
+                              invalidations=0, entries=2,
+                              bytes=cache.stats()['bytes']), cache.stats())
+
+    def test_ttl_and_bytes(self):
+        cache = SearchCache(ttl=0.01, max_bytes=1000)
+        cache.put(('o=o', SCOPE_BASE), result('o=o'))
+        cache.put(('o=p', SCOPE_BASE), [('o=p', {'cn': ['x' * 1000]})])
+        self.assertEqual((False, None), cache.get(('o=p', SCOPE_BASE)))
+        time.sleep(0.02)
+        self.assertEqual((False, None), cache.get(('o=o', SCOPE_BASE)))
+        self.assertEqual(0, cache.stats()['bytes'])
+
+    def test_copies(self):
+        cache = SearchCache()
+        cache.put(('o=o', SCOPE_BASE), result('o=o'))
+        cache.get(('o=o', SCOPE_BASE))[1][0][1]['cn'].append('y')
+        self.assertEqual(result('o=o'), cache.get(('o=o', SCOPE_BASE))[1])
+
+    def test_invalidate(self):
+        cache = SearchCache()
+        keys = [('cn=a,cn=b,o=o', SCOPE_BASE), ('cn=b,o=o', SCOPE_ONELEVEL),
+                ('o=o', SCOPE_SUBTREE), ('cn=c,o=o', SCOPE_BASE),
+                ('cn=x,cn=a,cn=b,o=o', SCOPE_BASE)]
+        for key in keys:
+            cache.put(key, result(key[0]))
+        cache.invalidate('CN=a, cn=b,o=o')
+        self.assertEqual([False, False, False, True, True],
+                         [cache.get(key)[0] for key in keys])
+        cache.invalidate('cn=a,cn=b,o=o', subtree=True)
+        self.assertEqual((False, None), cache.get(keys[-1]))
+
+
+class TestCachedDirectory(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def _setUp(self):
+        super(TestCachedDirectory, self)._setUp()
+        self.dir.close()
+        self.dir = Directory(uri=self.uri,
+                             base_dn='o=o',
+                             bind_dn='cn=root,o=o',
+                             pw='secret',
+                             cache=dict(size=100, ttl=None))
+
+    def test_lookups(self):
+        self.assertEqual(['cn0'], self.dir['cn=cn0,o=o'].attrs['cn'])
+        self.assertTrue('cn=cn1,o=o' in self.dir)
+        self.assertFalse('cn=x,o=o' in self.dir)
+        self.assertEqual(2, len(self.dir))
+        # others' writes are not seen
+        self.ldap.delete_s('cn=cn1,o=o')
+        self.ldap.add_s('cn=x,o=o', self.ENTRIES['cn=cn0,o=o'])
+        hits = self.dir.cache.hits
+        self.assertEqual(['cn0'], self.dir['cn=cn0,o=o'].attrs['cn'])
+        self.assertTrue('cn=cn1,o=o' in self.dir)
+        self.assertFalse('cn=x,o=o' in self.dir)
+        self.assertEqual(2, len(self.dir))
+        self.assertEqual(hits + 4, self.dir.cache.hits)
+        self.dir.invalidate()
+        self.assertFalse('cn=cn1,o=o' in self.dir)
+        self.assertTrue('cn=x,o=o' in self.dir)
+
+    def test_large_results(self):
+        directory = Directory(uri=self.uri, base_dn='o=o',
+                              bind_dn='cn=root,o=o', pw='secret',
+                              cache=dict(max_bytes=600, ttl=None),
+                              backend=self.dir._backend)
+        self.addCleanup(directory.close)
+        self.assertEqual(2, len([x for x in directory.values(attrlist=['*'])]))
+        # larger than the cache, not kept
+        self.assertEqual(0, directory.cache.stats()['entries'])
+        directory['cn=cn0,o=o']
+        self.assertEqual(1, directory.cache.stats()['entries'])
+
+    def test_writes(self):
+        dn = 'cn=cn2,o=o'
+        self.assertFalse(dn in self.dir)
+        self.assertEqual(2, len(self.dir))
+        self.dir[dn] = Node(name=dn, attrs=(
+                ('cn', ['cn2']), ('objectClass', ['organizationalRole'])))
+        self.assertTrue(dn in self.dir)
+        self.assertEqual(3, len(self.dir))
+        self.dir[dn].attrs['description'] = 'abc'
+        self.assertEqual(['abc'], self.dir[dn].attrs['description'])
+        with self.dir.batch():
+            del self.dir['cn=cn0,o=o']
+        self.assertRaises(KeyError, self.dir.__getitem__, 'cn=cn0,o=o')
+        self.assertItemsEqual(['cn=cn1,o=o', dn], self.dir)
+        self.assertTrue(self.dir.cache.invalidations > 0)
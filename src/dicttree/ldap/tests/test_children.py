@@ -0,0 +1,53 @@
+import unittest
+
+from dicttree.ldap._node import Node
+from dicttree.ldap.tests import mixins
+
+
+class TestChildren(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+    SUBENTRIES = {
+        'cn=sub0,cn=cn0,o=o': (('cn', ['sub0']),
+                               ('objectClass', ['organizationalRole'])),
+        'cn=deep,cn=sub0,cn=cn0,o=o': (
+            ('cn', ['deep']), ('objectClass', ['organizationalRole'])),
+        }
+
+    def _setUp(self):
+        super(TestChildren, self)._setUp()
+        for dn in sorted(self.SUBENTRIES, key=len):
+            self.ldap.add_s(dn, self.SUBENTRIES[dn])
+
+    def test_children(self):
+        children = self.dir.children()
+        self.assertItemsEqual(self.ENTRIES, children)
+        self.assertEqual(2, len(children))
+        self.assertTrue('cn=cn0,o=o' in children)
+        self.assertFalse('cn=sub0,cn=cn0,o=o' in children)
+        self.assertFalse('o=o' in children)
+        self.assertEqual(['cn=sub0,cn=cn0,o=o'],
+                         list(self.dir.children('cn=cn0,o=o')))
+        self.assertFalse(self.dir.children('cn=cn1,o=o'))
+
+    def test_hints(self):
+        nodes = dict((node.name, node)
+                     for node in self.dir.children().values())
+        self.assertTrue(nodes['cn=cn0,o=o'].has_children)
+        self.assertFalse(nodes['cn=cn1,o=o'].has_children)
+        # hints are no attributes
+        self.assertFalse('hasSubordinates' in nodes['cn=cn1,o=o'].attrs)
+        self.assertEqual(['cn1'], nodes['cn=cn1,o=o'].attrs['cn'])
+
+    def test_node_children(self):
+        node = self.dir['cn=cn0,o=o']
+        sub = node.children()['cn=sub0,cn=cn0,o=o']
+        self.assertEqual(['sub0'], sub.attrs['cn'])
+        self.assertTrue(sub.has_children)
+        self.assertEqual(['cn=deep,cn=sub0,cn=cn0,o=o'],
+                         list(sub.children()))
+        self.assertEqual({}, Node(name='cn=x').children())
@@ -0,0 +1,56 @@
+import unittest
+
+from dicttree.ldap._dn import DN
+from dicttree.ldap._dn import LRU
+from dicttree.ldap._dn import normalize
+from dicttree.ldap._dn import rdns
+from dicttree.ldap.tests import mixins
+
+
+class TestDN(unittest.TestCase):
+    def test_normalize(self):
+        self.assertEqual('cn=a,o=o', normalize('CN=A, o=o'))
+        self.assertEqual('cn=a+sn=b,o=o', normalize('sn=b+cn=a,o=o'))
+        self.assertEqual(('cn=a', 'o=o'), rdns(DN('cn=A , O=o')))
+
+    def test_dn(self):
+        dn = DN('CN=cn0, o=o')
+        self.assertEqual('CN=cn0, o=o', str(dn))
+        self.assertEqual(dn, 'cn=cn0,o=o')
+        self.assertFalse(dn != 'cn=cn0,o=o')
+        self.assertNotEqual(dn, 'cn=cn1,o=o')
+        self.assertEqual(hash(dn), hash('cn=cn0,o=o'))
+        self.assertTrue(DN(dn) is dn)
+        self.assertTrue('cn=cn0,o=o' in set([dn]))
+
+    def test_lru(self):
+        calls = []
+        def func(x):
+            calls.append(x)
+            return x * 2
+        lru = LRU(func, size=2)
+        self.assertEqual([2, 4, 2, 6, 2, 4], map(lru, [1, 2, 1, 3, 1, 2]))
+        # 2 was evicted by 3, 1 was used recently
+        self.assertEqual([1, 2, 3, 2], calls)
+
+
+class TestDirectoryDN(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_keys(self):
+        self.assertTrue('CN=cn0, o=o' in self.dir)
+        self.assertTrue('CN=cn0, O=O' in self.dir.keys())
+        self.assertEqual(set(['CN=cn0,o=o', 'cn=CN1,o=o']), self.dir.keys())
+        self.assertEqual(set(), self.dir.keys() - ['CN=cn0,o=o',
+                                                   'cn=cn1, o=o'])
+        self.assertEqual(2, len(self.dir.keys() | ['CN=cn0,o=o']))
+        self.assertEqual(set(['cn=cn1,o=o']),
+                         self.dir.keys() & ['CN=CN1,O=O', 'cn=x,o=o'])
+        node = self.dir['cn=cn0,o=o']
+        self.assertTrue(('CN=cn0,o=o', node) in self.dir.items(['*']))
+        self.assertTrue('CN=cn1,o=o' in self.dir.children())
@@ -0,0 +1,85 @@
+import unittest
+
+from dicttree.ldap import Filter
+from dicttree.ldap.tests import mixins
+
+
+class TestFilter(unittest.TestCase):
+    def test_lookups(self):
+        self.assertEqual('(objectClass=*)', str(Filter()))
+        self.assertEqual('(cn=a)', str(Filter(cn='a')))
+        self.assertEqual('(&(mail=*@x.org)(objectClass=person))',
+                         str(Filter(objectClass='person',
+                                    mail__endswith='@x.org')))
+        self.assertEqual('(|(cn=a)(cn=b))', str(Filter(cn__in=['a', 'b'])))
+        self.assertEqual('(!(cn=*))', str(Filter(cn__present=False)))
+        self.assertEqual('(uid>=5)', str(Filter(uid__gte='5')))
+        self.assertRaises(ValueError, Filter, cn__like='a')
+
+    def test_escaping(self):
+        self.assertEqual(r'(cn=a\2a\28b\29\5c)', str(Filter(cn='a*(b)\\')))
+        self.assertEqual(r'(cn=*\2a*)', str(Filter(cn__contains='*')))
+
+    def test_compose(self):
+        a = Filter(cn='a')
+        b = Filter('(sn=b)')
+        self.assertEqual('(&(cn=a)(sn=b))', str(a & b))
+        self.assertEqual('(|(cn=a)(sn=b))', str(a | b))
+        self.assertEqual('(!(cn=a))', str(~a))
+        self.assertEqual(Filter(cn='a'), a)
+
+    def test_unparenthesized(self):
+        self.assertEqual('(uid=a)', str(Filter('uid=a')))
+        self.assertEqual('(&(uid=a)(cn=b))', str(Filter('uid=a', cn='b')))
+        self.assertEqual('(|(a=b)(c=d))', str(Filter('a=b') | 'c=d'))
+        self.assertEqual('(&(a=b)(c=d))', str(Filter('a=b') & 'c=d'))
+
+    def test_values(self):
+        self.assertEqual('(uidNumber=5)', str(Filter(uidNumber=5)))
+        self.assertEqual('(uidNumber>=1000)',
+                         str(Filter(uidNumber__gte=1000)))
+        self.assertEqual('(|(uidNumber=1)(uidNumber=2))',
+                         str(Filter(uidNumber__in=[1, 2])))
+        self.assertEqual('(!(uidNumber=0))', str(Filter(uidNumber__ne=0)))
+        self.assertEqual('(|(cn=abc))', str(Filter(cn__in='abc')))
+
+
+class TestQuery(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']), ('description', ['a*']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']), ('description', ['b']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=other,o=o': (('cn', ['other']),
+                         ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_query(self):
+        query = self.dir.filter(cn__startswith='cn')
+        self.assertItemsEqual(['cn=cn0,o=o', 'cn=cn1,o=o'], query)
+        self.assertEqual(2, len(query))
+        self.assertTrue(query)
+        self.assertTrue('cn=cn0,o=o' in query)
+        self.assertFalse('cn=other,o=o' in query)
+        self.assertFalse('o=o' in query)
+        self.assertEqual(self.dir['cn=cn1,o=o'], query['cn=cn1,o=o'])
+        self.assertRaises(KeyError, query.__getitem__, 'cn=other,o=o')
+        self.assertFalse(self.dir.filter(cn='nothing'))
+
+    def test_escaped_value(self):
+        query = self.dir.filter(description='a*')
+        self.assertEqual(['cn=cn0,o=o'], list(query))
+        self.assertEqual(['cn=cn0,o=o'], list(
+                self.dir.filter(Filter(description='b') | Filter(cn='cn0'))
+                .filter(~Filter(description='b'))))
+
+    def test_views(self):
+        query = self.dir.filter(description__present=True)
+        self.assertEqual(set(['cn=cn0,o=o', 'cn=cn1,o=o']), query.keys())
+        values = dict((node.name, node) for node in
+                      query.values(attrlist=['description']))
+        self.assertEqual(['b'], values['cn=cn1,o=o'].attrs['description'])
+        items = query.items(attrlist=['*'])
+        self.assertTrue(('cn=cn1,o=o', self.dir['cn=cn1,o=o']) in items)
+        self.assertFalse(('cn=other,o=o', self.dir['cn=other,o=o'])
+                         in items)
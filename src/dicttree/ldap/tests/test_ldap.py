@@ -1,6 +1,8 @@
 import ldap
 import unittest
 
+from dicttree.ldap import BatchError
+from dicttree.ldap import Directory
 from dicttree.ldap._node import Node
 from dicttree.ldap.tests import mixins
 
@@ -56,6 +58,37 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         addexisting()
         self.assertEquals(node2, self.dir[dn2])
 
+    def test_setitem_existing(self):
+        dn = 'cn=cn0,o=o'
+        self.ldap.add_s('cn=sub,' + dn, (('cn', ['sub']),
+                                         ('objectClass', ['organizationalRole'])))
+        generation = self.dir.generation
+        self.dir[dn] = Node(name=dn, attrs=self.ENTRIES[dn])
+        self.assertEqual(generation, self.dir.generation)
+        attrs = dict(self.ENTRIES[dn], description=['changed'])
+        self.dir[dn] = Node(name=dn, attrs=attrs)
+        self.assertEqual(['changed'], self.dir[dn].attrs['description'])
+        # modified in place, the entry below is kept
+        self.assertTrue('cn=sub,' + dn in self.dir)
+
+    def test_setitem_reclassify_nonleaf(self):
+        dn = 'cn=cn0,o=o'
+        self.ldap.add_s('cn=sub,' + dn, (('cn', ['sub']),
+                                         ('objectClass', ['organizationalRole'])))
+        node = Node(name=dn, attrs={'objectClass': ['applicationProcess'],
+                                    'cn': ['cn0']})
+        def reclassify():
+            self.dir[dn] = node
+        self.assertRaises(ldap.NOT_ALLOWED_ON_NONLEAF, reclassify)
+        self.assertTrue('cn=sub,' + dn in self.dir)
+        self.assertItemsEqual(self.ENTRIES[dn], self.dir[dn].attrs.items())
+
+    def test_setitem_new(self):
+        dn = 'cn=cn2,o=o'
+        with self.dir.trace() as trace:
+            self.dir[dn] = Node(name=dn, attrs=self.ADDITIONAL[dn])
+        self.assertEqual(['add'], [x.kind for x in trace])
+
     def test_delitem(self):
         def delete():
             del self.dir['cn=cn0,o=o']
@@ -67,6 +100,14 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         self.assertRaises(KeyError, delete)
         self.assertRaises(ldap.NO_SUCH_OBJECT, search_deleted)
 
+    def test_delitem_subtree(self):
+        for dn in ('cn=cn2,cn=cn0,o=o', 'cn=cn3,cn=cn2,cn=cn0,o=o',
+                   'cn=cn4,cn=cn0,o=o'):
+            self.ldap.add_s(dn, (('cn', [dn[3:6]]),
+                                 ('objectClass', ['organizationalRole'])))
+        del self.dir['cn=cn0,o=o']
+        self.assertItemsEqual(['cn=cn1,o=o'], self.dir)
+
     def test_iter(self):
         self.assertItemsEqual(self.ENTRIES.keys(), self.dir)
 
@@ -82,6 +123,27 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         self.assertItemsEqual(self.ENTRIES.keys(),
                               (node.name for node in self.dir.values()))
 
+    def test_values_attrlist(self):
+        nodes = dict((node.name, node) for node in
+                     self.dir.values(attrlist=['cn']))
+        self.assertItemsEqual(self.ENTRIES.keys(), nodes)
+        self.ldap.modify_s('cn=cn0,o=o', [(ldap.MOD_ADD, 'cn', 'x'),
+                                          (ldap.MOD_ADD, 'description',
+                                           'abc')])
+        # cn was fetched by the search, anything else fetches the entry
+        node = nodes['cn=cn0,o=o']
+        self.assertEqual(['cn0'], node.attrs['cn'])
+        self.assertEqual(['abc'], node.attrs['description'])
+        self.assertEqual(['cn0', 'x'], node.attrs['cn'])
+        node = self.dir.values(attrlist=['*']).__iter__().next()
+        self.assertEqual(['organizationalRole'], node.attrs['objectClass'])
+
+    def test_items_attrlist(self):
+        items = self.dir.items(attrlist=['*'])
+        for dn, node in items:
+            self.assertEqual(self.dir[dn], node)
+            self.assertTrue((dn, node) in items)
+
     def test_len(self):
         def delete():
             del self.dir['cn=cn0,o=o']
@@ -103,6 +165,19 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         addnode2()
         self.assertTrue(len(self.ENTRIES) < len(self.dir))
 
+    def test_nonzero(self):
+        self.assertTrue(self.dir)
+        del self.dir['cn=cn0,o=o']
+        self.assertTrue(self.dir)
+        del self.dir['cn=cn1,o=o']
+        self.assertFalse(self.dir)
+
+    def test_len_count_attr(self):
+        # slapd does not provide a count attribute, len() falls back
+        # to counting the results of a search
+        self.dir.count_attr = 'numAllSubordinates'
+        self.assertEqual(len(self.ENTRIES), len(self.dir))
+
     def test_clear(self):
         self.assertItemsEqual(self.ENTRIES.keys(), self.dir)
         self.dir.clear()
@@ -111,6 +186,61 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
             [('o=o', {})],
             self.ldap.search_s('o=o', ldap.SCOPE_BASE, attrlist=['']))
 
+    def test_batch(self):
+        dn2 = 'cn=cn2,o=o'
+        dn3 = 'cn=cn3,cn=cn2,o=o'
+        node2 = Node(name=dn2, attrs=self.ADDITIONAL[dn2])
+        node3 = Node(name=dn3, attrs={'objectClass': ['organizationalRole'],
+                                      'cn': ['cn3']})
+        node0 = Node(name='cn=cn0,o=o',
+                     attrs={'objectClass': ['applicationProcess'],
+                            'cn': ['cn0']})
+        with self.dir.batch(window=2) as batch:
+            # the child is only sent once its parent exists
+            self.dir[dn2] = node2
+            self.dir[dn3] = node3
+            # existing entries are replaced
+            self.dir.update([(node0.name, node0)])
+            del self.dir['cn=cn1,o=o']
+            batch.modify(dn2, [(ldap.MOD_REPLACE, 'description', 'abc')])
+        self.assertItemsEqual(['cn=cn0,o=o', dn2, dn3], self.dir)
+        self.assertEqual(node0, self.dir['cn=cn0,o=o'])
+        self.assertEqual(['abc'], self.dir[dn2].attrs['description'])
+
+    def test_batch_delete_subtree(self):
+        for dn in ('cn=cn2,cn=cn0,o=o', 'cn=cn3,cn=cn2,cn=cn0,o=o'):
+            self.ldap.add_s(dn, (('cn', [dn[3:6]]),
+                                 ('objectClass', ['organizationalRole'])))
+        with self.dir.batch():
+            self.dir['cn=cn4,cn=cn0,o=o'] = Node(attrs={
+                    'objectClass': ['organizationalRole'], 'cn': ['cn4']})
+            del self.dir['cn=cn0,o=o']
+        self.assertItemsEqual(['cn=cn1,o=o'], self.dir)
+
+    def test_batch_errors(self):
+        dn2 = 'cn=cn2,o=o'
+        def run():
+            with self.dir.batch():
+                del self.dir['cn=fail,o=o']
+                self.dir[dn2] = Node(name=dn2, attrs=self.ADDITIONAL[dn2])
+        try:
+            run()
+        except BatchError, e:
+            self.assertEqual(['cn=fail,o=o'], e.errors.keys())
+            self.assertTrue(isinstance(e.errors['cn=fail,o=o'],
+                                       ldap.NO_SUCH_OBJECT))
+        else:
+            self.fail('BatchError not raised')
+        self.assertTrue(dn2 in self.dir)
+
+    def test_clear_subtree(self):
+        for dn in ('cn=cn2,cn=cn0,o=o', 'cn=cn3,cn=cn2,cn=cn0,o=o'):
+            self.ldap.add_s(dn, (('cn', [dn[3:6]]),
+                                 ('objectClass', ['organizationalRole'])))
+        self.dir.clear()
+        self.assertEqual(0, len(self.dir))
+        self.assertTrue(self.ldap.search_s('o=o', ldap.SCOPE_BASE))
+
     def test_copy(self):
         dn = 'cn=cn0,o=o'
         copy = self.dir.copy()
@@ -147,6 +277,14 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         self.assertTrue(nodeTupel[0] in self.ENTRIES.keys())
         self.assertRaises(KeyError, lambda: self.dir.popitem())
 
+    def test_popitem_leaf(self):
+        dn = 'cn=cn2,cn=cn0,o=o'
+        self.ldap.add_s(dn, (('cn', ['cn2']),
+                             ('objectClass', ['organizationalRole'])))
+        self.ldap.delete_s('cn=cn1,o=o')
+        self.assertEqual(dn, self.dir.popitem()[0])
+        self.assertItemsEqual(['cn=cn0,o=o'], self.dir)
+
     def test_setdefault(self):
         dn = 'cn=cn0,o=o'
         dn2 = 'cn=cn2,o=o'
@@ -175,3 +313,24 @@ class TestLDAPDirectory(mixins.Slapd, unittest.TestCase):
         self.assertEqual(node, self.dir[dn])
         self.assertEqual(None, self.dir.update(itemList))
         self.assertEqual(node2, self.dir[dn2])
+
+
+class TestPagedLDAPDirectory(TestLDAPDirectory):
+    """The directory tests again, with one entry per page
+    """
+    def _setUp(self):
+        super(TestPagedLDAPDirectory, self)._setUp()
+        self.dir.close()
+        self.dir = Directory(uri=self.uri,
+                             base_dn='o=o',
+                             bind_dn='cn=root,o=o',
+                             pw='secret',
+                             page_size=1,
+                             backend=self.dir._backend)
+
+    def test_paged_iter(self):
+        dn = 'cn=cn2,o=o'
+        self.ldap.add_s(dn, self.ADDITIONAL[dn])
+        keys = self.ENTRIES.keys() + [dn]
+        self.assertItemsEqual(keys, self.dir)
+        self.assertItemsEqual(keys, (node.name for node in self.dir.values()))
@@ -1,5 +1,7 @@
 import unittest
 
+from ldap import MOD_ADD
+from ldap import SCOPE_BASE
 from ldap import UNDEFINED_TYPE
 from ldap import PROTOCOL_ERROR
 
@@ -52,9 +54,69 @@ class TestNodeAttrs(mixins.Slapd, unittest.TestCase):
         node.attrs['description'] = 'aaa'
         self.assertEqual(node.attrs['description'], ['aaa'])
 
+    def test_fetch_once(self):
+        node = iter(self.dir.values()).next()
+        self.assertEqual([node.name.split(',')[0][3:]], node.attrs['cn'])
+        # changes by others are not seen until refresh
+        self.ldap.modify_s(node.name, [(MOD_ADD, 'description', 'abc')])
+        self.assertFalse('description' in node.attrs)
+        self.assertEqual(2, len(node.attrs))
+        node.attrs.refresh()
+        self.assertEqual(['abc'], node.attrs['description'])
+
+    def test_local_copy_follows_writes(self):
+        node = self.dir['cn=cn0,o=o']
+        node.attrs['description'] = ['abc', 'def']
+        self.assertEqual(['abc', 'def'], node.attrs['description'])
+        del node.attrs['description']
+        self.assertFalse('description' in node.attrs)
+        node.attrs['description'] = 'abc'
+        node.attrs.refresh()
+        self.assertEqual(['abc'], node.attrs['description'])
+
+    def test_edit(self):
+        def server():
+            return self.ldap.search_s('cn=cn0,o=o', SCOPE_BASE)[0][1]
+
+        node = self.dir['cn=cn0,o=o']
+        with node.attrs.edit() as attrs:
+            attrs['description'] = 'abc'
+            attrs.update({'description': ['def'], 'ou': 'ou0'})
+            del attrs['ou']
+            attrs.setdefault('seeAlso', 'cn=cn1,o=o')
+            self.assertEqual(['def'], attrs['description'])
+            self.assertFalse('description' in server())
+        self.assertEqual(['def'], server()['description'])
+        self.assertEqual(['cn=cn1,o=o'], server()['seeAlso'])
+        self.assertFalse('ou' in server())
+        node.attrs.refresh()
+        self.assertItemsEqual(['objectClass', 'cn', 'description', 'seeAlso'],
+                              node.attrs)
+
+    def test_edit_error(self):
+        node = self.dir['cn=cn0,o=o']
+        def fail():
+            with node.attrs.edit() as attrs:
+                attrs['description'] = 'abc'
+                raise ValueError
+        self.assertRaises(ValueError, fail)
+        self.assertFalse('description' in node.attrs)
+
     def test_equal(self):
-        pass
-        #XXX create test after implementing items method
+        node = [x for x in self.dir.values() if x.name == 'cn=cn0,o=o'][0]
+        self.assertEqual(self.dir['cn=cn0,o=o'].attrs, node.attrs)
+        self.assertNotEqual(self.dir['cn=cn1,o=o'].attrs, node.attrs)
+
+    def test_write_unfetched(self):
+        node = iter(self.dir.values()).next()
+        with self.dir.trace() as trace:
+            node.attrs['description'] = 'abc'
+            self.assertEqual(['abc'], node.attrs['description'])
+            node.attrs.update({'seeAlso': 'cn=cn1,o=o'})
+            del node.attrs['seeAlso']
+            self.assertFalse('seeAlso' in node.attrs)
+        self.assertEqual(['modify'] * 3, [x.kind for x in trace])
+        self.assertEqual(3, len(node.attrs))
 
     def test_keys(self):
         node = self.dir['cn=cn0,o=o']
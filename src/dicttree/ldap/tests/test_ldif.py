@@ -0,0 +1,123 @@
+import unittest
+
+from cStringIO import StringIO
+from ldif import LDIFRecordList
+
+from dicttree.ldap import Directory
+from dicttree.ldap.tests import mixins
+
+
+def parse(data):
+    records = LDIFRecordList(StringIO(data))
+    records.parse()
+    return dict(records.all_records)
+
+
+class TestExport(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('description', ['\xc3\xa4 non-ascii']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_export(self):
+        stream = StringIO()
+        progress = self.dir.export_ldif(stream)
+        records = parse(stream.getvalue())
+        self.assertItemsEqual(['o=o'] + list(self.ENTRIES), records)
+        self.assertEqual(['\xc3\xa4 non-ascii'],
+                         records['cn=cn1,o=o']['description'])
+        self.assertEqual(3, progress.entries)
+        self.assertEqual(len(stream.getvalue()), progress.bytes)
+
+    def test_base_attrlist(self):
+        stream = StringIO()
+        self.dir.export_ldif(stream, base='cn=cn0,o=o', attrlist=['cn'])
+        self.assertEqual({'cn=cn0,o=o': {'cn': ['cn0']}},
+                         parse(stream.getvalue()))
+
+    def test_paged_progress(self):
+        directory = Directory(uri=self.uri, base_dn='o=o',
+                              bind_dn='cn=root,o=o', pw='secret',
+                              page_size=1, backend=self.dir._backend)
+        self.addCleanup(directory.close)
+        reports = []
+        stream = StringIO()
+        directory.export_ldif(stream, every=2, progress=lambda progress:
+                              reports.append(progress.entries))
+        self.assertEqual([2, 3], reports)
+        self.assertEqual(3, len(parse(stream.getvalue())))
+
+
+LDIF = """\
+dn: cn=sub,cn=new,o=o
+cn: sub
+objectClass: organizationalRole
+entryUUID: 5e8a5a4e-2a3f-1036-8a0e-9b1e4c9a5a01
+
+dn: cn=new,o=o
+cn: new
+objectClass: organizationalRole
+
+dn: cn=cn0,o=o
+cn: cn0
+description: imported
+objectClass: organizationalRole
+
+"""
+
+
+class TestImport(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_import(self):
+        progress = self.dir.import_ldif(StringIO(LDIF))
+        self.assertEqual(3, progress.entries)
+        self.assertEqual(len(LDIF), progress.bytes)
+        self.assertEqual(['cn=cn0,o=o'], progress.errors.keys())
+        self.assertEqual(['sub'], self.dir['cn=sub,cn=new,o=o'].attrs['cn'])
+        self.assertFalse('description' in self.dir['cn=cn0,o=o'].attrs)
+
+    def test_parents_first(self):
+        # the child is held back until its parent was sent
+        progress = self.dir.import_ldif(StringIO(LDIF), buffer=1,
+                                        exists='skip')
+        self.assertEqual({}, progress.errors)
+        self.assertTrue('cn=sub,cn=new,o=o' in self.dir)
+
+    def test_skip(self):
+        progress = self.dir.import_ldif(StringIO(LDIF), exists='skip')
+        self.assertEqual({}, progress.errors)
+        self.assertEqual(1, progress.skipped)
+        self.assertFalse('description' in self.dir['cn=cn0,o=o'].attrs)
+
+    def test_replace(self):
+        progress = self.dir.import_ldif(StringIO(LDIF), exists='replace')
+        self.assertEqual({}, progress.errors)
+        self.assertEqual(['imported'],
+                         self.dir['cn=cn0,o=o'].attrs['description'])
+
+    def test_modify(self):
+        self.dir['cn=cn0,o=o'].attrs['telephoneNumber'] = '1'
+        progress = self.dir.import_ldif(StringIO(LDIF), exists='modify')
+        self.assertEqual({}, progress.errors)
+        attrs = self.dir['cn=cn0,o=o'].attrs
+        self.assertEqual(['imported'], attrs['description'])
+        self.assertFalse('telephoneNumber' in attrs)
+
+    def test_roundtrip(self):
+        stream = StringIO()
+        self.dir.export_ldif(stream, base='cn=cn0,o=o')
+        del self.dir['cn=cn0,o=o']
+        stream.seek(0)
+        self.assertEqual({}, self.dir.import_ldif(stream).errors)
+        self.assertEqual(['cn0'], self.dir['cn=cn0,o=o'].attrs['cn'])
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, self.dir.import_ldif, StringIO(LDIF),
+                          exists='update')
@@ -0,0 +1,295 @@
+import ldap
+import unittest
+
+from ldap import SCOPE_BASE
+from ldap import SCOPE_ONELEVEL
+from ldap import SCOPE_SUBTREE
+
+from dicttree.ldap import Directory
+from dicttree.ldap import MemoryConnection
+from dicttree.ldap._memory import Store
+from dicttree.ldap._memory import _match
+from dicttree.ldap._memory import drop
+from dicttree.ldap._memory import parse_filter
+from dicttree.ldap._node import Node
+from dicttree.ldap.tests import test_children
+from dicttree.ldap.tests import test_filter
+from dicttree.ldap.tests import test_ldap
+from dicttree.ldap.tests import test_ldif
+from dicttree.ldap.tests import test_parallel
+from dicttree.ldap.tests import test_views_integration
+
+ATTRS = {'cn': ('Foo', 'bar'), 'objectClass': ('person',),
+         'telephoneNumber': ('42',)}
+
+
+class TestFilter(unittest.TestCase):
+    def assertMatches(self, filterstr, attrs=ATTRS):
+        self.assertTrue(_match(parse_filter(filterstr), attrs), filterstr)
+
+    def assertNotMatches(self, filterstr, attrs=ATTRS):
+        self.assertFalse(_match(parse_filter(filterstr), attrs), filterstr)
+
+    def test_parse(self):
+        self.assertEqual(('=', 'cn', 'foo'), parse_filter('cn=Foo'))
+        self.assertEqual(('&', [('=*', 'cn'), ('!', ('=', 'sn', 'a)'))]),
+                         parse_filter('(&(cn=*)(!(sn=a\\29)))'))
+        self.assertEqual(('*', 'cn', ['f', 'o', '']),
+                         parse_filter('(cn=f*o*)'))
+        self.assertEqual(('>=', 'cn', 'b'), parse_filter('(cn>=b)'))
+
+    def test_invalid(self):
+        for filterstr in ('(cn=foo', '(&(cn=foo)', '(=foo)', 'cn',
+                          '(cn:dn:=foo)', '(cn=foo))'):
+            self.assertRaises(ldap.FILTER_ERROR, parse_filter, filterstr)
+
+    def test_match(self):
+        self.assertMatches('(cn=foo)')
+        self.assertMatches('(CN=BAR)')
+        self.assertNotMatches('(cn=baz)')
+        self.assertMatches('(objectClass=*)', {})
+        self.assertNotMatches('(sn=*)')
+        self.assertMatches('(&(cn=foo)(objectClass=person))')
+        self.assertNotMatches('(&(cn=foo)(objectClass=device))')
+        self.assertMatches('(|(cn=baz)(cn=bar))')
+        self.assertMatches('(!(cn=baz))')
+
+    def test_substrings(self):
+        self.assertMatches('(cn=f*)')
+        self.assertMatches('(cn=*o)')
+        self.assertMatches('(cn=*a*)')
+        self.assertMatches('(cn=b*a*r)')
+        self.assertNotMatches('(cn=fo*oo)')
+        self.assertNotMatches('(cn=*x*)')
+
+    def test_ordering(self):
+        self.assertMatches('(telephoneNumber>=9)')
+        self.assertNotMatches('(telephoneNumber<=9)')
+        self.assertMatches('(cn<=c)')
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.store = Store(index=('objectClass', 'cn'))
+        self.store.add('o=o', {'o': 'o', 'objectClass': 'organization'})
+        self.store.add('ou=a,o=o', {'ou': 'a',
+                                    'objectClass': 'organizationalUnit'})
+        self.store.add('cn=x,ou=a,o=o', {'cn': 'x', 'objectClass': 'device'})
+        self.store.add('cn=y,o=o', {'cn': 'y', 'objectClass': 'device'})
+
+    def candidates(self, base, scope, filterstr):
+        return self.store.candidates(base, scope, parse_filter(filterstr))
+
+    def test_add(self):
+        self.assertEqual(4, len(self.store))
+        self.assertRaises(ldap.ALREADY_EXISTS, self.store.add, 'CN=Y,o=o',
+                          {'cn': 'y'})
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.store.add,
+                          'cn=z,ou=missing,o=o', {'cn': 'z'})
+        # a tree of its own
+        self.store.add('dc=com', {'dc': 'com'})
+        self.assertEqual(['dc=com'], self.candidates('dc=com', SCOPE_SUBTREE,
+                                                     '(objectClass=*)'))
+
+    def test_suffixes(self):
+        store = Store(suffixes=('o=o',))
+        store.add('o=o', {'o': 'o'})
+        self.assertRaises(ldap.NO_SUCH_OBJECT, store.add, 'dc=com',
+                          {'dc': 'com'})
+
+    def test_scopes(self):
+        self.assertEqual(['o=o'], self.candidates('o=o', SCOPE_BASE,
+                                                  '(cn=x)'))
+        self.assertEqual(['ou=a,o=o', 'cn=y,o=o'],
+                         self.candidates('o=o', SCOPE_ONELEVEL,
+                                         '(objectClass=*)'))
+        self.assertEqual(['o=o', 'ou=a,o=o', 'cn=x,ou=a,o=o', 'cn=y,o=o'],
+                         self.candidates('o=o', SCOPE_SUBTREE,
+                                         '(objectClass=*)'))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.candidates, 'o=missing',
+                          SCOPE_BASE, '(objectClass=*)')
+
+    def test_index(self):
+        self.assertEqual(['cn=x,ou=a,o=o'],
+                         self.candidates('o=o', SCOPE_SUBTREE, '(cn=X)'))
+        self.assertEqual([], self.candidates('ou=a,o=o', SCOPE_SUBTREE,
+                                             '(cn=y)'))
+        self.assertEqual(['cn=y,o=o'],
+                         self.candidates('o=o', SCOPE_ONELEVEL,
+                                         '(&(objectClass=device)(sn=*))'))
+        self.assertItemsEqual(['cn=x,ou=a,o=o', 'cn=y,o=o'],
+                              self.candidates('o=o', SCOPE_SUBTREE,
+                                              '(|(cn=x)(cn=y))'))
+
+    def test_index_order(self):
+        for i in range(10):
+            self.store.add('cn=d%d,o=o' % i, {'cn': 'd%d' % i,
+                                              'objectClass': 'device'})
+        for scope in (SCOPE_ONELEVEL, SCOPE_SUBTREE):
+            self.assertEqual(
+                [x for x in self.candidates('o=o', scope, '(sn=*)')
+                 if x != 'o=o' and x != 'ou=a,o=o'],
+                self.candidates('o=o', scope, '(objectClass=device)'))
+
+    def test_index_order_parent_added_later(self):
+        store = Store(index=('cn',))
+        store.add('cn=x,ou=a,o=o', {'cn': 'x'})
+        store.add('cn=y,o=o', {'cn': 'y'})
+        store.add('o=o', {'o': 'o'})
+        store.add('ou=a,o=o', {'ou': 'a'})
+        self.assertEqual(['cn=y,o=o', 'cn=x,ou=a,o=o'],
+                         store.candidates('o=o', SCOPE_SUBTREE, parse_filter(
+                    '(|(cn=x)(cn=y))')))
+
+    def test_modify(self):
+        self.store.modify('cn=y,o=o', [(ldap.MOD_REPLACE, 'cn', 'z'),
+                                       (ldap.MOD_ADD, 'description', 'd')])
+        self.assertEqual({'cn': ('z',), 'description': ('d',),
+                          'objectClass': ('device',)},
+                         self.store.get('cn=y,o=o')[1])
+        self.assertEqual([], self.candidates('o=o', SCOPE_SUBTREE, '(cn=y)'))
+        self.assertEqual(['cn=y,o=o'],
+                         self.candidates('o=o', SCOPE_SUBTREE, '(cn=z)'))
+        self.assertRaises(ldap.TYPE_OR_VALUE_EXISTS, self.store.modify,
+                          'cn=y,o=o', [(ldap.MOD_ADD, 'cn', 'z')])
+        self.assertRaises(ldap.NO_SUCH_ATTRIBUTE, self.store.modify,
+                          'cn=y,o=o', [(ldap.MOD_DELETE, 'sn', None)])
+        self.store.modify('cn=y,o=o', [(ldap.MOD_DELETE, 'description',
+                                        None)])
+        self.assertFalse('description' in self.store.get('cn=y,o=o')[1])
+
+    def test_delete(self):
+        self.assertRaises(ldap.NOT_ALLOWED_ON_NONLEAF, self.store.delete,
+                          'ou=a,o=o')
+        self.store.delete('ou=a,o=o', tree=True)
+        self.assertEqual(2, len(self.store))
+        self.assertEqual([], self.candidates('o=o', SCOPE_SUBTREE, '(cn=x)'))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.store.delete, 'ou=a,o=o')
+
+
+class TestMemoryConnection(unittest.TestCase):
+    def setUp(self):
+        self.conn = MemoryConnection('memory://test')
+        self.conn.add_s('o=o', (('o', 'o'), ('objectClass', 'organization')))
+        for i in range(3):
+            self.conn.add_s('cn=cn%d,o=o' % i, (('cn', 'cn%d' % i),
+                                                 ('objectClass', 'device')))
+
+    def tearDown(self):
+        drop('memory://test')
+
+    def test_shared_store(self):
+        self.assertTrue(MemoryConnection('memory://test').store is
+                        self.conn.store)
+        self.assertFalse(MemoryConnection('memory://other').store is
+                         self.conn.store)
+        drop('memory://other')
+
+    def test_attrlist(self):
+        self.assertEqual([('o=o', {})],
+                         self.conn.search_s('o=o', SCOPE_BASE,
+                                            attrlist=['']))
+        self.assertEqual([('o=o', {'o': ['o']})],
+                         self.conn.search_s('o=o', SCOPE_BASE,
+                                            attrlist=['O']))
+        self.assertEqual([('o=o', {'hasSubordinates': ['TRUE'],
+                                   'numSubordinates': ['3']})],
+                         self.conn.search_s('o=o', SCOPE_BASE, attrlist=[
+                    'hasSubordinates', 'numSubordinates']))
+        self.conn.add_s('cn=sub,cn=cn0,o=o', (('cn', 'sub'),))
+        self.assertEqual([('o=o', {'numSubordinates': ['3'],
+                                   'numAllSubordinates': ['4']})],
+                         self.conn.search_s('o=o', SCOPE_BASE, attrlist=[
+                    'numSubordinates', 'numAllSubordinates']))
+        self.assertEqual([('o=o', {'o': [], 'objectClass': []})],
+                         self.conn.search_s('o=o', SCOPE_BASE, attrsonly=1))
+
+    def test_async_search(self):
+        msgid = self.conn.search('o=o', SCOPE_ONELEVEL)
+        rtype, data = self.conn.result(msgid, all=0)
+        self.assertEqual(ldap.RES_SEARCH_ENTRY, rtype)
+        self.assertEqual('cn=cn0,o=o', data[0][0])
+        rtype, data = self.conn.result(msgid)
+        self.assertEqual(ldap.RES_SEARCH_RESULT, rtype)
+        self.assertEqual(['cn=cn1,o=o', 'cn=cn2,o=o'], [x[0] for x in data])
+        msgid = self.conn.search('o=missing', SCOPE_BASE)
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.result, msgid)
+
+    def test_sizelimit(self):
+        self.assertRaises(ldap.SIZELIMIT_EXCEEDED, self.conn.search_ext_s,
+                          'o=o', SCOPE_SUBTREE, sizelimit=2)
+        msgid = self.conn.search_ext('o=o', SCOPE_SUBTREE, sizelimit=2)
+        self.conn.result(msgid, all=0)
+        self.conn.result(msgid, all=0)
+        self.assertRaises(ldap.SIZELIMIT_EXCEEDED, self.conn.result, msgid,
+                          all=0)
+
+    def test_async_writes(self):
+        msgids = [self.conn.add('cn=new,o=o', (('cn', 'new'),)),
+                  self.conn.add('cn=new,o=o', (('cn', 'new'),))]
+        self.assertEqual(ldap.RES_ADD, self.conn.result(msgids[0])[0])
+        self.assertRaises(ldap.ALREADY_EXISTS, self.conn.result, msgids[1])
+        self.assertEqual((None, None), self.conn.result(timeout=0))
+
+
+class NoSchema(object):
+    def test_setitem_reclassify_nonleaf(self):
+        # without schema the object class is modified in place
+        dn = 'cn=cn0,o=o'
+        self.ldap.add_s('cn=sub,' + dn, (('cn', ['sub']),
+                                         ('objectClass', ['organizationalRole'])))
+        self.dir[dn] = Node(name=dn, attrs={'objectClass': ['device'],
+                                            'cn': ['cn0']})
+        self.assertEqual(['device'], self.dir[dn].attrs['objectClass'])
+        self.assertTrue('cn=sub,' + dn in self.dir)
+
+class TestMemoryDirectory(NoSchema, test_ldap.TestLDAPDirectory):
+    MEMORY = True
+
+    def test_len_count_attr_served(self):
+        self.ldap.add_s('cn=sub,cn=cn0,o=o', (('cn', ['sub']),))
+        self.dir.count_attr = 'numAllSubordinates'
+        with self.dir.trace() as trace:
+            self.assertEqual(len(self.ENTRIES) + 1, len(self.dir))
+        self.assertEqual(['search'], [x.kind for x in trace])
+        self.assertEqual('o=o', trace[0].dn)
+
+class TestPagedMemoryDirectory(NoSchema, test_ldap.TestPagedLDAPDirectory):
+    MEMORY = True
+
+class TestMemoryChildren(test_children.TestChildren):
+    MEMORY = True
+
+class TestMemoryQuery(test_filter.TestQuery):
+    MEMORY = True
+
+class TestMemoryExport(test_ldif.TestExport):
+    MEMORY = True
+
+class TestMemoryImport(test_ldif.TestImport):
+    MEMORY = True
+
+class TestMemoryKeysView(test_views_integration.TestKeysView):
+    MEMORY = True
+
+class TestMemoryItemsView(test_views_integration.TestItemsView):
+    MEMORY = True
+
+class TestMemorySnapshotViews(test_views_integration.TestSnapshotViews):
+    MEMORY = True
+
+class TestMemoryParallelScan(test_parallel.TestParallelScan):
+    # the workers are forked, with a copy of the store
+    MEMORY = True
+
+class TestPooledMemoryDirectory(unittest.TestCase):
+    def test_pool(self):
+        directory = Directory(uri='memory://pool', base_dn='o=o',
+                              bind_dn='cn=root,o=o', pw='secret',
+                              pool=dict(maxsize=2), backend=MemoryConnection)
+        try:
+            directory._ldap.add_s('o=o', (('o', 'o'),))
+            self.assertTrue('o=o' in directory)
+            self.assertEqual(0, len(directory))
+        finally:
+            drop('memory://pool')
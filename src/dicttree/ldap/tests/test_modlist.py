@@ -0,0 +1,46 @@
+import ldap
+import unittest
+
+from dicttree.ldap._modlist import diff
+from dicttree.ldap._modlist import reclassifies
+
+
+class TestDiff(unittest.TestCase):
+    OLD = {'cn': ['a'], 'description': ['x', 'y'],
+           'objectClass': ['organizationalRole']}
+
+    def test_unchanged(self):
+        self.assertEqual([], diff(self.OLD, {
+                    'CN': 'a', 'description': ['y', 'x'],
+                    'objectClass': ['organizationalRole']}))
+
+    def test_changes(self):
+        modlist = diff(self.OLD, {'cn': ['a'], 'description': ['x'],
+                                  'telephoneNumber': '1',
+                                  'objectClass': ['organizationalRole']})
+        self.assertItemsEqual([(ldap.MOD_REPLACE, 'description', ['x']),
+                               (ldap.MOD_ADD, 'telephoneNumber', ['1'])],
+                              modlist)
+        self.assertEqual([(ldap.MOD_DELETE, 'description', None)],
+                         diff(self.OLD, {'cn': ['a'], 'description': [],
+                                         'objectClass': 'organizationalRole'}))
+        self.assertEqual([(ldap.MOD_DELETE, 'description', None)],
+                         diff(self.OLD, {'cn': ['a'],
+                                         'objectClass': 'organizationalRole'}))
+
+    def test_structural(self):
+        old = dict(self.OLD, structuralObjectClass=['organizationalRole'])
+        self.assertEqual(None, diff(old, {'cn': ['a'],
+                                          'objectClass': 'applicationProcess'}))
+        self.assertEqual([(ldap.MOD_REPLACE, 'objectClass',
+                           ['organizationalRole', 'simpleSecurityObject'])],
+                         diff(old, {'cn': ['a'], 'description': ['x', 'y'],
+                                    'objectClass': ['organizationalRole',
+                                                    'simpleSecurityObject']}))
+
+    def test_reclassifies(self):
+        self.assertTrue(reclassifies(diff(self.OLD, {
+                        'cn': ['a'], 'description': ['x', 'y'],
+                        'objectClass': ['applicationProcess']})))
+        self.assertFalse(reclassifies(diff(self.OLD, {
+                        'cn': ['b'], 'objectClass': ['organizationalRole']})))
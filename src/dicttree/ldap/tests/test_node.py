@@ -66,3 +66,16 @@ class TestNode(TestCase):
         attrlist = (('a', ['1']), ('b', ['2']))
         node = Node(attrs=attrlist)
         self.assertEquals(attrlist, tuple(node.attrs.items()))
+
+    def test_compact(self):
+        node1 = Node(name='a', attrs=(('cn', 'a'), ('objectClass', ['x'])))
+        node2 = Node(name='b', attrs=((''.join(['c', 'n']), ['b']),))
+        self.assertFalse(hasattr(node1, '__dict__'))
+        self.assertFalse(hasattr(node1.attrs, '__dict__'))
+        name1 = [x for x in node1.attrs if x == 'cn'][0]
+        name2 = [x for x in node2.attrs if x == 'cn'][0]
+        self.assertTrue(name1 is name2)
+        self.assertEqual(('a',), node1.attrs.attrs['cn'])
+        self.assertEqual(['a'], node1.attrs['cn'])
+        self.assertEqual({'cn': ['a'], 'objectClass': ['x']},
+                         node1.attrs.copy())
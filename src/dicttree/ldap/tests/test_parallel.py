@@ -0,0 +1,90 @@
+import multiprocessing
+import unittest
+
+from ldap import SCOPE_BASE
+from ldap import SCOPE_SUBTREE
+
+from dicttree.ldap import Directory
+from dicttree.ldap._parallel import _partitions
+from dicttree.ldap._parallel import scan
+from dicttree.ldap.tests import mixins
+
+
+def cn(dn, attrs):
+    return attrs['cn'][0]
+
+
+class MainOnly(Directory):
+    """stands in for a Replica, not to be set up in the workers
+    """
+    def __init__(self, *args, **kw):
+        if multiprocessing.current_process().name != 'MainProcess':
+            raise RuntimeError('set up in a worker')
+        Directory.__init__(self, *args, **kw)
+
+
+class TestParallelScan(mixins.Slapd, unittest.TestCase):
+    ENTRIES = dict(
+        ('cn=cn%d,o=o' % i, (('cn', ['cn%d' % i]),
+                             ('objectClass', ['organizationalRole'])))
+        for i in range(4))
+    SUBENTRIES = dict(
+        ('cn=sub%d,cn=cn%d,o=o' % (j, i), (
+                    ('cn', ['sub%d' % j]),
+                    ('objectClass', ['organizationalRole'])))
+        for i in range(4) for j in range(3))
+
+    def _setUp(self):
+        super(TestParallelScan, self)._setUp()
+        for dn, attrs in self.SUBENTRIES.items():
+            self.ldap.add_s(dn, attrs)
+
+    def test_scan(self):
+        nodes = list(self.dir.scan(processes=2))
+        self.assertItemsEqual(self.ENTRIES.keys() + self.SUBENTRIES.keys(),
+                              [node.name for node in nodes])
+        node = dict((node.name, node) for node in nodes)['cn=cn1,o=o']
+        self.assertEqual(['cn1'], node.attrs['cn'])
+
+    def test_ordered(self):
+        dns = [node.name for node in self.dir.scan(ordered=True)]
+        children = [dn for dn in dns if dn.count(',') == 1]
+        # a child is followed by its subtree
+        for child, next_child in zip(children, children[1:]):
+            subtree = dns[dns.index(child):dns.index(next_child)]
+            self.assertEqual(4, len(subtree))
+            self.assertTrue(all(dn.endswith(child) for dn in subtree))
+
+    def test_func(self):
+        self.assertItemsEqual(
+            ['sub0'] * 4, scan(self.dir, filterstr='(cn=sub0)', func=cn))
+
+    def test_partitions(self):
+        self.assertEqual([[('cn=cn%d,o=o' % i, SCOPE_SUBTREE)]
+                          for i in range(4)],
+                         sorted(_partitions(self.dir, 4)))
+        # fewer children than wanted, their subtrees are split
+        partitions = _partitions(self.dir, 8)
+        self.assertEqual(8, len(partitions))
+        parts = sum(partitions, [])
+        self.assertItemsEqual(
+            [(dn, SCOPE_BASE) for dn in self.ENTRIES] +
+            [(dn, SCOPE_SUBTREE) for dn in self.SUBENTRIES], parts)
+        # a child is followed by its subtree
+        self.assertTrue(all(parts[i + 1][0].endswith(dn)
+                            for i, (dn, scope) in enumerate(parts)
+                            if scope == SCOPE_BASE))
+
+    def test_chunks(self):
+        dns = [dn for dn, attrs in scan(self.dir, processes=2, chunksize=1,
+                                        ordered=True)]
+        self.assertItemsEqual(self.ENTRIES.keys() + self.SUBENTRIES.keys(),
+                              dns)
+        for dn in self.SUBENTRIES:
+            self.assertTrue(dns.index(dn) > dns.index(dn.split(',', 1)[1]))
+
+    def test_subclass(self):
+        directory = MainOnly(self.uri, 'o=o', 'cn=root,o=o', 'secret',
+                             backend=self.dir._backend)
+        self.addCleanup(directory.close)
+        self.assertEqual(16, len(list(directory.scan(processes=2))))
@@ -0,0 +1,91 @@
+import threading
+import unittest
+
+from dicttree.ldap import Directory
+from dicttree.ldap._pool import ConnectionPool
+from dicttree.ldap._pool import PoolTimeout
+from dicttree.ldap.tests import mixins
+
+
+class TestConnectionPool(mixins.Slapd, unittest.TestCase):
+    def test_checkout(self):
+        pool = ConnectionPool(self.uri, 'cn=root,o=o', 'secret',
+                              minsize=1, maxsize=2, timeout=0.1)
+        with pool.connection() as conn1:
+            with pool.connection() as conn2:
+                # nested blocks of a thread share the connection
+                self.assertTrue(conn1 is conn2)
+            conn2 = pool.acquire()
+            self.assertFalse(conn1 is conn2)
+            self.assertRaises(PoolTimeout, pool.acquire)
+            pool.release(conn2)
+        with pool.connection() as conn3:
+            self.assertTrue(conn3 is conn1 or conn3 is conn2)
+        self.assertEqual('dn:cn=root,o=o', pool.whoami_s())
+        pool.close()
+
+
+class TestPooledDirectory(mixins.Slapd, unittest.TestCase):
+    ENTRIES = dict(
+        ('cn=cn%d,o=o' % i, (('cn', ['cn%d' % i]),
+                             ('objectClass', ['organizationalRole'])))
+        for i in range(10))
+
+    def _setUp(self):
+        super(TestPooledDirectory, self)._setUp()
+        self.dir.close()
+        self.dir = Directory(uri=self.uri,
+                             base_dn='o=o',
+                             bind_dn='cn=root,o=o',
+                             pw='secret',
+                             pool=dict(maxsize=3))
+
+    def test_threads(self):
+        results = []
+        def read():
+            keys = sorted(self.dir)
+            nodes = [self.dir[dn] for dn in keys]
+            results.append([node.attrs['cn'] for node in nodes])
+        threads = [threading.Thread(target=read) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = [self.ENTRIES[dn][0][1] for dn in sorted(self.ENTRIES)]
+        self.assertEqual([expected] * 6, results)
+
+    def test_iteration_and_writes(self):
+        # iterating keeps a connection, writes within use it as well
+        for dn in self.dir:
+            self.dir[dn].attrs['description'] = 'abc'
+        self.assertEqual(['abc'], self.dir['cn=cn3,o=o'].attrs['description'])
+        self.dir.clear()
+        self.assertEqual(0, len(self.dir))
+
+    def test_threads_iterating(self):
+        # each thread holds a connection while reading nodes, none is
+        # left to borrow
+        cond = threading.Condition()
+        iterating = []
+        results = []
+        def read():
+            count = 0
+            for node in self.dir.values():
+                with cond:
+                    if not count:
+                        iterating.append(node)
+                        cond.notify_all()
+                    while len(iterating) < 3:
+                        cond.wait(1)
+                count += len(node.attrs['cn'])
+                self.dir[node.name].attrs['description'] = 'abc'
+            results.append(count)
+        threads = [threading.Thread(target=read) for i in range(3)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual([10] * 3, results)
+        self.assertEqual(['abc'], self.dir['cn=cn3,o=o'].attrs['description'])
@@ -0,0 +1,93 @@
+import ldap
+import time
+import unittest
+
+from dicttree.ldap._node import Node
+from dicttree.ldap.tests import mixins
+
+try:
+    from dicttree.ldap._replica import Replica
+except ImportError:
+    Replica = None
+
+
+@unittest.skipIf(Replica is None, 'needs ldap.syncrepl')
+class TestReplica(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+    MODE = 'refreshAndPersist'
+    # syncprov keeps state in memory, snapshots of the data do not cover
+    SHARED = False
+
+    def _setUp(self):
+        super(TestReplica, self)._setUp()
+        self.replica = Replica(uri=self.uri,
+                               base_dn='o=o',
+                               bind_dn='cn=root,o=o',
+                               pw='secret',
+                               mode=self.MODE,
+                               interval=0.1,
+                               timeout=10)
+
+    def tearDown(self):
+        if getattr(self, 'replica', None) is not None:
+            self.replica.close()
+        super(TestReplica, self).tearDown()
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                self.fail('replica did not catch up')
+            time.sleep(0.05)
+
+    def test_failing_session(self):
+        self.assertRaises(ldap.INVALID_CREDENTIALS, Replica, uri=self.uri,
+                          base_dn='o=o', bind_dn='cn=root,o=o', pw='wrong',
+                          mode=self.MODE, timeout=10)
+
+    def test_initial(self):
+        self.assertItemsEqual(self.ENTRIES, self.replica)
+        self.assertEqual(2, len(self.replica))
+        self.assertTrue('CN=cn0, o=o' in self.replica)
+        self.assertEqual(['cn1'], self.replica['cn=cn1,o=o'].attrs['cn'])
+        self.assertRaises(KeyError, self.replica.__getitem__, 'cn=x,o=o')
+        self.assertEqual(self.dir.keys(), self.replica.keys())
+
+    def test_changes_by_others(self):
+        generation = self.replica.generation
+        self.ldap.add_s('cn=cn2,o=o', (('cn', ['cn2']),
+                                       ('objectClass',
+                                        ['organizationalRole'])))
+        self.ldap.modify_s('cn=cn0,o=o', [(0, 'description', 'abc')])
+        self.ldap.delete_s('cn=cn1,o=o')
+        self.wait_for(lambda: 'cn=cn1,o=o' not in self.replica and
+                      'cn=cn2,o=o' in self.replica and
+                      'description' in self.replica['cn=cn0,o=o'].attrs)
+        self.assertTrue(self.replica.generation > generation)
+
+    def test_own_writes(self):
+        dn = 'cn=cn2,o=o'
+        self.replica[dn] = Node(name=dn, attrs=(
+                ('cn', ['cn2']), ('objectClass', ['organizationalRole'])))
+        self.assertTrue(dn in self.replica)
+        del self.replica['cn=cn0,o=o']
+        self.assertFalse('cn=cn0,o=o' in self.replica)
+        self.replica.clear()
+        self.assertEqual(0, len(self.replica))
+
+    def test_popitem(self):
+        dn = 'cn=cn2,cn=cn0,o=o'
+        self.replica[dn] = Node(name=dn, attrs=(
+                ('cn', ['cn2']), ('objectClass', ['organizationalRole'])))
+        del self.replica['cn=cn1,o=o']
+        self.assertEqual(dn, self.replica.popitem()[0])
+        self.assertItemsEqual(['cn=cn0,o=o'], self.replica)
+
+
+class TestRefreshOnlyReplica(TestReplica):
+    MODE = 'refreshOnly'
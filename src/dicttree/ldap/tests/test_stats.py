@@ -0,0 +1,96 @@
+import ldap
+import unittest
+
+from dicttree.ldap import Directory
+from dicttree.ldap._node import Node
+from dicttree.ldap._stats import Histogram
+from dicttree.ldap._stats import Operation
+from dicttree.ldap._stats import Stats
+from dicttree.ldap.tests import mixins
+
+
+class TestStats(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram()
+        for seconds in (0.00005, 0.002, 0.002, 3):
+            histogram.add(seconds)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(0.005, histogram.percentile(50))
+        self.assertEqual(5, histogram.percentile(99))
+        self.assertEqual(None, Histogram().percentile(50))
+
+    def test_record(self):
+        stats = Stats()
+        seen = []
+        stats.hooks.append(seen.append)
+        op = Operation('search', 'search_s', 'o=o', 0.001, 2, 10, None)
+        with stats.trace() as trace:
+            stats.record(op)
+        stats.record(op._replace(kind='add', entries=0, bytes=0,
+                                 error=ldap.ALREADY_EXISTS()))
+        self.assertEqual([op], trace)
+        self.assertEqual(2, len(seen))
+        summary = stats.summary()
+        self.assertEqual(dict(search=1, add=1), summary['operations'])
+        self.assertEqual((2, 10, 1), (summary['entries'], summary['bytes'],
+                                      summary['errors']))
+        stats.reset()
+        self.assertEqual({}, stats.summary()['operations'])
+
+    def test_failing_hook(self):
+        stats = Stats()
+        seen = []
+        def fail(op):
+            raise ValueError(op)
+        stats.hooks.extend([fail, seen.append])
+        op = Operation('search', 'search_s', 'o=o', 0.001, 2, 10, None)
+        with stats.trace() as trace:
+            stats.record(op)
+        self.assertEqual([op], seen)
+        self.assertEqual(1, stats.summary()['operations']['search'])
+        self.assertEqual(1, trace.count_kind())
+        self.assertEqual(0, trace.count_kind('add'))
+
+
+class TestInstrumentedDirectory(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_trace(self):
+        with self.dir.trace() as trace:
+            node = self.dir['cn=cn0,o=o']
+            self.assertEqual(['cn0'], node.attrs['cn'])
+        self.assertEqual(['search'], [x.kind for x in trace])
+        self.assertEqual('cn=cn0,o=o', trace[0].dn)
+        self.assertEqual(1, trace[0].entries)
+
+        with self.dir.trace() as trace:
+            self.dir['cn=cn0,o=o'] = Node(attrs=dict(
+                    self.ENTRIES['cn=cn0,o=o'], description='x'))
+        self.assertEqual(['add', 'search', 'modify'],
+                         [x.kind for x in trace])
+        self.assertEqual(1, trace.count_kind('modify'))
+
+    def test_errors_and_nesting(self):
+        with self.dir.trace() as outer:
+            with self.dir.trace() as inner:
+                self.assertFalse('cn=fail,o=o' in self.dir)
+            list(self.dir.keys())
+        self.assertEqual(1, len(inner))
+        self.assertTrue(isinstance(inner[0].error, ldap.NO_SUCH_OBJECT))
+        self.assertTrue(len(outer) > len(inner))
+        self.assertTrue(self.dir.stats.errors >= 1)
+
+    def test_pool(self):
+        directory = Directory(uri=self.uri, base_dn='o=o',
+                              bind_dn='cn=root,o=o', pw='secret',
+                              pool=dict(minsize=1, maxsize=2))
+        self.addCleanup(directory.close)
+        with directory.trace() as trace:
+            self.assertEqual(2, len(directory))
+        self.assertTrue(trace.count_kind('search') >= 1)
+        self.assertEqual(3, directory.stats.entries)
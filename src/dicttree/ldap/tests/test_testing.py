@@ -0,0 +1,45 @@
+import unittest
+
+from dicttree.ldap import testing
+from dicttree.ldap.tests import mixins
+
+NEW = ('cn=new,o=o', (('cn', ['new']),
+                      ('objectClass', ['organizationalRole'])))
+
+
+class TestSharedSlapd(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_shared(self):
+        self.assertTrue(self.server is testing.shared())
+        self.assertEqual(self.server.uri, self.uri)
+
+    def test_restore(self):
+        self.ldap.add_s(*NEW)
+        self.server.restore(self.snapshot)
+        self.assertItemsEqual(['cn=cn0,o=o'], self.dir)
+        self.server.restore('base')
+        self.assertItemsEqual([], self.dir)
+        self.assertTrue('o=o' in self.dir)
+
+    def test_snapshot(self):
+        self.ldap.add_s(*NEW)
+        self.server.snapshot('test_snapshot')
+        del self.dir['cn=cn0,o=o']
+        self.server.restore('test_snapshot')
+        self.assertItemsEqual(['cn=cn0,o=o', 'cn=new,o=o'], self.dir)
+
+
+class TestPrivateSlapd(mixins.Slapd, unittest.TestCase):
+    SHARED = False
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_private(self):
+        self.assertFalse(self.server is testing.shared())
+        self.assertItemsEqual(['cn=cn0,o=o'], self.dir)
@@ -15,6 +15,14 @@ class TestCase(unittest.TestCase):
 class MockDirectory(dict):
     pass
 
+class NoScanDirectory(MockDirectory):
+    """Fails on any attempt to iterate over it
+    """
+    def __iter__(self):
+        raise AssertionError('scanned')
+
+    iteritems = itervalues = __iter__
+
 class TestKeysView(TestCase):
 
     def setUp(self):
@@ -44,6 +52,12 @@ class TestKeysView(TestCase):
         self.assertTrue('a' in self.keys)
         self.assertFalse('a' in self.keysSimilar)
 
+    def test_contains_no_scan(self):
+        keys = KeysView(dictionary=NoScanDirectory(a=1))
+        self.assertTrue('a' in keys)
+        self.assertFalse('b' in keys)
+        self.assertEqual(1, len(keys))
+
     def test_and(self):
         self.assertEqual(set(['a', 'b']), self.keys & self.keysEqual)
         self.assertEqual(set(['b']), self.keys & self.keysSimilar)
@@ -67,6 +81,11 @@ class TestKeysView(TestCase):
         self.assertEqual(set(['a', 'b']),
                          self.keys - self.keysDifferent)
 
+    def test_equal_other_iterables(self):
+        self.assertTrue(self.keys == ['b', 'a'])
+        self.assertFalse(self.keys == ['a'])
+        self.assertFalse(self.keys == 1)
+
     def test_isdisjoint(self):
         self.assertFalse(self.keys.isdisjoint(self.keysEqual))
         self.assertFalse(self.keys.isdisjoint(self.keysSimilar))
@@ -101,6 +120,20 @@ class TestItemsView(TestCase):
     def test_contains(self):
         self.assertTrue(('a',1) in self.items)
         self.assertFalse(('a',1) in self.itemsSimilar)
+        self.assertFalse(('a',2) in self.items)
+        self.assertFalse('a' in self.items)
+
+    def test_contains_no_scan(self):
+        items = ItemsView(dictionary=NoScanDirectory(a=1))
+        self.assertTrue(('a', 1) in items)
+        self.assertFalse(('a', 2) in items)
+        self.assertFalse(('b', 1) in items)
+
+    def test_equal_other_iterables(self):
+        self.assertTrue(self.items == [('b', 2), ('a', 1)])
+        self.assertFalse(self.items == [('a', 1)])
+        self.assertFalse(self.items == ['ab'])
+        self.assertFalse(self.items == 1)
 
     def test_and(self):
         self.assertEqual(set([('a', 1), ('b', 2)]),
@@ -156,9 +156,9 @@ class TestItemsView(mixins.Slapd, unittest.TestCase):
 
     def test_viewequal(self):
         dn = 'cn=cn0,o=o'
-        node = Node(name=dn)
+        node = Node(name=dn, attrs=self.ENTRIES[dn])
         dn1 = 'cn=cn1,o=o'
-        node1 = Node(name=dn1)
+        node1 = Node(name=dn1, attrs=self.ENTRIES[dn1])
         itemsList = [(dn, node), (dn1, node1)]
 
         items = self.dir.items()
@@ -182,7 +182,7 @@ class TestItemsView(mixins.Slapd, unittest.TestCase):
 
     def test_viewcontains(self):
         dn = 'cn=cn0,o=o'
-        node = Node(name=dn)
+        node = Node(name=dn, attrs=self.ENTRIES[dn])
         item = (dn, node)
         fail = 'cn=fail, o=o'
         failNode = Node(name=fail)
@@ -398,7 +398,7 @@ class TestValuessView(mixins.Slapd, unittest.TestCase):
 
     def test_viewcontains(self):
         dn = 'cn=cn0,o=o'
-        node = Node(name=dn)
+        node = Node(name=dn, attrs=self.ENTRIES[dn])
         item = (dn, node)
         fail = 'cn=fail, o=o'
         failNode = Node(name=fail)
@@ -406,3 +406,62 @@ class TestValuessView(mixins.Slapd, unittest.TestCase):
 
         self.assertTrue(node in values)
         self.assertFalse(failNode in values)
+
+
+class TestSnapshotViews(mixins.Slapd, unittest.TestCase):
+    ENTRIES = {
+        'cn=cn0,o=o': (('cn', ['cn0']),
+                       ('objectClass', ['organizationalRole'])),
+        'cn=cn1,o=o': (('cn', ['cn1']),
+                       ('objectClass', ['organizationalRole'])),
+        }
+
+    def test_keys(self):
+        keys = self.dir.keys(snapshot=True)
+        self.assertEqual(None, keys.generation)
+        self.assertEqual(2, len(keys))
+        generation = keys.generation
+        # writes by others are not seen
+        self.ldap.delete_s('cn=cn0,o=o')
+        self.assertTrue('cn=cn0,o=o' in keys)
+        self.assertEqual(set(['cn=cn0,o=o']), keys - ['cn=cn1,o=o'])
+        self.assertEqual(2, len(keys & keys))
+        # until asked for
+        keys.refresh()
+        self.assertEqual(['cn=cn1,o=o'], list(keys))
+        self.assertEqual(generation, keys.generation)
+        # writes via the directory outdate the snapshot
+        self.dir['cn=cn0,o=o'] = Node(name='cn=cn0,o=o',
+                                      attrs=self.ENTRIES['cn=cn0,o=o'])
+        self.assertEqual(2, len(keys))
+        self.assertTrue(keys.generation > generation)
+        self.ldap.delete_s('cn=cn0,o=o')
+        self.dir.invalidate()
+        self.assertFalse('cn=cn0,o=o' in keys)
+
+    def test_node_writes(self):
+        items = self.dir.items(attrlist=['*'], snapshot=True)
+        self.assertEqual(2, len(items))
+        generation = items.generation
+        node = self.dir['cn=cn0,o=o']
+        node.attrs['description'] = 'abc'
+        self.assertTrue(('cn=cn0,o=o', node) in items)
+        self.assertTrue(items.generation > generation)
+        generation = items.generation
+        with node.attrs.edit():
+            del node.attrs['description']
+        self.assertEqual(2, len(items))
+        self.assertTrue(items.generation > generation)
+
+    def test_items_values(self):
+        items = self.dir.items(attrlist=['*'], snapshot=True)
+        values = self.dir.values(attrlist=['*'], snapshot=True)
+        node = self.dir['cn=cn0,o=o']
+        self.assertTrue(('cn=cn0,o=o', node) in items)
+        self.assertEqual(2, len(values))
+        self.ldap.delete_s('cn=cn0,o=o')
+        self.assertTrue(('cn=cn0,o=o', node) in items)
+        self.assertTrue(node in values)
+        del self.dir['cn=cn1,o=o']
+        self.assertEqual([], list(values))
+        self.assertEqual(0, len(items))